@@ -1,10 +1,32 @@
-import spidev
 import time
 import logging
-import RPi.GPIO as GPIO
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+import queue
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+# Hardware backends are optional so the driver can run against emulator.SpiDev
+try:
+    import spidev
+except ImportError:
+    spidev = None
+try:
+    import RPi.GPIO as GPIO
+except (ImportError, RuntimeError):
+    GPIO = None
+
+from calibration_profiles import default_device_id
+from command_table import get_read_frame, get_write_frame
+from descriptors import DESCRIPTORS, RegisterDecoder
+from events import SAMPLE, MeterEvent, decode_interrupts
+from instrumentation import MeterStats, RateLimitedLogger
+from link_tuning import load_tuned_speed
+from registers import EMMIntState0, EMMIntState1, SoftReset
+from spi_batch import read_batch
+from transport import ResetMonitor, ResilientSpiDev
+
+# Hot-path log records are rate-limited per register and skipped entirely when disabled
+_log = RateLimitedLogger()
 
 # Pin Definitions for GPIO
 PINS = {
@@ -12,9 +34,46 @@ PINS = {
     'SDI': 10,  # SPI Data In
     'SDO': 9,   # SPI Data Out
     'CS': 8,    # Chip Select
-    'SCLK': 11  # SPI Clock
+    'SCLK': 11,  # SPI Clock
+    'ZX0': 4,    # Zero-Crossing Output 0
+    'IRQ0': 6,   # Interrupt Request 0
 }
 
+
+
+def setup_reset_pin(pin):
+    """Configure an ATM90E3x reset line as an output, held high (chip running)."""
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setup(pin, GPIO.OUT)
+    GPIO.output(pin, GPIO.HIGH)
+
+
+def pulse_reset(pin):
+    """Hard-reset every ATM90E3x wired to `pin`."""
+    GPIO.output(pin, GPIO.LOW)
+    time.sleep(0.1)  # Hold reset for 100ms
+    GPIO.output(pin, GPIO.HIGH)
+    time.sleep(0.1)  # Allow the device to stabilize
+
+
+# Engineering-unit scales of the measurement registers read below, from the register descriptors
+VOLTAGE_SCALE = DESCRIPTORS['UrmsA'].scale
+CURRENT_SCALE = DESCRIPTORS['IrmsA'].scale
+POWER_SCALE = DESCRIPTORS['SmeanA'].scale
+FREQUENCY_SCALE = DESCRIPTORS['Freq'].scale
+ANGLE_SCALE = DESCRIPTORS['UangleA'].scale
+
+# One full three-phase measurement set, decoded to engineering units
+Snapshot = namedtuple('Snapshot', ['timestamp', 'voltage', 'current', 'power', 'frequency', 'phase_angle'])
+
+
+def _register_frames(registers):
+    """Resolve a name -> address map to prebuilt read frames and write prefixes once."""
+    read_frames = {name: get_read_frame(address) for name, address in registers.items()}
+    write_prefixes = {name: get_write_frame(address, 0)[:2] for name, address in registers.items()}
+    return MappingProxyType(read_frames), MappingProxyType(write_prefixes)
+
+
 class ATM90E3x:
     # Register Addresses (from datasheet)
     REGISTERS = {
@@ -58,20 +117,93 @@ class ATM90E3x:
         'Power_gain_A': 0x54,
         'Power_gain_B': 0x55,
         'Power_gain_C': 0x56,
+        'VoltageA_LSB': 0xE9,
+        'VoltageB_LSB': 0xEA,
+        'VoltageC_LSB': 0xEB,
+        'CurrentA_LSB': 0xED,
+        'CurrentB_LSB': 0xEE,
+        'CurrentC_LSB': 0xEF,
         }
+    _READ_FRAMES, _WRITE_PREFIXES = _register_frames(REGISTERS)
+
+    # Registers read by read_snapshot(), in transfer order
+    SNAPSHOT_REGISTERS = (
+        'VoltageA', 'VoltageB', 'VoltageC',
+        'CurrentA', 'CurrentB', 'CurrentC',
+        'ApH_PowerA', 'ApL_PowerA',
+        'ApH_PowerB', 'ApL_PowerB',
+        'ApH_PowerC', 'ApL_PowerC',
+        'Frequency',
+        'PhaseAngleA', 'PhaseAngleB', 'PhaseAngleC',
+    )
+
+    # read_snapshot(extended=True) appends the RMS LSB words to the same burst
+    EXTENDED_SNAPSHOT_REGISTERS = SNAPSHOT_REGISTERS + (
+        'VoltageA_LSB', 'VoltageB_LSB', 'VoltageC_LSB',
+        'CurrentA_LSB', 'CurrentB_LSB', 'CurrentC_LSB',
+    )
 
     DEFAULT_SPI_BUS = 0
     DEFAULT_SPI_DEVICE = 0
     DEFAULT_SPEED_HZ = 200000
 
-    def __init__(self, spi_bus=DEFAULT_SPI_BUS, spi_device=DEFAULT_SPI_DEVICE, speed_hz=DEFAULT_SPEED_HZ):
-        """Initialize the SPI connection and GPIO pin assignments."""
+    def __init__(self, spi_bus=DEFAULT_SPI_BUS, spi_device=DEFAULT_SPI_DEVICE, speed_hz=DEFAULT_SPEED_HZ, spi_factory=None,
+                 bus_lock=None, retries=3, reset_pin=PINS['RST'], cleanup_gpio=True, speed_state_path=None):
+        """
+        Initialize the SPI connection and GPIO pin assignments.
+
+        spi_factory builds the SPI handle (default spidev.SpiDev); pass
+        emulator.SpiDev to run without hardware. bus_lock is shared by all
+        meters on the same SPI bus (see meter_bus.MeterBus). The handle is
+        wrapped in a transport.ResilientSpiDev that retries a failed transfer
+        up to `retries` times and reopens the device when needed;
+        reset_monitor watches for chip resets (see transport.ResetMonitor).
+
+        reset_pin is this chip's hardware reset line; with reset_pin=None,
+        e.g. when the line is shared with other chips, the chip is reset
+        with a SoftReset write instead. close() releases all GPIO unless
+        cleanup_gpio is False (MeterBus members leave it to the bus).
+
+        speed_state_path is the link_tuning state file: when it holds a
+        tuned clock rate for this bus and device, that rate replaces
+        speed_hz.
+        """
         self.spi_bus = spi_bus
         self.spi_device = spi_device
+        if speed_state_path is not None:
+            speed_hz = load_tuned_speed(speed_state_path, default_device_id(spi_bus, spi_device), speed_hz)
         self.speed_hz = speed_hz
+        self.reset_pin = reset_pin
+        self.cleanup_gpio = cleanup_gpio
+        self._snapshot_batch = read_batch([self.REGISTERS[name] for name in self.SNAPSHOT_REGISTERS])
+        self._extended_snapshot_batch = read_batch(
+            [self.REGISTERS[name] for name in self.EXTENDED_SNAPSHOT_REGISTERS])
+        self._extended_batches = {}
+        for quantity in ('Voltage', 'Current'):
+            for phase in (None, 'A', 'B', 'C'):
+                names = [name for p in (phase or 'ABC') for name in (f'{quantity}{p}', f'{quantity}{p}_LSB')]
+                self._extended_batches[quantity, phase] = read_batch([self.REGISTERS[name] for name in names])
+        self._snapshot_count = 0
+        self._snapshot_registers = 0
+        self._snapshot_time = 0.0
+        self._bus_lock = bus_lock if bus_lock is not None else threading.RLock()
+        self._irq_batch = read_batch([EMMIntState0, EMMIntState1])
+        self._decoders = {}
+        self._events = queue.Queue()
+        self._event_callback = None
+        self._events_enabled = False
+        self._zx_sampling = False
+        self._zx_divider = 1
+        self._zx_count = 0
+        self.stats = MeterStats()
+        self.reset_monitor = None
 
         try:
-            self.spi = spidev.SpiDev()
+            if spi_factory is None:
+                if spidev is None:
+                    raise RuntimeError("spidev is not installed; pass spi_factory to use another backend")
+                spi_factory = spidev.SpiDev
+            self.spi = ResilientSpiDev(spi_factory, retries=retries, lock=self._bus_lock)
             self.spi.open(spi_bus, spi_device)
             self.spi.max_speed_hz = speed_hz
             self.spi.mode = 0b00  # SPI Mode 0
@@ -79,16 +211,20 @@ class ATM90E3x:
 
             self._init_gpio()
             self.reset_device()
+            self.reset_monitor = ResetMonitor(self)
         except Exception as e:
             logging.error("Failed to initialize SPI connection or GPIO: %s", e)
             raise RuntimeError("Initialization failed") from e
 
     def _init_gpio(self):
         """Initialize GPIO pins for the ATM90E3x."""
+        if GPIO is None:
+            logging.warning("RPi.GPIO not available; hardware reset and event mode disabled.")
+            return
+        if self.reset_pin is None:
+            return
         try:
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setup(PINS['RST'], GPIO.OUT)
-            GPIO.output(PINS['RST'], GPIO.HIGH)  # Set reset pin high initially
+            setup_reset_pin(self.reset_pin)
             logging.info("GPIO initialized.")
         except Exception as e:
             logging.error("Failed to initialize GPIO: %s", e)
@@ -96,72 +232,68 @@ class ATM90E3x:
 
     def reset_device(self):
         """Reset the ATM90E3x device."""
+        if GPIO is None or self.reset_pin is None:
+            self.write_register(SoftReset, 0x789A)
+            logging.info("Device soft reset complete.")
+            return
         try:
-            GPIO.output(PINS['RST'], GPIO.LOW)
-            time.sleep(0.1)  # Hold reset for 100ms
-            GPIO.output(PINS['RST'], GPIO.HIGH)
-            time.sleep(0.1)  # Allow the device to stabilize
+            pulse_reset(self.reset_pin)
             logging.info("Device reset complete.")
         except Exception as e:
             logging.error("Failed to reset device: %s", e)
             raise RuntimeError("Device reset failed") from e
     
     def _spi_transfer(self, data):
-        """Perform an SPI transfer."""
+        """Perform an SPI transfer, counting latency and errors per register."""
+        address = ((data[0] & 0x7F) << 8) | data[1]
+        write = not data[0] & 0x80
+        start = time.perf_counter()
         try:
+            # The transport takes the bus lock per attempt and releases it while backing off
             response = self.spi.xfer2(data)
-            return response
         except Exception as e:
-            logging.error("SPI transfer failed: %s", e)
+            self.stats.record(address, write, time.perf_counter() - start, error=True)
+            _log.error(('spi', address), "SPI transfer failed on register 0x%03X: %s", address, e,
+                       register=address, write=write)
             raise RuntimeError("SPI transfer failed") from e
+        self.stats.record(address, write, time.perf_counter() - start)
+        if write and self.reset_monitor is not None:
+            self.reset_monitor.written(address)
+        return response
 
     def _read_register(self, register_name):
         """Read data from a register."""
+        cmd = self._READ_FRAMES.get(register_name)
+        if cmd is None:
+            raise RuntimeError(f"Failed to read register {register_name}") from \
+                ValueError(f"Unknown register: {register_name}")
         try:
-            if register_name not in self.REGISTERS:
-                raise ValueError(f"Unknown register: {register_name}")
-            
-            reg_address = self.REGISTERS[register_name]
-            cmd = [0x80 | (reg_address >> 8), reg_address & 0xFF, 0x00, 0x00]
             response = self._spi_transfer(cmd)
-            
-            result = (response[2] << 8) | response[3]
-            return result
-        except Exception as e:
-            logging.error("Failed to read register %s: %s", register_name, e)
+        except RuntimeError as e:
             raise RuntimeError(f"Failed to read register {register_name}") from e
+        return (response[2] << 8) | response[3]
 
     def _write_register(self, register_name, value):
         """Write data to a register."""
+        prefix = self._WRITE_PREFIXES.get(register_name)
+        if prefix is None:
+            raise RuntimeError(f"Failed to write register {register_name}") from \
+                ValueError(f"Unknown register: {register_name}")
         try:
-            if register_name not in self.REGISTERS:
-                raise ValueError(f"Unknown register: {register_name}")
-            
-            reg_address = self.REGISTERS[register_name]
-            cmd = [reg_address >> 8, reg_address & 0xFF, value >> 8, value & 0xFF]
-            self._spi_transfer(cmd)
-            logging.debug("Wrote 0x%04X to register %s (0x%04X)", value, register_name, reg_address)
-        except Exception as e:
-            logging.error("Failed to write register %s: %s", register_name, e)
+            self._spi_transfer(prefix + ((value >> 8) & 0xFF, value & 0xFF))
+        except RuntimeError as e:
             raise RuntimeError(f"Failed to write register {register_name}") from e
-        
-        
-    def read_register(self, register_name):
-        """Read data from a register."""
-        #if register_name not in self.REGISTERS:
-            #raise ValueError(f"Unknown register: {register_name}")
-        
-        #reg_address = self.REGISTERS[register_name]
-        reg_address = register_name
-        cmd = [0x80 | (reg_address >> 8), reg_address & 0xFF, 0x00, 0x00]
-        response = self._spi_transfer(cmd)
-        
-        #if len(response) != 4:
-            #raise RuntimeError("Invalid response length")
+        _log.debug(('write', register_name), "Wrote 0x%04X to register %s", value, register_name,
+                   register=register_name, value=value)
+
+    def read_register(self, reg_address):
+        """Read data from a register address (any address in registers.py)."""
+        response = self._spi_transfer(get_read_frame(reg_address))
+        return (response[2] << 8) | response[3]
 
-        result = (response[2] << 8) | response[3]
-        #logging.debug("Read register %s (0x%04X): 0x%04X", register_name, reg_address, result)
-        return result
+    def write_register(self, reg_address, value):
+        """Write data to a register address (any address in registers.py)."""
+        self._spi_transfer(get_write_frame(reg_address, value))
 
     # Reading specific parameters
 
@@ -187,7 +319,7 @@ class ATM90E3x:
             if register_value & 0x80000000:  # If MSB is 1
                 register_value -= 1 << 32  # Convert to signed 32-bit value
 
-            power = register_value * 0.00032
+            power = register_value * POWER_SCALE
             return power
         except Exception as e:
             logging.error("Failed to calculate active power: %s", e)
@@ -199,7 +331,7 @@ class ATM90E3x:
         """Read frequency in Hz."""
         try:
             raw_value = self._read_register('Frequency')
-            return raw_value * 0.01
+            return raw_value * FREQUENCY_SCALE
         except Exception as e:
             logging.error("Failed to read frequency: %s", e)
             raise RuntimeError("Failed to read frequency") from e
@@ -211,7 +343,7 @@ class ATM90E3x:
             phase_registers = {'A': 'PhaseAngleA', 'B': 'PhaseAngleB', 'C': 'PhaseAngleC'}
             if phase.upper() not in phase_registers:
                 raise ValueError("Invalid phase. Choose 'A', 'B', or 'C'.")
-            return self._read_register(phase_registers[phase.upper()]) * 0.1
+            return self._read_register(phase_registers[phase.upper()]) * ANGLE_SCALE
         except Exception as e:
             logging.error("Failed to read phase angle for phase %s: %s", phase, e)
             raise RuntimeError(f"Failed to read phase angle for phase {phase}") from e
@@ -219,8 +351,23 @@ class ATM90E3x:
 
     import logging
 
-    def read_voltage(self, phase=None):
-        """Read voltage for the specified phase or all phases by default."""
+    def _read_extended(self, quantity, phase, scale):
+        """
+        Read MSB/LSB RMS register pairs in one burst and combine them; bits
+        15:8 of the LSB register extend the MSB by 8 fractional bits.
+        """
+        words = self.transfer_batch(self._extended_batches[quantity, phase])
+        values = [(words[i] + (words[i + 1] >> 8) / 256.0) * scale for i in range(0, len(words), 2)]
+        if phase is not None:
+            return values[0]
+        return dict(zip('ABC', values))
+
+    def read_voltage(self, phase=None, extended=False):
+        """
+        Read voltage for the specified phase or all phases by default.
+        With extended=True the UrmsxLSB registers are read in the same burst
+        for 1/256 finer resolution.
+        """
         voltage_registers = {
             'A': 'VoltageA',
             'B': 'VoltageB',
@@ -228,13 +375,17 @@ class ATM90E3x:
         }
         try:
             if phase is None:
+                if extended:
+                    return self._read_extended('Voltage', None, VOLTAGE_SCALE)
                 # Reading voltage for all phases
-                voltages = {p: self._read_register(reg_name) * 0.01 for p, reg_name in voltage_registers.items()}
+                voltages = {p: self._read_register(reg_name) * VOLTAGE_SCALE for p, reg_name in voltage_registers.items()}
                 return voltages
             elif phase.upper() in voltage_registers:
+                if extended:
+                    return self._read_extended('Voltage', phase.upper(), VOLTAGE_SCALE)
                 # Reading voltage for a specific phase
                 reg_name = voltage_registers[phase.upper()]
-                return self._read_register(reg_name) * 0.01
+                return self._read_register(reg_name) * VOLTAGE_SCALE
             else:
                 # Invalid phase provided
                 raise ValueError(f"Invalid phase '{phase}'. Valid options are 'A', 'B', or 'C'.")
@@ -249,8 +400,12 @@ class ATM90E3x:
             raise RuntimeError("Failed to read voltage") from e
 
 
-    def read_current(self, phase=None):
-        """Read current for the specified phase or all phases by default."""
+    def read_current(self, phase=None, extended=False):
+        """
+        Read current for the specified phase or all phases by default.
+        With extended=True the IrmsxLSB registers are read in the same burst
+        for 1/256 finer resolution.
+        """
         current_registers = {
             'A': 'CurrentA',
             'B': 'CurrentB',
@@ -258,13 +413,17 @@ class ATM90E3x:
         }
         try:
             if phase is None:
+                if extended:
+                    return self._read_extended('Current', None, CURRENT_SCALE)
                 # Reading current for all phases
-                currents = {p: self._read_register(reg_name) * 0.001 for p, reg_name in current_registers.items()}
+                currents = {p: self._read_register(reg_name) * CURRENT_SCALE for p, reg_name in current_registers.items()}
                 return currents
             elif phase.upper() in current_registers:
+                if extended:
+                    return self._read_extended('Current', phase.upper(), CURRENT_SCALE)
                 # Reading current for a specific phase
                 reg_name = current_registers[phase.upper()]
-                return self._read_register(reg_name) * 0.001
+                return self._read_register(reg_name) * CURRENT_SCALE
             else:
                 raise ValueError("Invalid phase. Choose 'A', 'B', or 'C'.")
         except AttributeError as e:
@@ -306,12 +465,217 @@ class ATM90E3x:
         except Exception as e:
             raise RuntimeError("An unexpected error occurred while reading the power") from e
 
-        
+    def transfer_batch(self, batch):
+        """Run a prepared spi_batch.SpiBatch and return its data words."""
+        start = time.perf_counter()
+        try:
+            words = self.spi.words(batch)
+        except Exception as e:
+            self.stats.record_batch(batch, time.perf_counter() - start, error=True)
+            _log.error(('batch', batch.addresses), "Batched SPI transfer of %d registers failed: %s",
+                       batch.count, e, registers=batch.addresses)
+            raise RuntimeError("Batched SPI transfer failed") from e
+        self.stats.record_batch(batch, time.perf_counter() - start)
+        return words
+
+    def link_stats(self):
+        """Return the SPI transport's per-error-class and recovery counters."""
+        return self.spi.counters()
+
+    def read_registers(self, names, extended=True):
+        """
+        Read any set of registers (registers.py names) in one batch and
+        decode them with descriptors.DESCRIPTORS.
+
+        Returns:
+            dict: register name -> value in engineering units.
+        """
+        key = (tuple(names), extended)
+        decoder = self._decoders.get(key)
+        if decoder is None:
+            decoder = self._decoders[key] = RegisterDecoder(key[0], extended)
+        return decoder.read(self)
+
+    def read_snapshot_raw(self):
+        """
+        Read the raw 16-bit words of SNAPSHOT_REGISTERS in one batched SPI
+        submission, undecoded (see sample_buffer.RawSampleBuffer).
+        """
+        start = time.monotonic()
+        words = self.transfer_batch(self._snapshot_batch)
+        self._snapshot_time += time.monotonic() - start
+        self._snapshot_count += 1
+        self._snapshot_registers += self._snapshot_batch.count
+        return words
+
+    def read_snapshot(self, extended=False):
+        """
+        Read voltage, current, power, frequency and phase angles for all
+        phases in a single SPI submission.
+
+        With extended=True the RMS LSB registers ride in the same burst
+        (EXTENDED_SNAPSHOT_REGISTERS) and voltage/current gain 8 fractional
+        bits.
+
+        Returns:
+            Snapshot: per-phase values as (A, B, C) tuples.
+        """
+        timestamp = time.time()
+        if not extended:
+            return self.decode_snapshot(self.read_snapshot_raw(), timestamp)
+
+        start = time.monotonic()
+        words = self.transfer_batch(self._extended_snapshot_batch)
+        self._snapshot_time += time.monotonic() - start
+        self._snapshot_count += 1
+        self._snapshot_registers += self._extended_snapshot_batch.count
+        return self.decode_snapshot(words, timestamp)
+
+    @staticmethod
+    def decode_snapshot(words, timestamp):
+        """Decode raw SNAPSHOT_REGISTERS or EXTENDED_SNAPSHOT_REGISTERS words into a Snapshot."""
+        (ua, ub, uc, ia, ib, ic,
+         pha, pla, phb, plb, phc, plc,
+         freq, anga, angb, angc) = words[:16]
+        if len(words) > 16:
+            ual, ubl, ucl, ial, ibl, icl = words[16:22]
+            ua, ub, uc = ua + (ual >> 8) / 256.0, ub + (ubl >> 8) / 256.0, uc + (ucl >> 8) / 256.0
+            ia, ib, ic = ia + (ial >> 8) / 256.0, ib + (ibl >> 8) / 256.0, ic + (icl >> 8) / 256.0
+
+        powers = []
+        for high_word, low_word in ((pha, pla), (phb, plb), (phc, plc)):
+            register_value = (high_word << 16) | low_word
+            if register_value & 0x80000000:
+                register_value -= 1 << 32
+            powers.append(register_value * POWER_SCALE)
+
+        return Snapshot(
+            timestamp,
+            (ua * VOLTAGE_SCALE, ub * VOLTAGE_SCALE, uc * VOLTAGE_SCALE),
+            (ia * CURRENT_SCALE, ib * CURRENT_SCALE, ic * CURRENT_SCALE),
+            tuple(powers),
+            freq * FREQUENCY_SCALE,
+            (anga * ANGLE_SCALE, angb * ANGLE_SCALE, angc * ANGLE_SCALE),
+        )
+
+    def snapshot_stats(self):
+        """Report snapshot count, mean latency and achieved register throughput."""
+        count = self._snapshot_count
+        elapsed = self._snapshot_time
+        registers = self._snapshot_registers
+        return {
+            'snapshots': count,
+            'registers': registers,
+            'mean_latency_s': elapsed / count if count else 0.0,
+            'snapshots_per_s': count / elapsed if elapsed else 0.0,
+            'registers_per_s': registers / elapsed if elapsed else 0.0,
+        }
+
+    # Event mode
+
+    def enable_events(self, callback=None, zero_crossing_sampling=False, zx_divider=1):
+        """
+        Switch to edge-driven acquisition on IRQ0 and, optionally, ZX0.
+
+        IRQ0 edges read and clear EMMIntState0/1 and dispatch typed
+        events.MeterEvent records. With zero_crossing_sampling, every
+        zx_divider-th ZX0 edge takes a cycle-synchronous read_snapshot()
+        and dispatches it as a SAMPLE event.
+
+        Args:
+            callback (callable): Called with each MeterEvent from the GPIO thread.
+                Events are also queued for wait_event().
+            zero_crossing_sampling (bool): Sample on ZX0 edges.
+            zx_divider (int): Sample on every n-th zero crossing.
+        """
+        if zx_divider < 1:
+            raise ValueError("zx_divider must be at least 1")
+        if GPIO is None:
+            raise RuntimeError("Event mode requires RPi.GPIO")
+        self._event_callback = callback
+        self._zx_sampling = zero_crossing_sampling
+        self._zx_divider = zx_divider
+        self._zx_count = 0
+
+        try:
+            GPIO.setup(PINS['IRQ0'], GPIO.IN)
+            GPIO.add_event_detect(PINS['IRQ0'], GPIO.FALLING, callback=self._on_interrupt_request)
+            if zero_crossing_sampling:
+                GPIO.setup(PINS['ZX0'], GPIO.IN)
+                GPIO.add_event_detect(PINS['ZX0'], GPIO.RISING, callback=self._on_zero_crossing)
+            self._events_enabled = True
+            logging.info("Event mode enabled (zero-crossing sampling: %s)", zero_crossing_sampling)
+        except Exception as e:
+            logging.error("Error setting up GPIO interrupts: %s", e)
+            raise RuntimeError("GPIO interrupt setup failed") from e
+
+        # Clear anything latched before the edge detector was armed
+        self._on_interrupt_request(PINS['IRQ0'])
+
+    def disable_events(self):
+        """Stop edge-driven acquisition."""
+        if not self._events_enabled:
+            return
+        try:
+            GPIO.remove_event_detect(PINS['IRQ0'])
+            if self._zx_sampling:
+                GPIO.remove_event_detect(PINS['ZX0'])
+        finally:
+            self._events_enabled = False
+            self._zx_sampling = False
+        logging.info("Event mode disabled")
+
+    def wait_event(self, timeout=None):
+        """Block until the next MeterEvent, or return None after timeout seconds."""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _dispatch(self, event):
+        self._events.put(event)
+        if self._event_callback is not None:
+            try:
+                self._event_callback(event)
+            except Exception as e:
+                logging.error("Event callback failed for %s: %s", event.kind, e)
+
+    def _on_interrupt_request(self, channel):
+        """Read, clear and dispatch the latched EMM interrupt flags."""
+        timestamp = time.time()
+        try:
+            state0, state1 = self.transfer_batch(self._irq_batch)
+            # Interrupt status bits are cleared by writing 1
+            if state0:
+                self.write_register(EMMIntState0, state0)
+            if state1:
+                self.write_register(EMMIntState1, state1)
+        except Exception as e:
+            logging.error("Failed to service IRQ0 on pin %s: %s", channel, e)
+            return
+        for event in decode_interrupts(state0, state1, timestamp):
+            self._dispatch(event)
+
+    def _on_zero_crossing(self, channel):
+        """Take a cycle-synchronous snapshot on every zx_divider-th zero crossing."""
+        self._zx_count += 1
+        if self._zx_count < self._zx_divider:
+            return
+        self._zx_count = 0
+        try:
+            snapshot = self.read_snapshot()
+        except Exception as e:
+            logging.error("Zero-crossing sample failed on pin %s: %s", channel, e)
+            return
+        self._dispatch(MeterEvent(SAMPLE, None, snapshot.timestamp, snapshot))
+
     def close(self):
         """Close the SPI connection and reset GPIO pins."""
         try:
+            self.disable_events()
             self.spi.close()
-            GPIO.cleanup()
+            if GPIO is not None and self.cleanup_gpio:
+                GPIO.cleanup()
             logging.info("SPI connection closed and GPIO cleaned up.")
         except Exception as e:
             logging.error("Error closing resources: %s", e)
@@ -319,6 +683,7 @@ class ATM90E3x:
 
 # Example Usage
 def main():
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
     try:
         # Initialize ATM90E3x object
@@ -342,10 +707,17 @@ def main():
         logging.info("Reading Power:")
         print(meter.read_power())
 
+        logging.info("Reading Snapshot:")
+        print(meter.read_snapshot())
+        print(meter.snapshot_stats())
+        print(meter.stats.registers())
+        print(meter.link_stats())
+
     except Exception as e:
         logging.error("Error during testing: %s", e)
     finally:
-        GPIO.cleanup()
+        if GPIO is not None:
+            GPIO.cleanup()
     """    meter = ATM90E3x()
     try:
         registers = {
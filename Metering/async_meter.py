@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncATM90E3x:
+    """
+    asyncio facade over a synchronous ATM90E3x driver.
+
+    Every SPI operation runs on one dedicated worker thread, so the event
+    loop never blocks on xfer2 and bus access stays serialised. Concurrent
+    awaiters of the same operation are coalesced: while a read is in flight,
+    further callers await that read instead of queueing a duplicate
+    transaction.
+
+    read_energy() drains the energy.EnergyAccumulator passed as `energy`.
+    Pass the meter's single, persistent accumulator: the energy registers
+    clear on read, so a second accumulator would split the energy between
+    the two.
+    """
+
+    def __init__(self, meter, energy=None):
+        self.meter = meter
+        self.energy = energy
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="meter-spi")
+        self._inflight = {}
+        self.requests = 0
+        self.transactions = 0
+
+    async def _coalesced(self, key, func, *args):
+        self.requests += 1
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, func, *args)
+            self._inflight[key] = future
+            self.transactions += 1
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so one cancelled awaiter does not cancel the shared read
+        return await asyncio.shield(future)
+
+    async def read_snapshot(self):
+        """Read the full three-phase measurement set."""
+        return await self._coalesced('snapshot', self.meter.read_snapshot)
+
+    async def read_snapshot_raw(self):
+        """Read the raw snapshot register words."""
+        return await self._coalesced('snapshot_raw', self.meter.read_snapshot_raw)
+
+    async def read_energy(self):
+        """Drain the energy registers and return accumulated energy in kWh per register."""
+        if self.energy is None:
+            raise RuntimeError("No energy accumulator configured; pass energy= to AsyncATM90E3x")
+        await self._coalesced('energy', self.energy.drain)
+        return self.energy.energy_kwh()
+
+    async def run(self, func, *args):
+        """Run any other driver call on the SPI worker thread (not coalesced)."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def samples(self, rate_hz, count=None):
+        """
+        Yield snapshots at a fixed rate on a monotonic-deadline schedule.
+
+        Deadlines that pass while a read is in flight are skipped.
+        """
+        period = 1.0 / rate_hz
+        start = time.monotonic()
+        tick = 0
+        produced = 0
+        while count is None or produced < count:
+            delay = start + tick * period - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                snapshot = await self.read_snapshot()
+            except Exception as e:
+                logging.error("Async sample read failed: %s", e)
+            else:
+                produced += 1
+                yield snapshot
+            tick = max(tick + 1, int((time.monotonic() - start) // period) + 1)
+
+    def close(self):
+        """Shut down the SPI worker thread."""
+        self._executor.shutdown(wait=True)
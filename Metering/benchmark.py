@@ -0,0 +1,188 @@
+"""
+Metering hot-path benchmarks against the emulated SPI backend.
+
+    python3 benchmark.py --output results.json
+    python3 benchmark.py --compare results.json
+
+Results are written as JSON so runs can be compared across commits.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import emulator
+import spi_trace
+
+DEFAULT_ITERATIONS = 2000
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+
+    def pick(q):
+        return ordered[min(last, int(round(q * last)))]
+
+    return {
+        'mean_us': sum(ordered) / len(ordered) * 1e6,
+        'p50_us': pick(0.50) * 1e6,
+        'p90_us': pick(0.90) * 1e6,
+        'p99_us': pick(0.99) * 1e6,
+        'max_us': ordered[-1] * 1e6,
+    }
+
+
+def time_calls(func, iterations):
+    """Time each call of func; return ops/s plus latency percentiles."""
+    func()  # warm up
+    latencies = [0.0] * iterations
+    clock = time.perf_counter
+    start = clock()
+    for i in range(iterations):
+        t0 = clock()
+        func()
+        latencies[i] = clock() - t0
+    elapsed = clock() - start
+    result = {'iterations': iterations, 'ops_per_s': iterations / elapsed}
+    result.update(_percentiles(latencies))
+    return result
+
+
+def measure_allocations(func, iterations):
+    """
+    Report transient bytes allocated per call (tracemalloc peak) and memory
+    blocks retained per call (net sys.getallocatedblocks growth).
+    """
+    func()
+    tracemalloc.start()
+    try:
+        peak_total = 0
+        for _ in range(iterations):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - current
+    finally:
+        tracemalloc.stop()
+
+    blocks_before = sys.getallocatedblocks()
+    for _ in range(iterations):
+        func()
+    blocks_after = sys.getallocatedblocks()
+    return {
+        'peak_bytes_per_call': peak_total / iterations,
+        'retained_blocks_per_call': (blocks_after - blocks_before) / iterations,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _replay_snapshot(Metering_1, iterations):
+    """Record snapshot reads on the emulator, then time them replayed from the trace at full speed."""
+    fd, path = tempfile.mkstemp(suffix='.sptr')
+    os.close(fd)
+    try:
+        meter = Metering_1.ATM90E3x(spi_factory=spi_trace.recording_factory(path, emulator.SpiDev))
+        for _ in range(iterations + 1):
+            meter.read_snapshot()
+        meter.close()
+
+        meter = Metering_1.ATM90E3x(spi_factory=lambda: spi_trace.ReplaySpiDev(path))
+        result = time_calls(meter.read_snapshot, iterations)
+        meter.close()
+        return result
+    finally:
+        os.unlink(path)
+
+
+def run_benchmarks(iterations=DEFAULT_ITERATIONS):
+    """Run every benchmark and return a JSON-serialisable result dict."""
+    import Metering_1
+    import caalibration
+
+    meter = Metering_1.ATM90E3x(spi_factory=emulator.SpiDev)
+    results = {}
+
+    results['read_register'] = time_calls(lambda: meter._read_register('CurrentA'), iterations)
+    results['read_register']['registers_per_s'] = results['read_register']['ops_per_s']
+    results['read_register'].update(measure_allocations(lambda: meter._read_register('CurrentA'), iterations))
+
+    results['read_voltage'] = time_calls(meter.read_voltage, iterations // 4)
+    results['read_voltage_extended'] = time_calls(lambda: meter.read_voltage(extended=True), iterations // 4)
+    results['read_power'] = time_calls(meter.read_power, iterations // 4)
+
+    snapshot_registers = len(meter.SNAPSHOT_REGISTERS)
+    results['read_snapshot'] = time_calls(meter.read_snapshot, iterations // 4)
+    results['read_snapshot']['registers_per_s'] = results['read_snapshot']['ops_per_s'] * snapshot_registers
+    results['read_snapshot'].update(measure_allocations(meter.read_snapshot, iterations // 4))
+
+    extended_registers = len(meter.EXTENDED_SNAPSHOT_REGISTERS)
+    results['read_snapshot_extended'] = time_calls(lambda: meter.read_snapshot(extended=True), iterations // 4)
+    results['read_snapshot_extended']['registers_per_s'] = \
+        results['read_snapshot_extended']['ops_per_s'] * extended_registers
+    meter.close()
+
+    results['replay_snapshot'] = _replay_snapshot(Metering_1, iterations // 4)
+    results['replay_snapshot']['registers_per_s'] = results['replay_snapshot']['ops_per_s'] * snapshot_registers
+
+    config_meter = caalibration.ATM90E3x(spi_factory=emulator.SpiDev)
+    results['init_config'] = time_calls(config_meter._init_config, max(10, iterations // 100))
+
+    return {
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'timestamp': time.time(),
+        'backend': 'emulator',
+        'results': results,
+    }
+
+
+def compare(baseline, current):
+    """Print per-benchmark throughput and p99 ratios of current against baseline."""
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        speedup = result['ops_per_s'] / base['ops_per_s']
+        p99 = result['p99_us'] / base['p99_us'] if base['p99_us'] else float('nan')
+        print(f"{name:24s} {speedup:6.2f}x throughput  {p99:6.2f}x p99 latency")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark metering hot paths on the emulated SPI backend.")
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--output', help="write JSON results to this file")
+    parser.add_argument('--compare', help="baseline JSON results to compare against")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    report = run_benchmarks(args.iterations)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
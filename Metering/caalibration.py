@@ -1,11 +1,29 @@
-import spidev
 import time
 import logging
-import RPi.GPIO as GPIO
 from registers import *
 import math
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+from types import MappingProxyType
+
+from command_table import get_read_frame, get_write_frame
+from calibration_profiles import default_device_id
+from config_manager import ConfigManager
+from config_session import ConfigSession
+from instrumentation import MeterStats, RateLimitedLogger
+from link_tuning import load_tuned_speed
+from transport import ResetMonitor, ResilientSpiDev
+
+# Hardware backends are optional so the driver can run against emulator.SpiDev
+try:
+    import spidev
+except ImportError:
+    spidev = None
+try:
+    import RPi.GPIO as GPIO
+except (ImportError, RuntimeError):
+    GPIO = None
+
+# Hot-path log records are rate-limited per register and skipped entirely when disabled
+_log = RateLimitedLogger()
 
 # Pin Definitions for GPIO
 PINS = {
@@ -42,17 +60,34 @@ class ATM90E3x:
         'U_offset_C':0x6B,
         'I_offset_C':0x6C,
     }
+    _READ_FRAMES = MappingProxyType({name: get_read_frame(address) for name, address in REGISTERS.items()})
 
     DEFAULT_SPI_BUS = 0
     DEFAULT_SPI_DEVICE = 0
     DEFAULT_SPEED_HZ = 2000000
 
     def __init__(self, spi_bus=DEFAULT_SPI_BUS, spi_device=DEFAULT_SPI_DEVICE, speed_hz=DEFAULT_SPEED_HZ,linefreq=0x0087, pgagain=0x002A, ugainA=0xc720, ugainB=0xc720, ugainC=0xc720, igainA=0x9F34, igainB=0x9F34
-    , igainC=0x9F34):
-        """Initialize the SPI connection and GPIO pin assignments."""
+    , igainC=0x9F34, spi_factory=None, config_state_path=None, profile_store=None, device_id=None,
+    thresholds=None, retries=3, speed_state_path=None):
+        """
+        Initialize the SPI connection and GPIO pin assignments.
+
+        spi_factory builds the SPI handle (default spidev.SpiDev); pass
+        emulator.SpiDev to run without hardware. config_state_path persists
+        the configuration digest so a reboot with an already configured chip
+        skips the reset and rewrite. profile_store (a
+        calibration_profiles.ProfileStore) supplies this device's stored
+        calibration, keyed by device_id, which overrides the gain defaults in
+        the same configuration pass. thresholds (a pq_events.PQThresholds)
+        adds SagTh, OVth, PhaseLossTh, OIth and the frequency limits to the
+        profile. Failed transfers are retried up to `retries` times (see
+        transport.ResilientSpiDev), and reset_monitor restores the
+        configuration after an unexpected chip reset. speed_state_path is
+        the link_tuning state file; a rate tuned for device_id there
+        replaces speed_hz.
+        """
         self.spi_bus = spi_bus
         self.spi_device = spi_device
-        self.speed_hz = speed_hz
         self._linefreq = linefreq
         self._pgagain = pgagain
         self._ugainA = ugainA
@@ -61,6 +96,25 @@ class ATM90E3x:
         self._igainA = igainA
         self._igainB = igainB
         self._igainC = igainC
+        self.calibration = {}
+        self.thresholds = thresholds
+        self.stats = MeterStats()
+        self.reset_monitor = None
+        self.profile_store = profile_store
+        self.device_id = device_id if device_id is not None else default_device_id(spi_bus, spi_device)
+        if speed_state_path is not None:
+            speed_hz = load_tuned_speed(speed_state_path, self.device_id, speed_hz)
+        self.speed_hz = speed_hz
+        if profile_store is not None:
+            stored = profile_store.load(self.device_id)
+            if stored:
+                known = {register for register, _ in self._config_profile()}
+                unknown = sorted(set(stored) - known)
+                if unknown:
+                    logging.warning("Calibration profile for %s has registers the configuration does not write, "
+                                    "ignored: %s", self.device_id, ', '.join(f'0x{r:03X}' for r in unknown))
+                self.calibration.update({r: v for r, v in stored.items() if r in known})
+                logging.info("Loaded calibration profile for %s", self.device_id)
 
 
         
@@ -70,19 +124,20 @@ class ATM90E3x:
         self.speed_hz = speed_hz'''
 
         try:
-            self.spi = spidev.SpiDev()
+            if spi_factory is None:
+                if spidev is None:
+                    raise RuntimeError("spidev is not installed; pass spi_factory to use another backend")
+                spi_factory = spidev.SpiDev
+            self.spi = ResilientSpiDev(spi_factory, retries=retries)
             self.spi.open(spi_bus, spi_device)
             self.spi.max_speed_hz = speed_hz
             self.spi.mode = 0b00  # SPI Mode 0
             logging.info("ATM90E3x initialized with SPI bus %d, device %d, speed %d Hz", spi_bus, spi_device, speed_hz)
 
             self._init_gpio()
-            self.reset_device()
-            self._init_config()
-            #self._init_gpio()
-            #self.reset_device()
-            
-            time.sleep(5)
+            self.reset_monitor = ResetMonitor(self, configure=self.restore_config)
+            self.config = ConfigManager(self, state_path=config_state_path, device_id=self.device_id)
+            self.configure()
             #self._write_register(FreqLoTh, 0x0012)
         except Exception as e:
             logging.error("Initialization failed: %s", e)
@@ -91,6 +146,9 @@ class ATM90E3x:
     def _init_gpio(self):
         
         """Initialize GPIO pins for the ATM90E3x."""
+        if GPIO is None:
+            logging.warning("RPi.GPIO not available; using soft reset.")
+            return
         GPIO.setmode(GPIO.BCM)
         GPIO.setup(PINS['RST'], GPIO.OUT)
         GPIO.output(PINS['RST'], GPIO.HIGH)  # Set reset pin high initially
@@ -98,6 +156,9 @@ class ATM90E3x:
 
     def reset_device(self):
         """Reset the ATM90E3x device."""
+        if GPIO is None:
+            # _init_config starts with a SoftReset write
+            return
         try:
             GPIO.output(PINS['RST'], GPIO.LOW)
             time.sleep(0.1)  # Hold reset for 100ms
@@ -113,14 +174,15 @@ class ATM90E3x:
             return math.floor(f_num)
         return math.ceil(f_num)
     
-    def _init_config(self):
+    def _config_profile(self):
+        """Return the (register, value) pairs _init_config writes, in write order."""
         # CurrentGainCT2 = 25498  #25498 - SCT-013-000 100A/50mA
         if (self._linefreq == 4485 or self._linefreq == 5231):
             # North America power frequency
             FreqHiThresh = 61 * 100
             FreqLoThresh = 59 * 100
             sagV = 90
-        if (self._linefreq == 0x0087):
+        elif (self._linefreq == 0x0087):
             sagV=70
             FreqHiThresh = 51 * 100
             FreqLoThresh = 49 * 100
@@ -137,144 +199,190 @@ class ATM90E3x:
         # convert to int for sending to the atm90e32.
         vSagTh = self._round_number(fvSagTh)
 
+        profile = [
+            (MeterEn, 0x0001),   # Enable Metering
+            #(SagTh, vSagTh),         # Voltage sag threshold
+            # High frequency threshold - 61.00Hz
+            #(FreqHiTh, FreqHiThresh),
+            # Lo frequency threshold - 59.00Hz
+            #(FreqLoTh, FreqLoThresh),
+            (EMMIntEn0, 0xB76F),   # Enable interrupts
+            (EMMIntEn1, 0xDDFD),   # Enable interrupts
+            # ZX2, ZX1, ZX0 pin config
+            (ZXConfig, 0x0A55),
+
+            # Set metering config values (CONFIG)
+            # PL Constant MSB (default) - Meter Constant = 3200 - PL Constant = 140625000
+            (PLconstH, 0x0861),
+            # PL Constant LSB (default) - this is 4C68 in the application note, which is incorrect
+            (PLconstL, 0xC468),
+            # Mode Config (frequency set in main program)
+            (MMode0, self._linefreq),
+            # PGA Gain Configuration for Current Channels - 0x002A (x4) # 0x0015 (x2) # 0x0000 (1x)
+            (MMode1, self._pgagain),
+            # Active Startup Power Threshold - 50% of startup current = 0.9/0.00032 = 2812.5
+            (PStartTh, 0x0AFC),
+            # Reactive Startup Power Threshold
+            (QStartTh, 0x0AEC),
+            # Apparent Startup Power Threshold
+            (SStartTh, 0x0000),
+            # Active Phase Threshold = 10% of startup current = 0.06/0.00032 = 187.5
+            (PPhaseTh, 0x00BC),
+            (QPhaseTh, 0x0000),    # Reactive Phase Threshold
+            # Apparent  Phase Threshold
+            (SPhaseTh, 0x0000),
+
+            # Set metering calibration values (CALIBRATION)
+            (PQGainA, 0x0000),     # Line calibration gain
+            (PhiA, 0x0000),        # Line calibration angle
+            (PQGainB, 0x0000),     # Line calibration gain
+            (PhiB, 0x0000),        # Line calibration angle
+            (PQGainC, 0x0000),     # Line calibration gain
+            (PhiC, 0x0000),        # Line calibration angle
+            # A line active power offset
+            (PoffsetA, 0x0000),
+            # A line reactive power offset
+            (QoffsetA, 0x0000),
+            # B line active power offset
+            (PoffsetB, 0x0000),
+            # B line reactive power offset
+            (QoffsetB, 0x0000),
+            # C line active power offset
+            (PoffsetC, 0x0000),
+            # C line reactive power offset
+            (QoffsetC, 0x0000),
+
+            # Set metering calibration values (HARMONIC)
+            # A Fund. active power offset
+            (POffsetAF, 0x0000),
+            # B Fund. active power offset
+            (POffsetBF, 0x0000),
+            # C Fund. active power offset
+            (POffsetCF, 0x0000),
+            # A Fund. active power gain
+            (PGainAF, 0x0000),
+            # B Fund. active power gain
+            (PGainBF, 0x0000),
+            # C Fund. active power gain
+            (PGainCF, 0x0000),
+
+            # Set measurement calibration values (ADJUST)
+            (UgainA, self._ugainA),      # A Voltage rms gain
+            # A line current gain
+            (IgainA, self._igainA),
+            (UoffsetA, 0x0100),    # A Voltage offset
+            (IoffsetA, 0x0000),    # A line current offset
+            (UgainB, self._ugainB),      # B Voltage rms gain
+            # B line current gain
+            (IgainB, self._igainB),
+            (UoffsetB, 0x0100),    # B Voltage offset
+            (IoffsetB, 0x0000),    # B line current offset
+            (UgainC, self._ugainC),      # C Voltage rms gain
+            # C line current gain
+            (IgainC, self._igainC),
+            (UoffsetC, 0x0100),    # C Voltage offset
+            (IoffsetC, 0x0000),    # C line current offset
+        ]
+        if self.thresholds is not None:
+            # Sag/swell/phase-loss/over-current and frequency limits for event detection
+            # Scaled with the gains this same profile writes, calibration overrides included
+            ugain = self.calibration.get(UgainA, self._ugainA)
+            igain = self.calibration.get(IgainA, self._igainA)
+            profile[1:1] = self.thresholds.registers(ugain, igain) + [
+                (FreqHiTh, FreqHiThresh), (FreqLoTh, FreqLoThresh)]
+        # Values written by calibration_engine.CalibrationEngine take precedence
+        return [(register, self.calibration.get(register, value)) for register, value in profile]
+
+    def _init_config(self):
         self._write_register(SoftReset, 0x789A)   # Perform soft reset
-        # enable register config access
-        self._write_register( CfgRegAccEn, 0x55AA)
-        self._write_register( MeterEn, 0x0001)   # Enable Metering
-
-        #self._write_register( SagTh, vSagTh)         # Voltage sag threshold
-        # High frequency threshold - 61.00Hz
-        #self._write_register( FreqHiTh, FreqHiThresh)
-        # Lo frequency threshold - 59.00Hz
-        #self._write_register( FreqLoTh, FreqLoThresh)
-        self._write_register( EMMIntEn0, 0xB76F)   # Enable interrupts
-        self._write_register( EMMIntEn1, 0xDDFD)   # Enable interrupts
-        self._write_register( EMMIntState0, 0x0001)  # Clear interrupt flags
-        self._write_register( EMMIntState1, 0x0001)  # Clear interrupt flags
-        # ZX2, ZX1, ZX0 pin config
-        self._write_register( ZXConfig, 0x0A55)
-
-        # Set metering config values (CONFIG)
-        # PL Constant MSB (default) - Meter Constant = 3200 - PL Constant = 140625000
-        self._write_register( PLconstH, 0x0861)
-        # PL Constant LSB (default) - this is 4C68 in the application note, which is incorrect
-        self._write_register( PLconstL, 0xC468)
-        # Mode Config (frequency set in main program)
-        self._write_register( MMode0, self._linefreq)
-        # PGA Gain Configuration for Current Channels - 0x002A (x4) # 0x0015 (x2) # 0x0000 (1x)
-        self._write_register( MMode1, self._pgagain)
-        # Active Startup Power Threshold - 50% of startup current = 0.9/0.00032 = 2812.5
-        self._write_register( PStartTh, 0x0AFC)
-        # Reactive Startup Power Threshold
-        self._write_register( QStartTh, 0x0AEC)
-        # Apparent Startup Power Threshold
-        self._write_register( SStartTh, 0x0000)
-        # Active Phase Threshold = 10% of startup current = 0.06/0.00032 = 187.5
-        self._write_register( PPhaseTh, 0x00BC)
-        self._write_register( QPhaseTh, 0x0000)    # Reactive Phase Threshold
-        # Apparent  Phase Threshold
-        self._write_register( SPhaseTh, 0x0000)
-
-        # Set metering calibration values (CALIBRATION)
-        self._write_register( PQGainA, 0x0000)     # Line calibration gain
-        self._write_register( PhiA, 0x0000)        # Line calibration angle
-        self._write_register( PQGainB, 0x0000)     # Line calibration gain
-        self._write_register( PhiB, 0x0000)        # Line calibration angle
-        self._write_register( PQGainC, 0x0000)     # Line calibration gain
-        self._write_register( PhiC, 0x0000)        # Line calibration angle
-        # A line active power offset
-        self._write_register( PoffsetA, 0x0000)
-        # A line reactive power offset
-        self._write_register( QoffsetA, 0x0000)
-        # B line active power offset
-        self._write_register( PoffsetB, 0x0000)
-        # B line reactive power offset
-        self._write_register( QoffsetB, 0x0000)
-        # C line active power offset
-        self._write_register( PoffsetC, 0x0000)
-        # C line reactive power offset
-        self._write_register( QoffsetC, 0x0000)
-
-        # Set metering calibration values (HARMONIC)
-        # A Fund. active power offset
-        self._write_register( POffsetAF, 0x0000)
-        # B Fund. active power offset
-        self._write_register( POffsetBF, 0x0000)
-        # C Fund. active power offset
-        self._write_register( POffsetCF, 0x0000)
-        # A Fund. active power gain
-        self._write_register( PGainAF, 0x0000)
-        # B Fund. active power gain
-        self._write_register( PGainBF, 0x0000)
-        # C Fund. active power gain
-        self._write_register( PGainCF, 0x0000)
-
-        # Set measurement calibration values (ADJUST)
-        self._write_register( UgainA, self._ugainA)      # A Voltage rms gain
-        # A line current gain
-        self._write_register( IgainA, self._igainA)
-        self._write_register( UoffsetA, 0x0100)    # A Voltage offset
-        self._write_register( IoffsetA, 0x0000)    # A line current offset
-        self._write_register( UgainB, self._ugainB)      # B Voltage rms gain
-        # B line current gain
-        self._write_register( IgainB, self._igainB)
-        self._write_register( UoffsetB, 0x0100)    # B Voltage offset
-        self._write_register( IoffsetB, 0x0000)    # B line current offset
-        self._write_register( UgainC, self._ugainC)      # C Voltage rms gain
-        # C line current gain
-        self._write_register( IgainC, self._igainC)
-        self._write_register( UoffsetC, 0x0100)    # C Voltage offset
-        self._write_register( IoffsetC, 0x0000)    # C line current offset
-
-        self._write_register( CfgRegAccEn, 0x0000)  # end configuration
+        # One batched, read-back verified CfgRegAccEn session
+        with ConfigSession(self) as session:
+            session.write_many(self._config_profile())
+
+    def restore_config(self):
+        """Rewrite the configuration profile after an unexpected reset, without resetting again."""
+        with ConfigSession(self) as session:
+            session.write_many(self._config_profile())
+
+    def _reset_and_configure(self):
+        """Hardware reset followed by a full configuration write."""
+        self.reset_device()
+        self._init_config()
+
+    def configure(self):
+        """Apply the configuration profile unless the chip already holds it."""
+        return self.config.ensure(self._config_profile(), self._reset_and_configure)
+
+    def save_calibration(self):
+        """Store the current calibration overrides in the profile store for this device."""
+        if self.profile_store is None:
+            raise RuntimeError("No calibration profile store configured")
+        self.profile_store.save(self.device_id, self.calibration)
 
     def _spi_transfer(self, data):
-        """Perform an SPI transfer."""
+        """Perform an SPI transfer, counting latency and errors per register."""
+        address = ((data[0] & 0x7F) << 8) | data[1]
+        write = not data[0] & 0x80
+        start = time.perf_counter()
         try:
-            
-           #logging.debug("Sending SPI data: %s", data)
             response = self.spi.xfer2(data)
-            #logging.debug("SPI transfer: Sent %s, Received %s", data, response)
-            return response
         except Exception as e:
-            logging.error("SPI transfer failed: %s", e)
+            self.stats.record(address, write, time.perf_counter() - start, error=True)
+            _log.error(('spi', address), "SPI transfer failed on register 0x%03X: %s", address, e,
+                       register=address, write=write)
             raise RuntimeError("SPI transfer failed") from e
+        self.stats.record(address, write, time.perf_counter() - start)
+        if write and self.reset_monitor is not None:
+            # A direct configuration write is intentional, not a reset to undo
+            self.reset_monitor.written(address)
+        return response
+
+    def transfer_batch(self, batch):
+        """Run a prepared spi_batch.SpiBatch and return its data words."""
+        start = time.perf_counter()
+        try:
+            words = self.spi.words(batch)
+        except Exception as e:
+            self.stats.record_batch(batch, time.perf_counter() - start, error=True)
+            _log.error(('batch', batch.addresses), "Batched SPI transfer of %d registers failed: %s",
+                       batch.count, e, registers=batch.addresses)
+            raise RuntimeError("Batched SPI transfer failed") from e
+        self.stats.record_batch(batch, time.perf_counter() - start)
+        return words
+
+    def link_stats(self):
+        """Return the SPI transport's per-error-class and recovery counters."""
+        return self.spi.counters()
 
     def _read_register(self, register_name):
         """Read data from a register."""
-        if register_name not in self.REGISTERS:
+        cmd = self._READ_FRAMES.get(register_name)
+        if cmd is None:
             raise ValueError(f"Unknown register: {register_name}")
-        
-        reg_address = self.REGISTERS[register_name]
-        cmd = [0x80 | (reg_address >> 8), reg_address & 0xFF, 0x00, 0x00]
+
         response = self._spi_transfer(cmd)
-        
+
         if len(response) != 4:
             raise RuntimeError("Invalid response length")
 
-        result = (response[2] << 8) | response[3]
-        #logging.debug("Read register %s (0x%04X): 0x%04X", register_name, reg_address, result)
-        return result
+        return (response[2] << 8) | response[3]
 
     def _write_register(self, register_name, value):
         """Write data to a register."""
-        #if register_name not in self.REGISTERS:
-         #   raise ValueError(f"Unknown register: {register_name}")
-        
-        #reg_address = self.REGISTERS[register_name]
         reg_address = register_name
-        cmd = [reg_address >> 8, reg_address & 0xFF, value >> 8, value & 0xFF]
-        self._spi_transfer(cmd)
-        logging.debug("Wrote 0x%04X to register %s (0x%04X)", value, hex(register_name), reg_address)
-        
+        self._spi_transfer(get_write_frame(reg_address, value))
+        _log.debug(('write', reg_address), "Wrote 0x%04X to register 0x%03X", value, reg_address,
+                   register=reg_address, value=value)
+
+    def write_register(self, reg_addr, value):
+        """Write data to a register address."""
+        self._write_register(reg_addr, value)
+
     def read_register(self, reg_addr):
         """Read data from a register."""
-        high_byte = (reg_addr >> 8) & 0xFF
-        low_byte = reg_addr & 0xFF
-        cmd = [high_byte | 0x80, low_byte, 0x00, 0x00]
-        response = self.spi.xfer2(cmd)
+        response = self._spi_transfer(get_read_frame(reg_addr))
         return (response[2] << 8) | response[3]
-        
+
     def calibrate_power_offsets(self, phase, measured_value):
         """
         Calibrate power offsets for a specific phase.
@@ -286,8 +394,15 @@ class ATM90E3x:
         if phase in offset_registers:
             current_offset = self.read_register(offset_registers[phase])
             new_offset = current_offset - measured_value
-            self._write_register(offset_registers[phase], new_offset)
-        
+            self._write_calibration(offset_registers[phase], new_offset)
+
+    def _write_calibration(self, address, value):
+        """Write a calibration register in a verified session and keep it in the profile."""
+        with ConfigSession(self) as session:
+            session.write(address, value)
+        # restore_config and configure write the calibrated value, not the default
+        self.calibration[address] = value & 0xFFFF
+
     def calibrate_power_gain(self, phase, actual_power, measured_power):
         """
         Calibrate power gain for a specific phase.
@@ -300,7 +415,7 @@ class ATM90E3x:
         if phase in gain_registers:
             current_gain = self.read_register(gain_registers[phase])
             new_gain = int(current_gain * (actual_power / measured_power))
-            self._write_register(gain_registers[phase], new_gain)
+            self._write_calibration(gain_registers[phase], new_gain)
 
     def read_fundamental_active_power(self):
         """Read the fundamental active power for all phases."""
@@ -334,6 +449,7 @@ class ATM90E3x:
 
 # Example Usage
 def main():
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
     try:
         meter = ATM90E3x()
         for i,j in meter.REGISTERS.items():  # Loop through all possible register addresses
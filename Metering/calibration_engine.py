@@ -0,0 +1,205 @@
+import logging
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from command_table import resolve
+from config_session import ConfigSession
+from descriptors import DESCRIPTORS, RegisterDecoder
+from spi_batch import read_batch
+
+PHASES = ('A', 'B', 'C')
+QUANTITIES = ('voltage', 'current', 'power')
+
+# Urms, Irms and Pmean per phase, each with its LSB register, read as one burst per sample
+MEASUREMENT_DECODER = RegisterDecoder([f'{q}{p}' for q in ('Urms', 'Irms', 'Pmean') for p in PHASES])
+
+# Calibration registers written per quantity: (gain, offset) names by phase
+CALIBRATION_REGISTERS = {
+    'voltage': {p: (f'Ugain{p}', f'Uoffset{p}') for p in PHASES},
+    'current': {p: (f'Igain{p}', f'Ioffset{p}') for p in PHASES},
+    'power': {p: (f'PQGain{p}', f'Poffset{p}') for p in PHASES},
+}
+
+# Offset register LSB in engineering units (ATM90E32 application note):
+# RMS offsets act on the 32-bit MSB:LSB value >> 7, power offsets on Pmean >> 8
+OFFSET_UNITS = {
+    'voltage': DESCRIPTORS['UrmsA'].scale / 512,
+    'current': DESCRIPTORS['IrmsA'].scale / 512,
+    'power': DESCRIPTORS['PmeanA'].scale * 256,
+}
+
+# Fit of measured = slope * reference + intercept, per phase
+FitResult = namedtuple('FitResult', ['slope', 'intercept', 'residual_rms', 'residual_max', 'points'])
+
+
+def _to_signed16(value):
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def _register16(name, value, signed):
+    # Out-of-range results mean a bad fit; saturating them would write a railed calibration
+    low, high = (-0x8000, 0x7FFF) if signed else (0, 0xFFFF)
+    if not low <= value <= high:
+        raise ValueError(f"{name} value {value} out of range [{low}, {high}]")
+    return int(value) & 0xFFFF
+
+
+def decode_measurements(words):
+    """Decode (samples, len(MEASUREMENT_DECODER.addresses)) raw words into per-quantity (samples, 3) arrays."""
+    values = MEASUREMENT_DECODER.decode(np.atleast_2d(np.asarray(words, dtype=np.uint16)))
+    return {quantity: values[:, 3 * i:3 * i + 3] for i, quantity in enumerate(QUANTITIES)}
+
+
+def fit_linear(reference, measured):
+    """
+    Least-squares fit of measured = slope * reference + intercept for all
+    phases at once.
+
+    Args:
+        reference (ndarray): (samples, 3) reference values.
+        measured (ndarray): (samples, 3) measured values.
+
+    With a single distinct reference level only the slope is fitted.
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    measured = np.asarray(measured, dtype=np.float64)
+    slopes, intercepts = np.empty(3), np.empty(3)
+    for phase in range(3):
+        x = reference[:, phase]
+        if len(np.unique(x)) > 1:
+            design = np.column_stack([x, np.ones_like(x)])
+            (slopes[phase], intercepts[phase]), *_ = np.linalg.lstsq(design, measured[:, phase], rcond=None)
+        else:
+            (slopes[phase],), *_ = np.linalg.lstsq(x[:, None], measured[:, phase], rcond=None)
+            intercepts[phase] = 0.0
+    residual = measured - (reference * slopes + intercepts)
+    return FitResult(slopes, intercepts, np.sqrt((residual ** 2).mean(axis=0)),
+                     np.abs(residual).max(axis=0), len(np.unique(reference, axis=0)))
+
+
+class CalibrationEngine:
+    """
+    Multi-point statistical calibration for the ATM90E3x.
+
+    For each reference load the operator applies, capture() takes `samples`
+    burst reads of Urms/Irms/Pmean including their LSB words. fit() then
+    solves gain and offset for U, I and P per phase with vectorised least
+    squares and reports residuals. apply() turns the fit into new gain and
+    offset register values relative to the values currently loaded, and
+    writes all of them in one verified CfgRegAccEn session.
+    """
+
+    def __init__(self, meter, samples=50, interval=0.05):
+        self.meter = meter
+        self.samples = samples
+        self.interval = interval
+        self._batch = read_batch(MEASUREMENT_DECODER.addresses)
+        self._points = []  # (reference dict of (3,) arrays, measured dict of (samples, 3) arrays)
+
+    def capture(self, voltage=None, current=None, power=None):
+        """
+        Capture one reference point. Each reference may be a scalar (all
+        phases) or a per-phase (A, B, C) sequence; omit quantities that the
+        reference meter does not provide.
+        """
+        words = np.empty((self.samples, len(MEASUREMENT_DECODER.addresses)), dtype=np.uint16)
+        for n in range(self.samples):
+            words[n] = self.meter.transfer_batch(self._batch)
+            if self.interval and n < self.samples - 1:
+                time.sleep(self.interval)
+
+        reference = {}
+        for quantity, value in zip(QUANTITIES, (voltage, current, power)):
+            if value is not None:
+                reference[quantity] = np.broadcast_to(np.asarray(value, dtype=np.float64), (3,))
+        measured = decode_measurements(words)
+        self._points.append((reference, measured))
+        logging.info("Captured calibration point %d: %s", len(self._points),
+                     {q: r.tolist() for q, r in reference.items()})
+        return measured
+
+    def clear(self):
+        self._points = []
+
+    def fit(self):
+        """Return {quantity: FitResult} for every quantity with reference data."""
+        results = {}
+        for quantity in QUANTITIES:
+            references, measurements = [], []
+            for reference, measured in self._points:
+                if quantity in reference:
+                    values = measured[quantity]
+                    references.append(np.broadcast_to(reference[quantity], values.shape))
+                    measurements.append(values)
+            if references:
+                results[quantity] = fit_linear(np.concatenate(references), np.concatenate(measurements))
+        return results
+
+    def register_values(self, fits, current):
+        """
+        Compute new calibration register values.
+
+        Args:
+            fits (dict): output of fit().
+            current (dict): register name -> value currently loaded.
+
+        Raises:
+            ValueError: if a slope is not positive or a value does not fit
+                its register.
+        """
+        values = {}
+        for quantity, fit in fits.items():
+            unit = OFFSET_UNITS[quantity]
+            for index, phase in enumerate(PHASES):
+                gain_name, offset_name = CALIBRATION_REGISTERS[quantity][phase]
+                slope = fit.slope[index]
+                if slope <= 0:
+                    raise ValueError(f"Non-positive {quantity} slope on phase {phase}: {slope}")
+                if quantity == 'power':
+                    # PQGain is a signed correction: factor = 1 + PQGain / 2^15
+                    factor = (1 + _to_signed16(current[gain_name]) / 32768.0) / slope
+                    values[gain_name] = _register16(gain_name, round((factor - 1) * 32768), signed=True)
+                else:
+                    values[gain_name] = _register16(gain_name, round(current[gain_name] / slope), signed=False)
+                correction = round(fit.intercept[index] / slope / unit)
+                values[offset_name] = _register16(offset_name, _to_signed16(current[offset_name]) - correction,
+                                                  signed=True)
+        return values
+
+    def apply(self, fits=None):
+        """
+        Fit (unless given), compute and write all calibration registers in a
+        single verified CfgRegAccEn session.
+
+        Returns:
+            dict: register name -> value written.
+        """
+        fits = self.fit() if fits is None else fits
+        names = [name for quantity in fits for pair in CALIBRATION_REGISTERS[quantity].values() for name in pair]
+        addresses = resolve(names)
+        current = dict(zip(names, self.meter.transfer_batch(read_batch(addresses))))
+        values = self.register_values(fits, current)
+
+        with ConfigSession(self.meter) as session:
+            for name, address in zip(names, addresses):
+                session.write(address, values[name])
+
+        # Keep the driver's configuration profile in step with the chip
+        calibration = getattr(self.meter, 'calibration', None)
+        if calibration is not None:
+            calibration.update({address: values[name] for name, address in zip(names, addresses)})
+        logging.info("Calibration written: %s", {name: hex(value) for name, value in values.items()})
+        return values
+
+    def report(self, fits=None):
+        """Human-readable per-phase slope, intercept and residuals."""
+        fits = self.fit() if fits is None else fits
+        lines = []
+        for quantity, fit in fits.items():
+            for index, phase in enumerate(PHASES):
+                lines.append(f"{quantity:8s} {phase}: slope={fit.slope[index]:.5f} "
+                             f"intercept={fit.intercept[index]:+.4f} "
+                             f"residual_rms={fit.residual_rms[index]:.4f} max={fit.residual_max[index]:.4f}")
+        return "\n".join(lines)
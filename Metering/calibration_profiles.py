@@ -0,0 +1,144 @@
+import logging
+import os
+import re
+import socket
+import struct
+import zlib
+
+# File layout (little endian):
+#   header  : magic 'ACAL', u16 version, u16 register count
+#   identity: u16 length, UTF-8 device id
+#   entries : count x (u16 address, u16 value), sorted by address
+#   trailer : u32 CRC-32 of everything before it
+_MAGIC = b'ACAL'
+_VERSION = 2
+_HEADER = struct.Struct('<4sHH')
+_ID_LENGTH = struct.Struct('<H')
+_ENTRY = struct.Struct('<HH')
+_TRAILER = struct.Struct('<I')
+
+_SAFE_ID = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def default_device_id(spi_bus, spi_device):
+    """Identify a meter by host (Raspberry Pi CPU serial when available) and SPI chip select."""
+    host = None
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('Serial'):
+                    host = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    if not host:
+        host = socket.gethostname()
+    return f"{host}-spi{spi_bus}.{spi_device}"
+
+
+def encode_profile(registers, device_id=''):
+    """Encode {address: value} and the owning device id into the compact checksummed profile format."""
+    items = sorted(registers.items())
+    identity = device_id.encode('utf-8')
+    body = _HEADER.pack(_MAGIC, _VERSION, len(items)) + _ID_LENGTH.pack(len(identity)) + identity + \
+        b''.join(_ENTRY.pack(address, value & 0xFFFF) for address, value in items)
+    return body + _TRAILER.pack(zlib.crc32(body))
+
+
+def decode_profile_entry(data):
+    """
+    Decode and checksum-verify a profile.
+
+    Returns:
+        tuple: (device id, {address: value}).
+    """
+    if len(data) < _HEADER.size + _TRAILER.size:
+        raise ValueError("Calibration profile truncated")
+    magic, version, count = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError(f"Not a calibration profile (magic {magic!r})")
+    if version != _VERSION:
+        raise ValueError(f"Unsupported calibration profile version {version}")
+    offset = _HEADER.size
+    if len(data) < offset + _ID_LENGTH.size:
+        raise ValueError("Calibration profile truncated")
+    (length,) = _ID_LENGTH.unpack_from(data, offset)
+    offset += _ID_LENGTH.size
+    identity = data[offset:offset + length]
+    offset += length
+    size = offset + count * _ENTRY.size
+    if len(data) != size + _TRAILER.size:
+        raise ValueError("Calibration profile length mismatch")
+    (crc,) = _TRAILER.unpack_from(data, size)
+    if crc != zlib.crc32(data[:size]):
+        raise ValueError("Calibration profile checksum mismatch")
+    return identity.decode('utf-8'), dict(_ENTRY.iter_unpack(data[offset:size]))
+
+
+def decode_profile(data):
+    """Decode and checksum-verify a profile, returning {address: value}."""
+    return decode_profile_entry(data)[1]
+
+
+class ProfileStore:
+    """
+    Per-device calibration profiles, one small file per device identity in
+    `directory`. Files are written atomically and verified with CRC-32 on
+    load, so a corrupted profile falls back to the driver defaults instead
+    of loading bad gains.
+    """
+
+    SUFFIX = '.cal'
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, device_id):
+        return os.path.join(self.directory, _SAFE_ID.sub('_', device_id) + self.SUFFIX)
+
+    def load(self, device_id):
+        """Return {address: value} for device_id, or None if absent or invalid."""
+        path = self.path(device_id)
+        try:
+            with open(path, 'rb') as f:
+                stored_id, registers = decode_profile_entry(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.error("Ignoring calibration profile %s: %s", path, e)
+            return None
+        if stored_id != device_id:
+            # Different ids can map to the same file name once sanitised
+            logging.error("Ignoring calibration profile %s: it belongs to %s, not %s", path, stored_id, device_id)
+            return None
+        return registers
+
+    def save(self, device_id, registers):
+        """Atomically write the profile for device_id."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(device_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(encode_profile(registers, device_id))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        logging.info("Saved calibration profile for %s (%d registers)", device_id, len(registers))
+
+    def devices(self):
+        """List the device ids that have a stored profile, as passed to save()."""
+        if not os.path.isdir(self.directory):
+            return []
+        devices = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as f:
+                    device_id, _ = decode_profile_entry(f.read())
+            except (OSError, ValueError) as e:
+                logging.error("Ignoring calibration profile %s: %s", path, e)
+                continue
+            devices.append(device_id)
+        return sorted(devices)
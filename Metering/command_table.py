@@ -0,0 +1,66 @@
+"""
+Precompiled SPI command table for every register in registers.py.
+
+The table is generated once at import: each register gets an immutable
+read frame and a write frame prefix, and names are resolved to addresses
+here rather than on every read. Hot paths index READ_FRAMES by address,
+which does no allocation or string hashing.
+"""
+from collections import namedtuple
+from types import MappingProxyType
+
+import registers
+from spi_batch import read_frame, write_frame
+
+RegisterCommand = namedtuple('RegisterCommand', ['name', 'address', 'read_frame', 'write_prefix'])
+
+ADDRESS_SPACE = 0x200  # covers 0x000-0x1FF, including PMConfig (0x10B)
+
+
+def _build_commands():
+    commands = {}
+    for name, address in vars(registers).items():
+        if name.startswith('_') or not isinstance(address, int):
+            continue
+        commands[name] = RegisterCommand(name, address, read_frame(address), write_frame(address, 0)[:2])
+    return commands
+
+
+# Register name -> RegisterCommand
+COMMANDS = MappingProxyType(_build_commands())
+
+# Register address -> RegisterCommand
+BY_ADDRESS = MappingProxyType({command.address: command for command in COMMANDS.values()})
+
+# Register name -> address
+ADDRESSES = MappingProxyType({name: command.address for name, command in COMMANDS.items()})
+
+# Read frame indexed by address, None for addresses not in registers.py
+READ_FRAMES = tuple(BY_ADDRESS[address].read_frame if address in BY_ADDRESS else None
+                    for address in range(ADDRESS_SPACE))
+
+# Write frame prefix (address bytes) indexed by address
+WRITE_PREFIXES = tuple(BY_ADDRESS[address].write_prefix if address in BY_ADDRESS else None
+                       for address in range(ADDRESS_SPACE))
+
+
+def get_read_frame(address):
+    """Return the read frame for an address, building one for unmapped addresses."""
+    frame = READ_FRAMES[address] if 0 <= address < ADDRESS_SPACE else None
+    return frame if frame is not None else read_frame(address)
+
+
+def get_write_frame(address, value):
+    """Return the write frame for an address and 16-bit value."""
+    prefix = WRITE_PREFIXES[address] if 0 <= address < ADDRESS_SPACE else None
+    if prefix is None:
+        return write_frame(address, value)
+    return prefix + ((value >> 8) & 0xFF, value & 0xFF)
+
+
+def resolve(names):
+    """Resolve register names to addresses, raising ValueError for unknown names."""
+    try:
+        return [ADDRESSES[name] for name in names]
+    except KeyError as e:
+        raise ValueError(f"Unknown register: {e.args[0]}") from e
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+from calibration_profiles import default_device_id
+from registers import CRCDigest, CRCErrStatus, EMMIntState0, EMMIntState1, EMMState0, EMMState1
+from spi_batch import SpiBatch, read_batch, write_frame
+
+
+def profile_hash(profile):
+    """Stable hash of a [(address, value), ...] configuration profile."""
+    digest = hashlib.sha1()
+    for address, value in profile:
+        digest.update(address.to_bytes(2, 'big') + (value & 0xFFFF).to_bytes(2, 'big'))
+    return digest.hexdigest()
+
+
+class ConfigManager:
+    """
+    Idempotent ATM90E3x configuration.
+
+    ensure() only rewrites the chip when its configuration differs from the
+    desired profile. The check is a single batched read of CRCDigest and
+    CRCErrStatus compared with the digest recorded after the last successful
+    write of the same profile to the same device; without a recorded digest
+    the profile registers are read back in one batch and compared. After a
+    rewrite, readiness is detected by polling EMMState0/1 instead of a fixed
+    sleep. Either way, ensure() finishes by clearing the EMMIntState0/1
+    flags, so interrupts latched before it do not fire as new events.
+
+    Recorded digests are kept per device_id in `state_path` (JSON) when
+    given, so the fast path also works across process restarts, and
+    meters sharing the file do not take each other's digests.
+    """
+
+    READY_POLL_S = 0.01
+    READY_TIMEOUT_S = 5.0
+
+    def __init__(self, meter, state_path=None, device_id=None):
+        self.meter = meter
+        self.state_path = state_path
+        self.device_id = device_id if device_id is not None else default_device_id(meter.spi_bus, meter.spi_device)
+        digests = self._load_state().get(self.device_id)
+        self._digests = digests if isinstance(digests, dict) else {}
+        self._status_batch = read_batch([CRCDigest, CRCErrStatus])
+        self._state_batch = read_batch([EMMState0, EMMState1])
+        self._clear_batch = SpiBatch([write_frame(EMMIntState0, 0xFFFF), write_frame(EMMIntState1, 0xFFFF)])
+
+    def _load_state(self):
+        if self.state_path is None or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable config state %s: %s", self.state_path, e)
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    def _save_state(self):
+        if self.state_path is None:
+            return
+        # Other meters may share the file: keep their entries
+        state = {device: digests for device, digests in self._load_state().items() if isinstance(digests, dict)}
+        state[self.device_id] = self._digests
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def read_status(self):
+        """Return (CRCDigest, CRCErrStatus)."""
+        digest, crc_error = self.meter.transfer_batch(self._status_batch)
+        return digest, crc_error
+
+    def diff(self, profile):
+        """Read back the profile registers and return {address: (expected, actual)} mismatches."""
+        addresses = [address for address, _ in profile]
+        actual = self.meter.transfer_batch(read_batch(addresses))
+        return {address: (value, word) for (address, value), word in zip(profile, actual) if word != value}
+
+    def matches(self, profile):
+        """Return True when the chip already holds `profile`."""
+        key = profile_hash(profile)
+        digest, crc_error = self.read_status()
+        if crc_error:
+            logging.info("Configuration CRC error flagged (0x%04X)", crc_error)
+            return False
+        if self._digests.get(key) == digest:
+            return True
+        if self.diff(profile):
+            return False
+        # Registers match but the digest was not recorded yet
+        self._digests[key] = digest
+        self._save_state()
+        return True
+
+    def clear_interrupts(self):
+        """Clear every EMMIntState0/1 flag (write-1-to-clear)."""
+        self.meter.transfer_batch(self._clear_batch)
+
+    def ensure(self, profile, apply):
+        """
+        Make sure the chip holds `profile`, calling `apply()` only if it does
+        not, then clear the interrupt flags.
+
+        Returns:
+            bool: True if the configuration was rewritten.
+        """
+        start = time.monotonic()
+        if self.matches(profile):
+            self.clear_interrupts()
+            logging.info("Configuration already applied, skipping rewrite (%.1f ms)",
+                         (time.monotonic() - start) * 1000)
+            return False
+
+        apply()
+        self.wait_ready()
+        digest, crc_error = self.read_status()
+        if crc_error:
+            raise RuntimeError(f"Configuration CRC error after write (0x{crc_error:04X})")
+        self._digests[profile_hash(profile)] = digest
+        self._save_state()
+        self.clear_interrupts()
+        logging.info("Configuration written in %.1f ms", (time.monotonic() - start) * 1000)
+        return True
+
+    def wait_ready(self, timeout=READY_TIMEOUT_S):
+        """
+        Poll EMMState0/1 until the chip reports a stable state.
+
+        The state words must read the same on two consecutive polls and not
+        be 0xFFFF (floating bus while the chip is still in reset).
+        """
+        deadline = time.monotonic() + timeout
+        previous = None
+        while True:
+            state = tuple(self.meter.transfer_batch(self._state_batch))
+            if state == previous and 0xFFFF not in state:
+                return state
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"Metering not ready after {timeout:.1f} s (EMMState {state})")
+            previous = state
+            time.sleep(self.READY_POLL_S)
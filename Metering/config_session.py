@@ -0,0 +1,142 @@
+import logging
+import time
+
+from command_table import BY_ADDRESS
+from descriptors import DESCRIPTORS, READ_WRITE, WRITE
+from registers import CfgRegAccEn, EMMIntState0, EMMIntState1, LastSPIData
+from spi_batch import SpiBatch, read_batch, read_frame, write_frame
+
+READBACK = 'readback'
+ECHO = 'echo'
+
+# Write-1-to-clear status registers: writable, but never read back as written
+_WRITE_ONE_TO_CLEAR = frozenset([EMMIntState0, EMMIntState1])
+
+_ACCESS = {d.address: d.access for d in DESCRIPTORS.values()}
+
+
+class ConfigVerifyError(RuntimeError):
+    """Raised when a configuration session does not verify; `diff` holds the mismatches."""
+
+    def __init__(self, diff):
+        self.diff = diff
+        super().__init__(f"Configuration verify failed for {len(diff)} register(s): {format_diff(diff)}")
+
+
+def format_diff(diff):
+    """Render {address: (expected, actual)} with register names."""
+    parts = []
+    for address, (expected, actual) in sorted(diff.items()):
+        command = BY_ADDRESS.get(address)
+        name = command.name if command is not None else f'0x{address:03X}'
+        parts.append(f"{name} expected 0x{expected:04X} got 0x{actual:04X}")
+    return ', '.join(parts)
+
+
+class ConfigSession:
+    """
+    Queue register writes and submit them as one batched SPI sequence.
+
+    commit() sends CfgRegAccEn unlock, every queued write and the re-lock in
+    a single batch, then verifies:
+
+    - 'readback': a second batch reads every verifiable register back and
+      compares it with the last value queued for it.
+    - 'echo': a LastSPIData read follows each write in the same batch,
+      confirming the chip received each word (no second pass, but it does
+      not prove the register latched).
+
+    Status registers that are write-1-to-clear, and write-only registers
+    such as SoftReset, are written but not verified.
+
+    Used as a context manager, the session commits on a clean exit and
+    raises ConfigVerifyError if verification fails.
+    """
+
+    def __init__(self, meter, verify=READBACK, unlock=True):
+        if verify not in (READBACK, ECHO, None):
+            raise ValueError(f"Unknown verify mode: {verify}")
+        self.meter = meter
+        self.verify = verify
+        self.unlock = unlock
+        self._writes = []
+        self.diff = {}
+        self.elapsed_s = 0.0
+
+    def write(self, address, value):
+        """Queue one register write."""
+        access = _ACCESS.get(address)
+        if access is not None and access not in (READ_WRITE, WRITE):
+            raise ValueError(f"Register 0x{address:03X} is not writable")
+        self._writes.append((address, value & 0xFFFF))
+
+    def write_many(self, pairs):
+        """Queue (address, value) pairs in order."""
+        for address, value in pairs:
+            self.write(address, value)
+
+    def __len__(self):
+        return len(self._writes)
+
+    def _expected(self):
+        expected = {}
+        for address, value in self._writes:
+            if _ACCESS.get(address) == READ_WRITE and address not in _WRITE_ONE_TO_CLEAR \
+                    and address != CfgRegAccEn:
+                expected[address] = value
+        return expected
+
+    def commit(self):
+        """
+        Submit the queued writes and verify them.
+
+        Returns:
+            dict: {address: (expected, actual)} for registers that did not
+            verify; empty when everything landed.
+        """
+        writes = list(self._writes)
+        if self.unlock:
+            writes = [(CfgRegAccEn, 0x55AA)] + writes + [(CfgRegAccEn, 0x0000)]
+        if not writes:
+            return {}
+
+        start = time.monotonic()
+        diff = {}
+        if self.verify == ECHO:
+            frames = [frame for address, value in writes for frame in (write_frame(address, value),
+                                                                        read_frame(LastSPIData))]
+            words = self.meter.transfer_batch(SpiBatch(frames))
+            for (address, value), echo in zip(writes, words[1::2]):
+                if echo != value:
+                    diff[address] = (value, echo)
+        else:
+            self.meter.transfer_batch(SpiBatch([write_frame(address, value) for address, value in writes]))
+            expected = self._expected()
+            if self.verify == READBACK and expected:
+                actual = self.meter.transfer_batch(read_batch(list(expected)))
+                diff = {address: (value, word) for (address, value), word in zip(expected.items(), actual)
+                        if word != value}
+
+        self.elapsed_s = time.monotonic() - start
+        self.diff = diff
+        self._writes = []
+        monitor = getattr(self.meter, 'reset_monitor', None)
+        if monitor is not None:
+            # The configuration digest changed on purpose; take the new one as the baseline now
+            monitor.rearm()
+        if diff:
+            logging.error("Configuration verify failed: %s", format_diff(diff))
+        else:
+            logging.info("Configuration session wrote %d registers in %.1f ms", len(writes), self.elapsed_s * 1000)
+        return diff
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            return False
+        diff = self.commit()
+        if diff:
+            raise ConfigVerifyError(diff)
+        return False
@@ -0,0 +1,195 @@
+"""
+Typed register descriptors for every register in registers.py.
+
+Each descriptor records how a register is decoded: data width, signedness,
+scale to engineering units, unit, the paired lower-word register and the
+access mode. RegisterDecoder compiles any list of register names into one
+SPI read batch plus index arrays, so a whole set of registers is read in a
+single transfer and decoded to floats in one vectorised step.
+
+Widths:
+    16  one register word
+    24  RMS pair: the LSB register's bits 15:8 extend the word by 8
+        fractional bits (value = msb + (lsb >> 8) / 256)
+    32  power pair: high word and low word form one 32-bit value
+"""
+from collections import namedtuple
+from types import MappingProxyType
+
+import numpy as np
+
+from command_table import ADDRESSES
+from energy import ENERGY_LSB_KWH
+from spi_batch import read_batch
+
+# Access modes
+READ = 'r'
+WRITE = 'w'
+READ_WRITE = 'rw'
+READ_CLEAR = 'rc'  # energy registers clear on read
+
+RegisterDescriptor = namedtuple('RegisterDescriptor',
+                                ['name', 'address', 'width', 'signed', 'scale', 'unit', 'lsb', 'access'])
+
+PHASES = ('A', 'B', 'C')
+CHANNELS = ('T',) + PHASES
+
+
+def sign_extend16(words):
+    """Reinterpret an array of raw 16-bit words as signed."""
+    return np.asarray(words, dtype=np.uint16).view(np.int16)
+
+
+def combine32(high, low, signed=True):
+    """Recombine high/low 16-bit word arrays into 32-bit values."""
+    value = (np.asarray(high, dtype=np.uint32) << 16) | np.asarray(low, dtype=np.uint32)
+    return value.view(np.int32) if signed else value
+
+
+def combine24(msb, lsb):
+    """Extend RMS words with the 8 fractional bits in bits 15:8 of their LSB registers."""
+    return np.asarray(msb, dtype=np.uint16) + (np.asarray(lsb, dtype=np.uint16) >> 8) / 256.0
+
+
+def _measurements():
+    """(name, width, signed, scale, unit, lsb) for every decoded measurement register."""
+    # Register LSBs from the ATM90E32 datasheet; everything else reads these scales from DESCRIPTORS
+    voltage, current, power, angle, frequency, thd, power_factor = 0.01, 0.001, 0.00032, 0.1, 0.01, 0.01, 0.001
+    specs = []
+    for p in PHASES:
+        specs.append((f'Urms{p}', 24, False, voltage, 'V', f'Urms{p}LSB'))
+        specs.append((f'Irms{p}', 24, False, current, 'A', f'Irms{p}LSB'))
+        specs.append((f'THDNU{p}', 16, False, thd, '%', None))
+        specs.append((f'THDNI{p}', 16, False, thd, '%', None))
+        specs.append((f'PAngle{p}', 16, True, angle, 'deg', None))
+        specs.append((f'Uangle{p}', 16, False, angle, 'deg', None))
+    specs.append(('IrmsN', 16, False, current, 'A', None))
+    for c in CHANNELS:
+        specs.append((f'Pmean{c}', 32, True, power, 'W', f'Pmean{c}LSB'))
+        specs.append((f'Qmean{c}', 32, True, power, 'var', f'Qmean{c}LSB'))
+        specs.append((f'Pmean{c}F', 32, True, power, 'W', f'Pmean{c}FLSB'))
+        specs.append((f'Pmean{c}H', 32, True, power, 'W', f'Pmean{c}HLSB'))
+        specs.append((f'PFmean{c}', 16, True, power_factor, '', None))
+    specs.append(('SmeanT', 32, True, power, 'VA', 'SAmeanTLSB'))
+    for p in PHASES:
+        specs.append((f'Smean{p}', 32, True, power, 'VA', f'Smean{p}LSB'))
+    specs.append(('Freq', 16, False, frequency, 'Hz', None))
+    specs.append(('Temp', 16, True, 1.0, 'degC', None))
+    return specs
+
+
+# Offsets and phase/gain corrections are two's complement
+_SIGNED_CONFIG = frozenset(
+    [f'{q}offset{p}' for q in 'PQUI' for p in PHASES] + ['IoffsetN'] +
+    [f'POffset{p}F' for p in PHASES] + [f'PQGain{p}' for p in PHASES] + [f'Phi{p}' for p in PHASES])
+
+_READ_ONLY = frozenset(['EMMState0', 'EMMState1', 'LastSPIData', 'CRCErrStatus', 'CRCDigest',
+                        'PMIrmsA', 'PMIrmsB', 'PMIrmsC', 'PMIrmsLSB'])
+
+
+def _build_descriptors():
+    descriptors = {}
+    for name, address in ADDRESSES.items():
+        if 0x80 <= address <= 0xAF:
+            access, scale, unit = READ_CLEAR, ENERGY_LSB_KWH, 'kWh'
+        elif address >= 0xB0 or name in _READ_ONLY:
+            access, scale, unit = READ, 1.0, ''
+        elif name == 'SoftReset':
+            access, scale, unit = WRITE, 1.0, ''
+        else:
+            access, scale, unit = READ_WRITE, 1.0, ''
+        descriptors[name] = RegisterDescriptor(name, address, 16, name in _SIGNED_CONFIG, scale, unit, None, access)
+
+    for name, width, signed, scale, unit, lsb in _measurements():
+        descriptors[name] = descriptors[name]._replace(width=width, signed=signed, scale=scale, unit=unit, lsb=lsb)
+    return descriptors
+
+
+# Register name -> RegisterDescriptor
+DESCRIPTORS = MappingProxyType(_build_descriptors())
+
+
+def describe(name):
+    """Return the descriptor for a register name, raising ValueError for unknown names."""
+    try:
+        return DESCRIPTORS[name]
+    except KeyError as e:
+        raise ValueError(f"Unknown register: {name}") from e
+
+
+class RegisterDecoder:
+    """
+    Read and decode an arbitrary set of registers in one batch.
+
+    The transfer order is the requested registers, each followed by its
+    paired LSB register when it has one (for 24-bit RMS registers only if
+    `extended`). decode() turns raw words of shape (words,) or
+    (samples, words) into float values of shape (registers,) or
+    (samples, registers), in request order.
+    """
+
+    def __init__(self, names, extended=True):
+        self.names = tuple(names)
+        self.descriptors = tuple(describe(name) for name in self.names)
+
+        addresses = []
+        plain, signed, fraction, paired = [], [], [], []
+        for column, d in enumerate(self.descriptors):
+            position = len(addresses)
+            addresses.append(d.address)
+            if d.width == 32 or (d.width == 24 and extended):
+                addresses.append(describe(d.lsb).address)
+                (paired if d.width == 32 else fraction).append((column, position, position + 1))
+            elif d.signed:
+                signed.append((column, position))
+            else:
+                plain.append((column, position))
+
+        self.addresses = tuple(addresses)
+        self.scales = np.array([d.scale for d in self.descriptors], dtype=np.float64)
+        self.units = tuple(d.unit for d in self.descriptors)
+        self._plain = self._index(plain, 2)
+        self._signed = self._index(signed, 2)
+        self._fraction = self._index(fraction, 3)
+        self._paired = self._index(paired, 3)
+        self._paired_signed = np.array([self.descriptors[c].signed for c, _, _ in paired], dtype=bool)
+        self._batch = None
+
+    @staticmethod
+    def _index(entries, width):
+        return np.array(entries, dtype=np.intp).reshape(-1, width).T
+
+    @property
+    def batch(self):
+        """The spi_batch.SpiBatch reading self.addresses, built on first use."""
+        if self._batch is None:
+            self._batch = read_batch(self.addresses)
+        return self._batch
+
+    def decode(self, words):
+        words = np.asarray(words, dtype=np.uint16)
+        single = words.ndim == 1
+        words = np.atleast_2d(words)
+        values = np.empty((len(words), len(self.names)), dtype=np.float64)
+
+        columns, positions = self._plain
+        values[:, columns] = words[:, positions]
+        columns, positions = self._signed
+        values[:, columns] = sign_extend16(words[:, positions])
+        columns, msb, lsb = self._fraction
+        values[:, columns] = combine24(words[:, msb], words[:, lsb])
+        columns, high, low = self._paired
+        if len(columns):
+            combined = combine32(words[:, high], words[:, low], signed=False)
+            values[:, columns] = np.where(self._paired_signed, combined.view(np.int32), combined)
+
+        values *= self.scales
+        return values[0] if single else values
+
+    def as_dict(self, values):
+        """Map decoded values (one sample) to {name: value}."""
+        return dict(zip(self.names, values.tolist()))
+
+    def read(self, meter):
+        """Read every register through meter.transfer_batch() and return {name: value}."""
+        return self.as_dict(self.decode(meter.transfer_batch(self.batch)))
@@ -0,0 +1,326 @@
+"""
+In-memory ATM90E3x register-file emulator with a spidev.SpiDev interface.
+
+Pass `spi_factory=emulator.SpiDev` to the ATM90E3x drivers to run them, and
+anything built on them, on a machine without the chip, spidev or RPi.GPIO.
+"""
+import errno
+import math
+import random
+import threading
+import time
+
+import registers as reg
+from energy import ENERGY_LSB_KWH, ENERGY_REGISTERS
+from command_table import ADDRESSES
+
+ADDRESS_SPACE = 0x200
+
+# Configuration/calibration registers guarded by CfgRegAccEn
+PROTECTED_RANGES = ((0x00, 0x0F), (0x10, 0x1D), (0x31, 0x3A), (0x41, 0x4C), (0x51, 0x56), (0x61, 0x6E))
+CFG_ACCESS_KEY = 0x55AA
+SOFT_RESET_KEY = 0x789A
+
+# Measurement registers are recomputed from the waveform at most this often
+UPDATE_INTERVAL_S = 0.01
+
+# Power-on defaults that differ from zero (ATM90E32 datasheet)
+RESET_DEFAULTS = {
+    reg.ChannelMapI: 0x0210,
+    reg.ChannelMapU: 0x0654,
+    reg.SagPeakDetCfg: 0x143F,
+    reg.OVth: 0xC000,
+    reg.SagTh: 0x1000,
+    reg.PhaseLossTh: 0x0400,
+    reg.INWarnTh: 0xFFFF,
+    reg.OIth: 0xC000,
+    reg.FreqLoTh: 0x1194,
+    reg.FreqHiTh: 0x13EC,
+    reg.PMPwrCtrl: 0x000F,
+    reg.PLconstH: 0x0861,
+    reg.PLconstL: 0xC468,
+    reg.MMode0: 0x0087,
+    reg.CfgRegAccEn: 0x0000,
+}
+
+PHASES = ('A', 'B', 'C')
+_PHASE_SHIFT = {'A': 0.0, 'B': -120.0, 'C': 120.0}
+_ENERGY_ADDRESSES = frozenset(ADDRESSES[name] for name in ENERGY_REGISTERS)
+
+
+def _is_protected(address):
+    return any(lo <= address <= hi for lo, hi in PROTECTED_RANGES)
+
+
+def config_crc(words):
+    """CRC-16/CCITT over the protected configuration registers, as the emulated CRCDigest."""
+    crc = 0xFFFF
+    for address in range(ADDRESS_SPACE):
+        if not _is_protected(address):
+            continue
+        for byte in ((words[address] >> 8) & 0xFF, words[address] & 0xFF):
+            crc ^= byte << 8
+            for _ in range(8):
+                crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+                crc &= 0xFFFF
+    return crc
+
+
+class Waveform:
+    """
+    Synthetic three-phase load.
+
+    Current follows `current` amps modulated by a slow sine of relative
+    depth `ripple` and period `ripple_period` seconds, so sampled streams
+    are not constant.
+    """
+
+    def __init__(self, voltage=230.0, current=16.0, power_factor=0.98, frequency=50.0,
+                 thd_voltage=1.5, thd_current=4.0, harmonic_ratio=0.02,
+                 ripple=0.05, ripple_period=60.0, temperature=35.0):
+        self.voltage = voltage
+        self.current = current
+        self.power_factor = power_factor
+        self.frequency = frequency
+        self.thd_voltage = thd_voltage
+        self.thd_current = thd_current
+        self.harmonic_ratio = harmonic_ratio
+        self.ripple = ripple
+        self.ripple_period = ripple_period
+        self.temperature = temperature
+
+    def phase_values(self, t, phase):
+        """Return (voltage, current, active, reactive, apparent) for a phase at time t."""
+        shift = math.radians(_PHASE_SHIFT[phase])
+        current = self.current * (1.0 + self.ripple * math.sin(2 * math.pi * t / self.ripple_period + shift))
+        apparent = self.voltage * current
+        active = apparent * self.power_factor
+        reactive = math.sqrt(max(apparent * apparent - active * active, 0.0))
+        return self.voltage, current, active, reactive, apparent
+
+
+def _split32(value):
+    value = int(round(value)) & 0xFFFFFFFF
+    return value >> 16, value & 0xFFFF
+
+
+def _split_rms(value, scale):
+    # MSB register holds value/scale, LSB register bits 15:8 hold the next 8 bits
+    raw = int(round(value / scale * 256)) & 0xFFFFFF
+    return (raw >> 8) & 0xFFFF, (raw & 0xFF) << 8
+
+
+class EmulatedATM90E3x:
+    """
+    Emulated ATM90E3x implementing the 4-byte frame protocol of
+    ATM90E3x._spi_transfer:
+
+    - read frame [0x80 | addr_hi, addr_lo, x, x] returns the word in bytes 2-3
+    - write frame [addr_hi, addr_lo, data_hi, data_lo]
+    - protected registers ignore writes unless CfgRegAccEn == 0x55AA
+    - SoftReset <- 0x789A restores power-on defaults
+    - EMMIntState0/1 are write-1-to-clear, energy registers clear on read
+    - LastSPIData holds the data word of the previous transfer
+    - measurement registers are refreshed from `waveform` on every read
+    """
+
+    def __init__(self, waveform=None, clock=time.monotonic):
+        self.waveform = waveform if waveform is not None else Waveform()
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.frames = 0
+        self._reset()
+
+    def _reset(self):
+        self.words = [0] * ADDRESS_SPACE
+        for address, value in RESET_DEFAULTS.items():
+            self.words[address] = value
+        self.words[reg.EMMState0] = 0
+        self.words[reg.EMMState1] = 0
+        self._energy = {address: 0.0 for address in _ENERGY_ADDRESSES}
+        self._last_energy_update = self.clock()
+        self._last_refresh = None
+        self._crc_dirty = True
+
+    def _update_crc(self):
+        if self._crc_dirty:
+            self.words[reg.CRCDigest] = config_crc(self.words)
+            self._crc_dirty = False
+
+    def _config_enabled(self):
+        return self.words[reg.CfgRegAccEn] == CFG_ACCESS_KEY
+
+    # Register file
+
+    def read(self, address):
+        """Return the value of a register, as seen by an SPI read."""
+        with self._lock:
+            if address in _ENERGY_ADDRESSES:
+                self._integrate_energy()
+                whole = min(int(self._energy[address]), 0xFFFF)
+                self._energy[address] -= whole
+                value = whole
+            else:
+                if address >= 0x80:
+                    self._refresh_measurements()
+                elif address == reg.CRCDigest:
+                    self._update_crc()
+                value = self.words[address]
+            if address != reg.LastSPIData:
+                self.words[reg.LastSPIData] = value
+            return value
+
+    def write(self, address, value):
+        """Apply an SPI write to the register file."""
+        value &= 0xFFFF
+        with self._lock:
+            self.words[reg.LastSPIData] = value
+            if address == reg.SoftReset:
+                if value == SOFT_RESET_KEY:
+                    self._reset()
+                return
+            if address in (reg.EMMIntState0, reg.EMMIntState1):
+                self.words[address] &= ~value & 0xFFFF
+                return
+            if _is_protected(address) and not self._config_enabled():
+                return
+            if address >= 0x80 or address in (reg.EMMState0, reg.EMMState1, reg.CRCDigest, reg.LastSPIData):
+                return  # read-only
+            self.words[address] = value
+            if _is_protected(address):
+                self._crc_dirty = True
+
+    def raise_interrupt(self, register, mask):
+        """Latch interrupt status bits, e.g. to exercise event handling."""
+        with self._lock:
+            self.words[register] |= mask & 0xFFFF
+
+    # Synthetic measurements
+
+    def _integrate_energy(self):
+        now = self.clock()
+        hours = (now - self._last_energy_update) / 3600.0
+        self._last_energy_update = now
+        if hours <= 0:
+            return
+        totals = [0.0, 0.0, 0.0]
+        for phase in PHASES:
+            _, _, active, reactive, apparent = self.waveform.phase_values(now, phase)
+            pulses = [abs(active) / 1000.0 * hours / ENERGY_LSB_KWH,
+                      abs(reactive) / 1000.0 * hours / ENERGY_LSB_KWH,
+                      apparent / 1000.0 * hours / ENERGY_LSB_KWH]
+            forward_active, forward_reactive = active >= 0, reactive >= 0
+            self._energy[ADDRESSES[f'APenergy{phase}' if forward_active else f'ANenergy{phase}']] += pulses[0]
+            self._energy[ADDRESSES[f'RPenergy{phase}' if forward_reactive else f'RNenergy{phase}']] += pulses[1]
+            self._energy[ADDRESSES[f'Senergy{phase}']] += pulses[2]
+            totals = [a + b for a, b in zip(totals, pulses)]
+        self._energy[reg.APenergyT] += totals[0]
+        self._energy[reg.RPenergyT] += totals[1]
+        self._energy[reg.SAenergyT] += totals[2]
+
+    def _refresh_measurements(self):
+        now = self.clock()
+        if self._last_refresh is not None and now - self._last_refresh < UPDATE_INTERVAL_S:
+            return
+        self._last_refresh = now
+        wave = self.waveform
+        w = self.words
+        sums = [0.0, 0.0, 0.0]
+        for phase in PHASES:
+            voltage, current, active, reactive, apparent = wave.phase_values(now, phase)
+            sums = [sums[0] + active, sums[1] + reactive, sums[2] + apparent]
+
+            msb, lsb = _split_rms(voltage, 0.01)
+            w[ADDRESSES[f'Urms{phase}']], w[ADDRESSES[f'Urms{phase}LSB']] = msb, lsb
+            msb, lsb = _split_rms(current, 0.001)
+            w[ADDRESSES[f'Irms{phase}']], w[ADDRESSES[f'Irms{phase}LSB']] = msb, lsb
+
+            for prefix, value in (('P', active), ('Q', reactive), ('S', apparent)):
+                hi, lo = _split32(value / 0.00032)
+                w[ADDRESSES[f'{prefix}mean{phase}']], w[ADDRESSES[f'{prefix}mean{phase}LSB']] = hi, lo
+            fundamental = active * (1.0 - wave.harmonic_ratio)
+            for suffix, value in (('F', fundamental), ('H', active - fundamental)):
+                hi, lo = _split32(value / 0.00032)
+                w[ADDRESSES[f'Pmean{phase}{suffix}']], w[ADDRESSES[f'Pmean{phase}{suffix}LSB']] = hi, lo
+
+            w[ADDRESSES[f'PFmean{phase}']] = int(round(wave.power_factor * 1000)) & 0xFFFF
+            w[ADDRESSES[f'THDNU{phase}']] = int(round(wave.thd_voltage * 100)) & 0xFFFF
+            w[ADDRESSES[f'THDNI{phase}']] = int(round(wave.thd_current * 100)) & 0xFFFF
+            w[ADDRESSES[f'PAngle{phase}']] = int(round(math.degrees(math.acos(wave.power_factor)) * 10)) & 0xFFFF
+            w[ADDRESSES[f'Uangle{phase}']] = int(round((_PHASE_SHIFT[phase] % 360) * 10)) & 0xFFFF
+
+        for prefix, value in zip(('P', 'Q', 'S'), sums):
+            hi, lo = _split32(value / 0.00032)
+            total = 'SAmeanTLSB' if prefix == 'S' else f'{prefix}meanTLSB'
+            w[ADDRESSES[f'{prefix}meanT']], w[ADDRESSES[total]] = hi, lo
+        fundamental = sums[0] * (1.0 - wave.harmonic_ratio)
+        for suffix, value in (('F', fundamental), ('H', sums[0] - fundamental)):
+            hi, lo = _split32(value / 0.00032)
+            w[ADDRESSES[f'PmeanT{suffix}']], w[ADDRESSES[f'PmeanT{suffix}LSB']] = hi, lo
+        w[reg.PFmeanT] = int(round(wave.power_factor * 1000)) & 0xFFFF
+        w[reg.Freq] = int(round(wave.frequency * 100)) & 0xFFFF
+        w[reg.Temp] = int(round(wave.temperature)) & 0xFFFF
+
+    # SPI frame protocol
+
+    def transfer(self, frame):
+        """Handle one 4-byte frame and return the 4 response bytes."""
+        if len(frame) != 4:
+            raise ValueError(f"Invalid frame length: {len(frame)}")
+        self.frames += 1
+        address = ((frame[0] & 0x7F) << 8) | frame[1]
+        if address >= ADDRESS_SPACE:
+            return [0, 0, 0, 0]
+        if frame[0] & 0x80:
+            value = self.read(address)
+            return [0, 0, value >> 8, value & 0xFF]
+        self.write(address, (frame[2] << 8) | frame[3])
+        return [0, 0, 0, 0]
+
+
+class SpiDev:
+    """
+    Drop-in replacement for spidev.SpiDev backed by an EmulatedATM90E3x.
+
+    With max_reliable_hz set, clocking faster than that flips random bits
+    in the returned data, more often the further the limit is exceeded,
+    to model a marginal board or cable. With fault_rate set, that
+    fraction of transfers fails with EIO before reaching the chip.
+    """
+
+    def __init__(self, device=None, max_reliable_hz=None, seed=None, fault_rate=None):
+        self.device = device if device is not None else EmulatedATM90E3x()
+        self.max_reliable_hz = max_reliable_hz
+        self.fault_rate = fault_rate
+        self._random = random.Random(seed)
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.bus = None
+        self.chip_select = None
+        self.opened = False
+
+    def open(self, bus, device):
+        self.bus = bus
+        self.chip_select = device
+        self.opened = True
+
+    def close(self):
+        self.opened = False
+
+    def xfer2(self, data):
+        if not self.opened:
+            raise OSError("SPI device not open")
+        if self.fault_rate and self._random.random() < self.fault_rate:
+            raise OSError(errno.EIO, "Emulated SPI fault")
+        response = []
+        for i in range(0, len(data), 4):
+            response.extend(self.device.transfer(data[i:i + 4]))
+        if self.max_reliable_hz and self.max_speed_hz > self.max_reliable_hz:
+            error_rate = min(1.0, (self.max_speed_hz / self.max_reliable_hz - 1.0) * 0.5)
+            for i in range(2, len(response), 4):
+                if self._random.random() < error_rate:
+                    bit = self._random.randrange(16)
+                    response[i + (bit >> 3)] ^= 1 << (bit & 7)
+        return response
+
+    xfer = xfer2
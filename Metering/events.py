@@ -0,0 +1,54 @@
+from collections import namedtuple
+
+from registers import EMMIntState0, EMMIntState1
+
+# Event kinds
+OVER_CURRENT = 'over_current'
+OVER_VOLTAGE = 'over_voltage'
+SAG = 'sag'
+PHASE_LOSS = 'phase_loss'
+FREQUENCY_HIGH = 'frequency_high'
+FREQUENCY_LOW = 'frequency_low'
+NEUTRAL_OVER_CURRENT = 'neutral_over_current'
+VOLTAGE_PHASE_SEQUENCE = 'voltage_phase_sequence'
+CURRENT_PHASE_SEQUENCE = 'current_phase_sequence'
+SAMPLE = 'sample'
+
+# A decoded meter event; phase is 'A'/'B'/'C' or None, data carries any payload
+MeterEvent = namedtuple('MeterEvent', ['kind', 'phase', 'timestamp', 'data'])
+
+# (register, bit) -> (kind, phase), from the ATM90E32 EMMIntState0/1 bit maps
+INTERRUPT_BITS = {
+    (EMMIntState0, 15): (OVER_CURRENT, 'A'),
+    (EMMIntState0, 14): (OVER_CURRENT, 'B'),
+    (EMMIntState0, 13): (OVER_CURRENT, 'C'),
+    (EMMIntState0, 12): (OVER_VOLTAGE, 'A'),
+    (EMMIntState0, 11): (OVER_VOLTAGE, 'B'),
+    (EMMIntState0, 10): (OVER_VOLTAGE, 'C'),
+    (EMMIntState0, 9): (VOLTAGE_PHASE_SEQUENCE, None),
+    (EMMIntState0, 8): (CURRENT_PHASE_SEQUENCE, None),
+    (EMMIntState0, 7): (NEUTRAL_OVER_CURRENT, None),
+    (EMMIntState1, 15): (SAG, 'A'),
+    (EMMIntState1, 14): (SAG, 'B'),
+    (EMMIntState1, 13): (SAG, 'C'),
+    (EMMIntState1, 12): (FREQUENCY_HIGH, None),
+    (EMMIntState1, 11): (PHASE_LOSS, 'A'),
+    (EMMIntState1, 10): (PHASE_LOSS, 'B'),
+    (EMMIntState1, 9): (PHASE_LOSS, 'C'),
+    (EMMIntState1, 8): (FREQUENCY_LOW, None),
+}
+
+_STATE0_BITS = tuple((1 << bit, event) for (reg, bit), event in INTERRUPT_BITS.items() if reg == EMMIntState0)
+_STATE1_BITS = tuple((1 << bit, event) for (reg, bit), event in INTERRUPT_BITS.items() if reg == EMMIntState1)
+
+
+def decode_interrupts(state0, state1, timestamp):
+    """Decode EMMIntState0/1 words into a list of MeterEvent records."""
+    events = []
+    if state0:
+        events.extend(MeterEvent(kind, phase, timestamp, None)
+                      for mask, (kind, phase) in _STATE0_BITS if state0 & mask)
+    if state1:
+        events.extend(MeterEvent(kind, phase, timestamp, None)
+                      for mask, (kind, phase) in _STATE1_BITS if state1 & mask)
+    return events
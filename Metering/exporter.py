@@ -0,0 +1,351 @@
+import json
+import logging
+import math
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+BINARY = 'binary'
+CSV = 'csv'
+
+# Binary file layout (little endian):
+#   header : magic 'MEXP', u16 version, u16 column count, u32 names length, names (utf-8, '\n' separated)
+#   chunks : magic 'MCHK', u32 samples, f64 first timestamp, f64 last timestamp, u32 payload length, payload
+# The zlib payload is columnar: timestamp deltas (f64) then each register
+# column as uint16 deltas, so slowly changing readings compress well.
+_FILE_MAGIC = b'MEXP'
+_FILE_VERSION = 1
+_FILE_HEADER = struct.Struct('<4sHHI')
+_CHUNK_MAGIC = b'MCHK'
+_CHUNK_HEADER = struct.Struct('<4sIddI')
+
+_SUFFIX = {BINARY: '.mex', CSV: '.csv'}
+INDEX_SUFFIX = '.index.json'
+
+
+def _encode_chunk(timestamps, words, level):
+    deltas = np.diff(timestamps, prepend=0.0)
+    columns = np.ascontiguousarray(words.T)
+    column_deltas = np.diff(columns, axis=1, prepend=np.zeros((len(columns), 1), dtype=np.uint16))
+    payload = zlib.compress(deltas.tobytes() + column_deltas.tobytes(), level)
+    return _CHUNK_HEADER.pack(_CHUNK_MAGIC, len(timestamps), timestamps[0], timestamps[-1], len(payload)) + payload
+
+
+def _decode_chunk(payload, samples, columns):
+    data = zlib.decompress(payload)
+    timestamps = np.cumsum(np.frombuffer(data, dtype=np.float64, count=samples))
+    deltas = np.frombuffer(data, dtype=np.uint16, offset=samples * 8).reshape(columns, samples)
+    # uint16 cumsum wraps modulo 2**16, undoing the wrapped differences
+    return timestamps, np.cumsum(deltas, axis=1, dtype=np.uint16).T
+
+
+def _file_state(path):
+    # Size and mtime recorded in the index, to spot files written after it was saved
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_file(path, start=-math.inf, end=math.inf):
+    """
+    Read samples with start <= timestamp < end from one export file.
+
+    Binary chunks outside the range are skipped by header without being
+    decompressed.
+
+    Returns:
+        tuple: (columns, timestamps, words) with words shaped (samples, columns).
+    """
+    if path.endswith(_SUFFIX[CSV]):
+        with open(path) as f:
+            columns = tuple(f.readline().strip().split(',')[1:])
+            data = np.loadtxt(f, delimiter=',', ndmin=2)
+        if not len(data):
+            return columns, np.empty(0), np.empty((0, len(columns)), dtype=np.uint16)
+        timestamps, words = data[:, 0], data[:, 1:].astype(np.uint16)
+        mask = (timestamps >= start) & (timestamps < end)
+        return columns, timestamps[mask], words[mask]
+
+    stamps, blocks = [], []
+    with open(path, 'rb') as f:
+        magic, version, count, names_length = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+        if magic != _FILE_MAGIC or version != _FILE_VERSION:
+            raise ValueError(f"Unsupported export file {path}: {magic!r} v{version}")
+        columns = tuple(f.read(names_length).decode('utf-8').split('\n'))
+        while True:
+            header = f.read(_CHUNK_HEADER.size)
+            if len(header) < _CHUNK_HEADER.size:
+                break  # end of file, or a chunk cut short by power loss
+            magic, samples, first, last, length = _CHUNK_HEADER.unpack(header)
+            if magic != _CHUNK_MAGIC:
+                raise ValueError(f"Corrupt chunk in {path}")
+            if last < start or first >= end:
+                f.seek(length, os.SEEK_CUR)
+                continue
+            payload = f.read(length)
+            if len(payload) < length:
+                break
+            timestamps, words = _decode_chunk(payload, samples, count)
+            mask = (timestamps >= start) & (timestamps < end)
+            stamps.append(timestamps[mask])
+            blocks.append(words[mask])
+
+    if not stamps:
+        return columns, np.empty(0), np.empty((0, len(columns)), dtype=np.uint16)
+    return columns, np.concatenate(stamps), np.concatenate(blocks)
+
+
+class SampleExporter:
+    """
+    Stream raw register samples to rolling files in `directory`.
+
+    Samples are staged in a preallocated NumPy block and written
+    `batch_size` at a time: as one compressed columnar chunk (binary) or as
+    a block of CSV rows (csv). fsync runs at most once per
+    `fsync_interval` seconds, and on rotation and close. A new file starts
+    at every `rotate_s` boundary of sample time. `<prefix>.index.json`
+    maps each file to its first/last timestamp so range queries only open
+    the files they need. The index is saved on every fsync; on start-up,
+    files that are not in it, or whose size or mtime changed since (e.g.
+    samples written after the last save before a crash), are rescanned.
+
+    append() takes the same (timestamp, words) item as RawSampleBuffer, so
+    the exporter can be a MeterSampler buffer with read=read_snapshot_raw;
+    pass monotonic=True there, since the sampler stamps samples with its
+    monotonic deadlines.
+    """
+
+    DEFAULT_ROTATE_S = 24 * 3600
+    DEFAULT_BATCH_SIZE = 60
+    DEFAULT_FSYNC_INTERVAL_S = 60.0
+
+    def __init__(self, directory, columns, rotate_s=DEFAULT_ROTATE_S, batch_size=DEFAULT_BATCH_SIZE,
+                 fsync_interval=DEFAULT_FSYNC_INTERVAL_S, format=BINARY, prefix='meter', monotonic=False,
+                 compression_level=6):
+        if format not in _SUFFIX:
+            raise ValueError(f"Unknown export format: {format}")
+        if batch_size <= 0 or rotate_s <= 0:
+            raise ValueError("batch_size and rotate_s must be positive")
+        self.directory = directory
+        self.columns = tuple(columns)
+        self.rotate_s = rotate_s
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.format = format
+        self.prefix = prefix
+        self.compression_level = compression_level
+        self._clock_offset = time.time() - time.monotonic() if monotonic else 0.0
+
+        self._lock = threading.Lock()
+        self._timestamps = np.zeros(batch_size, dtype=np.float64)
+        self._words = np.zeros((batch_size, len(self.columns)), dtype=np.uint16)
+        self._pending = 0
+        self._file = None
+        self._file_name = None
+        self._file_end = 0.0
+        self._dirty = False
+        self._last_sync = time.monotonic()
+        self.samples = 0
+        self.bytes_written = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, prefix + INDEX_SUFFIX)
+        self._index = {}
+        if self._load_index():
+            self._save_index()
+
+    # Index
+    # Entries are (first timestamp, last timestamp, samples, size, mtime_ns)
+
+    def _load_index(self):
+        """Load the saved index, rescanning stale entries. Returns True if it was stale."""
+        try:
+            with open(self._index_path) as f:
+                saved = {name: tuple(entry) for name, entry in json.load(f)['files'].items()}
+        except FileNotFoundError:
+            saved = {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.error("Rebuilding export index %s: %s", self._index_path, e)
+            saved = {}
+        self._index = self._scan_index(saved)
+        return self._index != saved
+
+    def _owns(self, name):
+        return name.startswith(f"{self.prefix}-") and name.endswith(_SUFFIX[self.format])
+
+    def _scan_index(self, saved=None):
+        saved = saved or {}
+        index = {}
+        for name in sorted(os.listdir(self.directory)):
+            if not self._owns(name):
+                continue
+            path = os.path.join(self.directory, name)
+            entry = saved.get(name)
+            try:
+                state = _file_state(path)
+                if entry is not None and len(entry) == 5 and entry[3:] == state:
+                    index[name] = entry
+                    continue
+                _, timestamps, _ = read_file(path)
+            except (OSError, ValueError) as e:
+                logging.error("Skipping unreadable export file %s: %s", name, e)
+                continue
+            if entry is not None:
+                logging.warning("Export file %s changed after the index was saved, rescanned", name)
+            if len(timestamps):
+                index[name] = (float(timestamps[0]), float(timestamps[-1]), len(timestamps)) + state
+        return index
+
+    def rebuild_index(self):
+        """Rescan every export file and rewrite the index."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            self._index = self._scan_index()
+            self._save_index()
+
+    def _save_index(self):
+        if self._file is not None and self._file_name in self._index:
+            # Callers flush first, so this is the size a reader will find on disk
+            stat = os.fstat(self._file.fileno())
+            self._index[self._file_name] = self._index[self._file_name][:3] + (stat.st_size, stat.st_mtime_ns)
+        tmp_path = f"{self._index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'columns': self.columns, 'format': self.format, 'prefix': self.prefix,
+                       'files': {name: list(entry) for name, entry in sorted(self._index.items())}}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._index_path)
+
+    # Writing
+
+    def append(self, item):
+        """Stage one (timestamp, words) sample, writing a batch when full."""
+        timestamp, words = item
+        with self._lock:
+            self._timestamps[self._pending] = timestamp + self._clock_offset
+            self._words[self._pending] = words
+            self._pending += 1
+            if self._pending == self.batch_size:
+                self._write_pending()
+
+    def extend(self, timestamps, words):
+        """Stage a block of samples."""
+        for item in zip(timestamps, words):
+            self.append(item)
+
+    def _open(self, timestamp):
+        self._close_file()
+        base = f"{self.prefix}-{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(timestamp))}"
+        suffix = _SUFFIX[self.format]
+        name, serial = base + suffix, 1
+        while os.path.exists(os.path.join(self.directory, name)):
+            name, serial = f"{base}~{serial}{suffix}", serial + 1
+        path = os.path.join(self.directory, name)
+
+        if self.format == BINARY:
+            self._file = open(path, 'wb')
+            names = '\n'.join(self.columns).encode('utf-8')
+            self._file.write(_FILE_HEADER.pack(_FILE_MAGIC, _FILE_VERSION, len(self.columns), len(names)) + names)
+        else:
+            self._file = open(path, 'w', newline='')
+            self._file.write(','.join(('timestamp',) + self.columns) + '\n')
+        self._file_name = name
+        self._file_end = (math.floor(timestamp / self.rotate_s) + 1) * self.rotate_s
+        logging.info("Exporting samples to %s", path)
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        self._sync()
+        self._file.close()
+        self._file = None
+        self._file_name = None
+
+    def _write_pending(self):
+        timestamps = self._timestamps[:self._pending]
+        words = self._words[:self._pending]
+        start = 0
+        while start < len(timestamps):
+            if self._file is None or timestamps[start] >= self._file_end:
+                self._open(timestamps[start])
+            # Split the batch at the rotation boundary
+            stop = start + int(np.searchsorted(timestamps[start:], self._file_end))
+            stop = max(stop, start + 1)
+            self._write_block(timestamps[start:stop], words[start:stop])
+            start = stop
+        self._pending = 0
+
+        if time.monotonic() - self._last_sync >= self.fsync_interval:
+            self._sync()
+
+    def _write_block(self, timestamps, words):
+        if self.format == BINARY:
+            data = _encode_chunk(timestamps, words, self.compression_level)
+            self._file.write(data)
+            self.bytes_written += len(data)
+        else:
+            lines = [f"{t:.3f}," + ','.join(map(str, row)) + '\n' for t, row in zip(timestamps, words.tolist())]
+            data = ''.join(lines)
+            self._file.write(data)
+            self.bytes_written += len(data)
+
+        first, _, count, size, mtime = self._index.get(self._file_name, (float(timestamps[0]), 0.0, 0, 0, 0))
+        self._index[self._file_name] = (first, float(timestamps[-1]), count + len(timestamps), size, mtime)
+        self.samples += len(timestamps)
+        self._dirty = True
+
+    def _sync(self):
+        if self._dirty and self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._save_index()
+            self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def flush(self, sync=True):
+        """Write any staged samples now, and fsync them unless sync is False."""
+        with self._lock:
+            if self._pending:
+                self._write_pending()
+            if sync:
+                self._sync()
+            elif self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        """Write staged samples, fsync and close the current file."""
+        with self._lock:
+            if self._pending:
+                self._write_pending()
+            self._close_file()
+
+    # Queries
+
+    def files(self, start=-math.inf, end=math.inf):
+        """List (path, first, last, samples) for indexed files overlapping [start, end)."""
+        with self._lock:
+            entries = sorted(self._index.items(), key=lambda item: item[1][0])
+        return [(os.path.join(self.directory, name), first, last, count)
+                for name, (first, last, count, _, _) in entries if last >= start and first < end]
+
+    def read_range(self, start=-math.inf, end=math.inf):
+        """
+        Return (timestamps, words) for exported samples with
+        start <= timestamp < end, oldest first. Staged samples are flushed
+        first.
+        """
+        self.flush(sync=False)
+        stamps, blocks = [], []
+        for path, _, _, _ in self.files(start, end):
+            columns, timestamps, words = read_file(path, start, end)
+            if columns != self.columns:
+                raise ValueError(f"Export file {path} has different columns")
+            stamps.append(timestamps)
+            blocks.append(words)
+        if not stamps:
+            return np.empty(0), np.empty((0, len(self.columns)), dtype=np.uint16)
+        return np.concatenate(stamps), np.concatenate(blocks)
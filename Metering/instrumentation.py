@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+
+# Per-register counter slots
+_READS, _WRITES, _ERRORS, _LATENCY, _MAX_LATENCY = range(5)
+
+# Per-batch counter slots
+_CALLS, _BATCH_ERRORS, _BATCH_LATENCY, _BATCH_MAX_LATENCY = range(4)
+
+
+class RateLimitedLogger:
+    """
+    Structured, rate-limited logging for hot paths.
+
+    Every call first checks isEnabledFor(), so a disabled level costs one
+    method call and no argument formatting. Messages are rate-limited per
+    key: at most one record per `interval` seconds, and the next record
+    that gets through reports how many were suppressed. Structured fields
+    go into the record's `extra` as `meter_fields`. The per-key state is
+    shared by the sampling, GPIO and caller threads, so it is guarded by a
+    lock; the record itself is emitted after the lock is released.
+    """
+
+    def __init__(self, logger=None, interval=1.0):
+        self.logger = logger if logger is not None else logging.getLogger()
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last = {}
+        self._suppressed = {}
+
+    def enabled(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level, key, msg, *args, **fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and now - last < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return
+            self._last[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            msg = f"{msg} (+{suppressed} suppressed)"
+        fields['key'] = key
+        self.logger.log(level, msg, *args, extra={'meter_fields': fields})
+
+    def debug(self, key, msg, *args, **fields):
+        self.log(logging.DEBUG, key, msg, *args, **fields)
+
+    def info(self, key, msg, *args, **fields):
+        self.log(logging.INFO, key, msg, *args, **fields)
+
+    def warning(self, key, msg, *args, **fields):
+        self.log(logging.WARNING, key, msg, *args, **fields)
+
+    def error(self, key, msg, *args, **fields):
+        self.log(logging.ERROR, key, msg, *args, **fields)
+
+
+class MeterStats:
+    """
+    Per-register read/write/error counts and latency, queryable at runtime.
+
+    Single-register transfers update the register's counters directly.
+    Batched transfers are counted once per batch and spread over their
+    registers only when registers() is queried, so the hot path does one
+    dict update per SPI submission whatever the batch size. Each frame of a
+    batch counts as a read or a write according to its command bit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._registers = {}
+        self._batches = {}
+        self.started = time.monotonic()
+
+    def record(self, address, write, latency, error=False):
+        with self._lock:
+            counters = self._registers.get(address)
+            if counters is None:
+                counters = self._registers[address] = [0, 0, 0, 0.0, 0.0]
+            counters[_WRITES if write else _READS] += 1
+            if error:
+                counters[_ERRORS] += 1
+            counters[_LATENCY] += latency
+            if latency > counters[_MAX_LATENCY]:
+                counters[_MAX_LATENCY] = latency
+
+    def record_batch(self, batch, latency, error=False):
+        """Count one submission of a spi_batch.SpiBatch."""
+        key = (batch.addresses, batch.writes)
+        with self._lock:
+            counters = self._batches.get(key)
+            if counters is None:
+                counters = self._batches[key] = [0, 0, 0.0, 0.0]
+            counters[_CALLS] += 1
+            if error:
+                counters[_BATCH_ERRORS] += 1
+            counters[_BATCH_LATENCY] += latency
+            if latency > counters[_BATCH_MAX_LATENCY]:
+                counters[_BATCH_MAX_LATENCY] = latency
+
+    def reset(self):
+        with self._lock:
+            self._registers = {}
+            self._batches = {}
+            self.started = time.monotonic()
+
+    def registers(self):
+        """
+        Return {address: counters}. Latency for batched reads is the batch
+        latency divided evenly over its registers.
+        """
+        merged = {}
+        with self._lock:
+            for address, (reads, writes, errors, latency, max_latency) in self._registers.items():
+                merged[address] = [reads, writes, errors, latency, max_latency]
+            for (addresses, writes), (calls, errors, latency, max_latency) in self._batches.items():
+                share = 1.0 / len(addresses)
+                for address, write in zip(addresses, writes):
+                    counters = merged.setdefault(address, [0, 0, 0, 0.0, 0.0])
+                    counters[_WRITES if write else _READS] += calls
+                    counters[_ERRORS] += errors
+                    counters[_LATENCY] += latency * share
+                    counters[_MAX_LATENCY] = max(counters[_MAX_LATENCY], max_latency * share)
+
+        report = {}
+        for address, (reads, writes, errors, latency, max_latency) in sorted(merged.items()):
+            ops = reads + writes
+            report[address] = {
+                'reads': reads,
+                'writes': writes,
+                'errors': errors,
+                'mean_latency_us': latency / ops * 1e6 if ops else 0.0,
+                'max_latency_us': max_latency * 1e6,
+            }
+        return report
+
+    def errors(self):
+        """Return {address: error count} for registers that have failed."""
+        return {address: c['errors'] for address, c in self.registers().items() if c['errors']}
+
+    def batches(self):
+        """Return per-batch counters keyed by the batch's register addresses."""
+        with self._lock:
+            return {addresses: {'calls': calls, 'writes': sum(writes), 'errors': errors,
+                                'mean_latency_us': latency / calls * 1e6 if calls else 0.0,
+                                'max_latency_us': max_latency * 1e6}
+                    for (addresses, writes), (calls, errors, latency, max_latency) in self._batches.items()}
@@ -0,0 +1,232 @@
+"""
+SPI clock autotuning for the ATM90E3x link.
+
+    python3 link_tuning.py --bus 0 --device 0 --state spi_speed.json
+
+Each candidate clock rate is exercised with batched reads of scratch
+registers loaded with known bit patterns, each followed by a read of
+LastSPIData, which must echo the word just transferred. The highest rate with zero errors,
+less a safety margin, is applied and persisted per device.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from calibration_profiles import default_device_id
+from command_table import resolve
+from config_session import ConfigSession
+from registers import LastSPIData
+from spi_batch import read_batch
+
+# Candidate clock rates, slowest first
+TUNE_RATES = (50000, 100000, 200000, 500000, 1000000, 2000000, 4000000, 8000000)
+
+# Power offset and gain registers used as scratch space during the sweep:
+# they only scale the power readings, and the saved values are written
+# back afterwards
+REFERENCE_REGISTERS = (
+    'PoffsetA', 'QoffsetA', 'PoffsetB', 'QoffsetB', 'PoffsetC', 'QoffsetC',
+    'POffsetAF', 'POffsetBF', 'POffsetCF', 'PGainAF', 'PGainBF', 'PGainCF',
+)
+
+# Loaded into REFERENCE_REGISTERS: every bit both set and clear, alternating
+# and run-length patterns, and the sign-boundary words
+REFERENCE_PATTERNS = (
+    0x0000, 0xFFFF, 0xAAAA, 0x5555, 0xCCCC, 0x3333,
+    0xF0F0, 0x0F0F, 0xFF00, 0x00FF, 0x8001, 0x7FFE,
+)
+
+DEFAULT_MARGIN = 0.25
+DEFAULT_BATCHES = 100
+
+# Outcome of testing one clock rate
+RateResult = namedtuple('RateResult', ['speed_hz', 'frames', 'mismatches', 'readback_errors', 'elapsed_s'])
+
+
+def load_tuned_speed(state_path, device_id, default=None):
+    """Return the persisted clock rate for device_id, or default."""
+    try:
+        with open(state_path) as f:
+            return json.load(f)[device_id]['speed_hz']
+    except (OSError, ValueError, KeyError, TypeError):
+        return default
+
+
+class LinkTuner:
+    """
+    Sweep SPI clock rates on a meter and pick the fastest reliable one.
+
+    The reference registers are loaded with REFERENCE_PATTERNS at the
+    slowest rate (their values are restored when the sweep ends), then read
+    back twice, and both reads must agree. Each rate then runs `batches` SPI batches that
+    interleave every reference register with LastSPIData, so every frame is
+    checked: the register word against its reference and the LastSPIData
+    word against the word before it. The sweep stops at the first rate
+    with any error.
+    """
+
+    def __init__(self, meter, rates=TUNE_RATES, batches=DEFAULT_BATCHES, margin=DEFAULT_MARGIN,
+                 state_path=None, device_id=None):
+        if not 0 <= margin < 1:
+            raise ValueError("margin must be in [0, 1)")
+        self.meter = meter
+        self.rates = tuple(sorted(rates))
+        self.batches = batches
+        self.margin = margin
+        self.state_path = state_path
+        self.device_id = device_id if device_id is not None else default_device_id(meter.spi_bus, meter.spi_device)
+        self._addresses = resolve(REFERENCE_REGISTERS)
+        self._batch = read_batch([a for address in self._addresses for a in (address, LastSPIData)])
+        self._saved = None
+        self.results = []
+
+    def _set_speed(self, speed_hz):
+        lock = getattr(self.meter, '_bus_lock', None)
+        if lock is not None:
+            with lock:
+                self.meter.spi.max_speed_hz = speed_hz
+        else:
+            self.meter.spi.max_speed_hz = speed_hz
+        self.meter.speed_hz = speed_hz
+
+    @contextmanager
+    def _patterns(self):
+        # Load the reference patterns for the duration of the block and restore the saved values after
+        if self._saved is not None:
+            yield
+            return
+        self._set_speed(self.rates[0])
+        self._saved = self.meter.transfer_batch(read_batch(self._addresses))
+        try:
+            with ConfigSession(self.meter) as session:
+                session.write_many(zip(self._addresses, REFERENCE_PATTERNS))
+            yield
+        finally:
+            saved, self._saved = self._saved, None
+            self._set_speed(self.rates[0])
+            with ConfigSession(self.meter) as session:
+                session.write_many(zip(self._addresses, saved))
+
+    def reference(self):
+        """Read the reference register values at the slowest rate."""
+        self._set_speed(self.rates[0])
+        first = self.meter.transfer_batch(self._batch)[0::2]
+        second = self.meter.transfer_batch(self._batch)[0::2]
+        if first != second:
+            raise RuntimeError(f"SPI link unreliable even at {self.rates[0]} Hz")
+        return first
+
+    def test_rate(self, speed_hz, reference):
+        """Run the verification batches at one clock rate."""
+        self._set_speed(speed_hz)
+        mismatches = readback_errors = 0
+        start = time.monotonic()
+        for _ in range(self.batches):
+            try:
+                words = self.meter.transfer_batch(self._batch)
+            except RuntimeError:
+                mismatches += len(reference)
+                continue
+            for i, expected in enumerate(reference):
+                value, echo = words[2 * i], words[2 * i + 1]
+                if value != expected:
+                    mismatches += 1
+                if echo != value:
+                    readback_errors += 1
+        result = RateResult(speed_hz, self.batches * self._batch.count, mismatches, readback_errors,
+                            time.monotonic() - start)
+        logging.info("SPI %d Hz: %d frames, %d mismatches, %d LastSPIData errors", speed_hz,
+                     result.frames, mismatches, readback_errors)
+        return result
+
+    def sweep(self):
+        """Test rates from slowest to fastest, stopping at the first failure."""
+        with self._patterns():
+            return self._sweep()
+
+    def _sweep(self):
+        reference = self.reference()
+        self.results = []
+        for speed_hz in self.rates:
+            result = self.test_rate(speed_hz, reference)
+            self.results.append(result)
+            if result.mismatches or result.readback_errors:
+                break
+        return self.results
+
+    def tune(self):
+        """
+        Sweep, apply the highest error-free rate less the margin, confirm it
+        and persist it.
+
+        Returns:
+            int: the clock rate now in use.
+        """
+        original = self.meter.speed_hz
+        try:
+            with self._patterns():
+                results = self._sweep()
+                passed = [r.speed_hz for r in results if not (r.mismatches or r.readback_errors)]
+                if not passed:
+                    raise RuntimeError("No SPI clock rate passed verification")
+                best = passed[-1]
+                chosen = max(self.rates[0], int(best * (1 - self.margin)))
+                confirm = self.test_rate(chosen, self.reference())
+                if confirm.mismatches or confirm.readback_errors:
+                    raise RuntimeError(f"SPI clock {chosen} Hz failed confirmation")
+        except Exception:
+            self._set_speed(original)
+            raise
+
+        self._set_speed(chosen)
+        logging.info("SPI clock tuned to %d Hz (highest error-free %d Hz, margin %.0f%%)",
+                     chosen, best, self.margin * 100)
+        if self.state_path is not None:
+            self.save(chosen, best)
+        return chosen
+
+    def save(self, speed_hz, max_ok_hz):
+        """Record the tuned rate for this device in state_path."""
+        state = {}
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path) as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning("Replacing unreadable SPI tuning state %s: %s", self.state_path, e)
+        state[self.device_id] = {'speed_hz': speed_hz, 'max_ok_hz': max_ok_hz, 'margin': self.margin,
+                                 'timestamp': time.time()}
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the fastest reliable SPI clock for an ATM90E3x.")
+    parser.add_argument('--bus', type=int, default=0)
+    parser.add_argument('--device', type=int, default=0)
+    parser.add_argument('--state', default='spi_speed.json', help="JSON file the tuned rate is saved to")
+    parser.add_argument('--batches', type=int, default=DEFAULT_BATCHES)
+    parser.add_argument('--margin', type=float, default=DEFAULT_MARGIN)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from Metering_1 import ATM90E3x
+
+    meter = ATM90E3x(spi_bus=args.bus, spi_device=args.device, speed_hz=TUNE_RATES[0])
+    try:
+        tuner = LinkTuner(meter, batches=args.batches, margin=args.margin, state_path=args.state)
+        print(tuner.tune())
+    finally:
+        meter.close()
+
+
+if __name__ == "__main__":
+    main()
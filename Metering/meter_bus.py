@@ -0,0 +1,203 @@
+import logging
+import threading
+import time
+
+from Metering_1 import GPIO, PINS, ATM90E3x, pulse_reset, setup_reset_pin
+from sampler import RingBuffer
+
+ROUND_ROBIN = 'round_robin'
+PRIORITY = 'priority'
+
+
+class MeterChannel:
+    """One meter on the bus with its own target rate and sample buffer."""
+
+    def __init__(self, name, meter, rate_hz, priority=0, capacity=600, read=None):
+        if rate_hz <= 0:
+            raise ValueError("Sample rate must be positive")
+        self.name = name
+        self.meter = meter
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self.priority = priority
+        self.read = read if read is not None else meter.read_snapshot
+        self.reset_monitor = getattr(meter, 'reset_monitor', None)
+        self.buffer = RingBuffer(capacity)
+        self.samples = 0
+        self.errors = 0
+        self.missed_deadlines = 0
+        self.next_deadline = 0.0
+        self.last_served = 0
+
+    def check_reset(self):
+        if self.reset_monitor is None:
+            return
+        try:
+            self.reset_monitor.poll()
+        except Exception as e:
+            logging.error("Reset check failed on meter %s: %s", self.name, e)
+
+    def stats(self, elapsed):
+        stats = {
+            'rate_hz': self.rate_hz,
+            'achieved_hz': self.samples / elapsed if elapsed else 0.0,
+            'samples': self.samples,
+            'errors': self.errors,
+            'missed_deadlines': self.missed_deadlines,
+        }
+        link_stats = getattr(self.meter, 'link_stats', None)
+        if link_stats is not None:
+            stats['link'] = link_stats()
+        return stats
+
+
+class MeterBus:
+    """
+    Owns one SPI bus and schedules reads across several ATM90E3x chips,
+    one per chip select.
+
+    All meters share the bus lock, and a single scheduler thread serves
+    whichever channels are due. In ROUND_ROBIN mode due channels are served
+    in least-recently-served order. In PRIORITY mode the lowest priority
+    number goes first. Deadlines follow the same monotonic schedule as
+    MeterSampler: missed deadlines are counted and skipped rather than
+    replayed in a burst. A meter whose link is down fails fast (see
+    transport.ResilientSpiDev), so it never holds up the other channels.
+
+    The chips share one hardware reset line, `reset_pin`. It is pulsed
+    once, before the first add_device(); after that each chip is only
+    reset with its own SoftReset write, so opening a meter never resets
+    the ones already configured. GPIO is released once, by close().
+    """
+
+    def __init__(self, spi_bus=ATM90E3x.DEFAULT_SPI_BUS, speed_hz=ATM90E3x.DEFAULT_SPEED_HZ, spi_factory=None,
+                 mode=ROUND_ROBIN, reset_pin=PINS['RST']):
+        if mode not in (ROUND_ROBIN, PRIORITY):
+            raise ValueError(f"Unknown scheduling mode: {mode}")
+        self.spi_bus = spi_bus
+        self.speed_hz = speed_hz
+        self.spi_factory = spi_factory
+        self.mode = mode
+        self.reset_pin = reset_pin
+        self._reset_done = False
+        self.lock = threading.RLock()
+        self.channels = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+        self._served = 0
+
+    def reset(self):
+        """Hard-reset every chip on the shared reset line."""
+        self._reset_done = True
+        if GPIO is None or self.reset_pin is None:
+            return
+        with self.lock:
+            setup_reset_pin(self.reset_pin)
+            pulse_reset(self.reset_pin)
+        logging.info("Bus %d reset on pin %d", self.spi_bus, self.reset_pin)
+
+    def add_device(self, name, spi_device, rate_hz, priority=0, **meter_kwargs):
+        """
+        Open an ATM90E3x on `spi_device` (chip select) and schedule it. Pass
+        reset_pin for a chip with its own reset line; chips without one are
+        soft reset, never through the shared line.
+        """
+        if name in self.channels:
+            raise ValueError(f"Duplicate meter name: {name}")
+        if not self._reset_done:
+            self.reset()
+        meter_kwargs.setdefault('reset_pin', None)
+        meter = ATM90E3x(spi_bus=self.spi_bus, spi_device=spi_device, speed_hz=self.speed_hz,
+                         spi_factory=self.spi_factory, bus_lock=self.lock, cleanup_gpio=False, **meter_kwargs)
+        return self.add_meter(name, meter, rate_hz, priority)
+
+    def add_meter(self, name, meter, rate_hz, priority=0, read=None):
+        """Schedule an already opened meter; it must have been created with bus_lock=self.lock."""
+        if name in self.channels:
+            raise ValueError(f"Duplicate meter name: {name}")
+        if getattr(meter, '_bus_lock', None) is not self.lock:
+            raise ValueError(f"Meter {name} does not share the bus lock; create it with bus_lock=bus.lock")
+        channel = MeterChannel(name, meter, rate_hz, priority, read=read)
+        self.channels[name] = channel
+        logging.info("Meter %s added to bus %d at %.1f Hz", name, self.spi_bus, rate_hz)
+        return channel
+
+    def _next_channel(self, now):
+        due = [channel for channel in self.channels.values() if channel.next_deadline <= now]
+        if not due:
+            return None
+        if self.mode == PRIORITY:
+            return min(due, key=lambda c: (c.priority, c.next_deadline))
+        return min(due, key=lambda c: (c.last_served, c.next_deadline))
+
+    def run(self, duration=None):
+        """Serve all channels until stopped, or for `duration` seconds."""
+        if not self.channels:
+            raise RuntimeError("No meters on the bus")
+        start = time.monotonic()
+        self._started = start
+        for channel in self.channels.values():
+            channel.next_deadline = start
+        end = start + duration if duration is not None else None
+
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if end is not None and now >= end:
+                break
+            channel = self._next_channel(now)
+            if channel is None:
+                wake = min(c.next_deadline for c in self.channels.values())
+                if end is not None:
+                    wake = min(wake, end)
+                if self._stop.wait(max(0.0, wake - now)):
+                    break
+                continue
+
+            deadline = channel.next_deadline
+            try:
+                sample = channel.read()
+            except Exception as e:
+                channel.errors += 1
+                logging.error("Read failed on meter %s: %s", channel.name, e)
+            else:
+                channel.buffer.append((deadline, sample))
+                channel.samples += 1
+                channel.check_reset()
+            self._served += 1
+            channel.last_served = self._served
+
+            late = time.monotonic() - deadline
+            skipped = int(late // channel.period)
+            channel.missed_deadlines += skipped
+            channel.next_deadline = deadline + (skipped + 1) * channel.period
+
+    def start(self):
+        """Start the scheduler on a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            raise RuntimeError("Meter bus already running")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="MeterBus", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the scheduler thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        """Report achieved sample rate and miss counters per meter."""
+        elapsed = time.monotonic() - self._started if self._started is not None else 0.0
+        return {name: channel.stats(elapsed) for name, channel in self.channels.items()}
+
+    def close(self):
+        """Stop scheduling, close every meter and release GPIO."""
+        self.stop()
+        try:
+            for channel in self.channels.values():
+                channel.meter.close()
+        finally:
+            if GPIO is not None:
+                GPIO.cleanup()
@@ -0,0 +1,111 @@
+import time
+
+import numpy as np
+
+from command_table import resolve
+from descriptors import RegisterDecoder
+from sample_buffer import RawSampleBuffer
+from spi_batch import read_batch
+
+PHASES = ('A', 'B', 'C')
+POWER_CHANNELS = ('T',) + PHASES
+
+THD_REGISTERS = tuple(f'THDNU{p}' for p in PHASES) + tuple(f'THDNI{p}' for p in PHASES)
+FUNDAMENTAL_REGISTERS = tuple(name for c in POWER_CHANNELS for name in (f'Pmean{c}F', f'Pmean{c}FLSB'))
+HARMONIC_REGISTERS = tuple(name for c in POWER_CHANNELS for name in (f'Pmean{c}H', f'Pmean{c}HLSB'))
+
+# Registers read on power-quality cycles, in transfer order
+PQ_REGISTERS = THD_REGISTERS + FUNDAMENTAL_REGISTERS + HARMONIC_REGISTERS
+
+# Scales, signedness and high/low pairing come from the register descriptors
+# (reads the same words as PQ_REGISTERS: each power register is followed by its LSB)
+_PQ_DECODER = RegisterDecoder(THD_REGISTERS + FUNDAMENTAL_REGISTERS[0::2] + HARMONIC_REGISTERS[0::2])
+
+
+def decode_pq(words):
+    """
+    Decode a (samples, len(PQ_REGISTERS)) block of raw words.
+
+    Returns:
+        dict: (samples, 3) THD arrays in percent, (samples, 4) fundamental
+        and harmonic active power in watts (total, A, B, C), and the
+        harmonic-to-fundamental power ratio per channel.
+    """
+    values = _PQ_DECODER.decode(np.atleast_2d(np.asarray(words, dtype=np.uint16)))
+    n_thd = len(THD_REGISTERS)
+    n_power = len(POWER_CHANNELS)
+
+    thd = values[:, :n_thd]
+    fundamental = values[:, n_thd:n_thd + n_power]
+    harmonic = values[:, n_thd + n_power:]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(fundamental != 0, harmonic / fundamental, 0.0)
+
+    return {
+        'thd_voltage': thd[:, :3],
+        'thd_current': thd[:, 3:],
+        'fundamental_power': fundamental,
+        'harmonic_power': harmonic,
+        'harmonic_ratio': ratio,
+    }
+
+
+class PowerQualityMonitor:
+    """
+    Piggy-back THD and fundamental/harmonic power reads on the regular
+    snapshot poll.
+
+    read() is meant to be the read function of a MeterSampler. Most calls
+    are a plain snapshot. Every `every`-th call reads the snapshot registers
+    and PQ_REGISTERS together in one SPI batch, so power-quality data costs
+    no extra bus round trip. The PQ words go into a NumPy ring buffer, and
+    ratios and rolling statistics are computed over whole arrays at query
+    time.
+    """
+
+    def __init__(self, meter, every=10, capacity=3600):
+        if every < 1:
+            raise ValueError("every must be at least 1")
+        self.meter = meter
+        self.every = every
+        self.buffer = RawSampleBuffer(capacity, PQ_REGISTERS)
+        self._snapshot_size = len(meter.SNAPSHOT_REGISTERS)
+        self._combined_batch = read_batch(
+            [meter.REGISTERS[name] for name in meter.SNAPSHOT_REGISTERS] + resolve(PQ_REGISTERS))
+        self._calls = 0
+
+    def read(self):
+        """Read a snapshot, adding the power-quality registers on every `every`-th call."""
+        self._calls += 1
+        if self._calls % self.every:
+            return self.meter.read_snapshot()
+
+        timestamp = time.time()
+        words = self.meter.transfer_batch(self._combined_batch)
+        self.buffer.append((timestamp, words[self._snapshot_size:]))
+        return self.meter.decode_snapshot(words[:self._snapshot_size], timestamp)
+
+    def latest(self):
+        """Return the most recent decoded power-quality record, or None."""
+        if not len(self.buffer):
+            return None
+        timestamps, words = self.buffer.raw(1)
+        record = {name: values[0] for name, values in decode_pq(words).items()}
+        record['timestamp'] = timestamps[0]
+        return record
+
+    def rolling_stats(self, n=None):
+        """Mean/min/max/std of every power-quality metric over the latest n records."""
+        timestamps, words = self.buffer.raw(n)
+        if not len(timestamps):
+            return {}
+        stats = {'samples': len(timestamps), 'start': timestamps[0], 'end': timestamps[-1]}
+        for name, values in decode_pq(words).items():
+            stats[name] = {
+                'mean': values.mean(axis=0),
+                'min': values.min(axis=0),
+                'max': values.max(axis=0),
+                'std': values.std(axis=0),
+            }
+        return stats
@@ -0,0 +1,244 @@
+import logging
+import math
+import queue
+import threading
+from collections import deque, namedtuple
+
+from config_session import ConfigSession
+from events import OVER_CURRENT, OVER_VOLTAGE, PHASE_LOSS, SAG, MeterEvent
+from registers import IgainA, OIth, OVth, PhaseLossTh, SagTh, UgainA
+
+PHASES = ('A', 'B', 'C')
+
+# Kinds handled by the detector; OVER_VOLTAGE is the swell event
+PQ_KINDS = (SAG, OVER_VOLTAGE, PHASE_LOSS, OVER_CURRENT)
+
+# A completed power-quality event. source is 'irq', 'software' or 'both';
+# value is the extreme RMS seen while detecting; pre and post are the
+# samples (Snapshots) around the detection point, oldest first.
+PQEvent = namedtuple('PQEvent', ['kind', 'phase', 'timestamp', 'source', 'value', 'pre', 'post'])
+
+
+def _peak_threshold(rms, lsb, gain):
+    # Threshold registers compare against the peak, in RMS register LSBs scaled by the channel gain
+    return min(max(int(math.ceil(rms / lsb * math.sqrt(2) / (2 * gain / 32768))), 0), 0xFFFF)
+
+
+class PQThresholds:
+    """
+    Power-quality limits in engineering units.
+
+    Voltage limits are fractions of the nominal voltage: sag and phase
+    loss below, swell (OVth) above. Events end once the reading is back
+    inside the limit by `hysteresis` x nominal.
+    """
+
+    def __init__(self, nominal_voltage=230.0, sag=0.9, swell=1.1, phase_loss=0.1, over_current=100.0,
+                 hysteresis=0.02):
+        self.nominal_voltage = nominal_voltage
+        self.sag = sag
+        self.swell = swell
+        self.phase_loss = phase_loss
+        self.over_current = over_current
+        self.hysteresis = hysteresis
+
+    @property
+    def sag_voltage(self):
+        return self.nominal_voltage * self.sag
+
+    @property
+    def swell_voltage(self):
+        return self.nominal_voltage * self.swell
+
+    @property
+    def phase_loss_voltage(self):
+        return self.nominal_voltage * self.phase_loss
+
+    def registers(self, ugain, igain):
+        """
+        Return the (register, value) pairs for SagTh, OVth, PhaseLossTh and
+        OIth, given the phase A voltage and current gain register values.
+        """
+        return [
+            (SagTh, _peak_threshold(self.sag_voltage, 0.01, ugain)),
+            (OVth, _peak_threshold(self.swell_voltage, 0.01, ugain)),
+            (PhaseLossTh, _peak_threshold(self.phase_loss_voltage, 0.01, ugain)),
+            (OIth, _peak_threshold(self.over_current, 0.001, igain)),
+        ]
+
+
+def program_thresholds(meter, thresholds, ugain=None, igain=None):
+    """
+    Write the threshold registers in one verified session. Gains default
+    to the values currently loaded in UgainA/IgainA.
+
+    Returns:
+        list: the (register, value) pairs written.
+    """
+    if ugain is None:
+        ugain = meter.read_register(UgainA)
+    if igain is None:
+        igain = meter.read_register(IgainA)
+    if not ugain or not igain:
+        raise ValueError("Voltage and current gains must be non-zero to compute thresholds")
+    values = thresholds.registers(ugain, igain)
+    with ConfigSession(meter) as session:
+        session.write_many(values)
+    logging.info("Power-quality thresholds written: %s", {hex(r): hex(v) for r, v in values})
+    return values
+
+
+class PQEventDetector:
+    """
+    Streaming sag / swell / phase-loss / over-current detection.
+
+    append() is a MeterSampler buffer: each Snapshot is checked against
+    the thresholds per phase, and a condition must hold for `confirm`
+    consecutive samples to raise an event (and be clear for `confirm`
+    samples to end it). handle_interrupt() is an ATM90E3x.enable_events()
+    callback: chip interrupt flags open the same events at once, and an
+    event seen by both paths is reported once with source 'both'.
+
+    on_detect is called with a MeterEvent as soon as an event is
+    detected, so latency is `confirm` sample periods (or the IRQ latency).
+    The full PQEvent, with `pre_samples` before and `post_samples` after
+    the detection, follows once the post window is filled; it is passed to
+    `callback` and queued for wait_event(). Both callbacks run after the
+    detector lock is released, so they may call back into the detector.
+    """
+
+    def __init__(self, thresholds=None, pre_samples=50, post_samples=50, confirm=2, callback=None,
+                 on_detect=None):
+        if confirm < 1:
+            raise ValueError("confirm must be at least 1")
+        self.thresholds = thresholds if thresholds is not None else PQThresholds()
+        self.pre_samples = pre_samples
+        self.post_samples = post_samples
+        self.confirm = confirm
+        self.callback = callback
+        self.on_detect = on_detect
+
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=pre_samples)
+        self._hits = {}
+        self._clear = {}
+        self._active = {}  # (kind, phase) -> pending record dict
+        self._pending = []  # records still collecting their post window
+        self._notify = []  # (callback name, callback, event) waiting for the lock to drop
+        self._events = queue.Queue()
+        self.detected = 0
+
+    # Inputs
+
+    def append(self, item):
+        """Check one (deadline, Snapshot) sampler item."""
+        self.update(item[1])
+
+    def update(self, snapshot):
+        """Check one Snapshot against the thresholds."""
+        t = self.thresholds
+        hysteresis = t.nominal_voltage * t.hysteresis
+        with self._lock:
+            for record in self._pending:
+                record['post'].append(snapshot)
+            self._complete()
+
+            for index, phase in enumerate(PHASES):
+                voltage = snapshot.voltage[index]
+                current = snapshot.current[index]
+                self._check(SAG, phase, voltage, voltage < t.sag_voltage,
+                            voltage > t.sag_voltage + hysteresis, snapshot, min)
+                self._check(OVER_VOLTAGE, phase, voltage, voltage > t.swell_voltage,
+                            voltage < t.swell_voltage - hysteresis, snapshot, max)
+                self._check(PHASE_LOSS, phase, voltage, voltage < t.phase_loss_voltage,
+                            voltage > t.phase_loss_voltage + hysteresis, snapshot, min)
+                self._check(OVER_CURRENT, phase, current, current > t.over_current,
+                            current < t.over_current * (1 - t.hysteresis), snapshot, max)
+            self._history.append(snapshot)
+            notify, self._notify = self._notify, []
+        self._dispatch(notify)
+
+    def handle_interrupt(self, event):
+        """Open an event from a chip interrupt (MeterEvent from Metering_1 event mode)."""
+        if event.kind not in PQ_KINDS:
+            return
+        with self._lock:
+            key = (event.kind, event.phase)
+            record = self._active.get(key)
+            if record is None:
+                self._open(key, event.timestamp, 'irq', None)
+            elif record['source'] == 'software':
+                record['source'] = 'both'
+            notify, self._notify = self._notify, []
+        self._dispatch(notify)
+
+    # Detection
+
+    def _check(self, kind, phase, value, triggered, cleared, snapshot, extreme):
+        key = (kind, phase)
+        record = self._active.get(key)
+        if record is None:
+            if not triggered:
+                self._hits[key] = 0
+                return
+            hits = self._hits.get(key, 0) + 1
+            self._hits[key] = hits
+            if hits >= self.confirm:
+                self._hits[key] = 0
+                self._open(key, snapshot.timestamp, 'software', value)
+            return
+
+        if record['source'] == 'irq':
+            record['source'] = 'both' if triggered else 'irq'
+        if triggered or not cleared:
+            record['value'] = value if record['value'] is None else extreme(record['value'], value)
+            self._clear[key] = 0
+            return
+        clear = self._clear.get(key, 0) + 1
+        self._clear[key] = clear
+        if clear >= self.confirm:
+            self._clear[key] = 0
+            del self._active[key]
+
+    def _open(self, key, timestamp, source, value):
+        kind, phase = key
+        record = {'kind': kind, 'phase': phase, 'timestamp': timestamp, 'source': source, 'value': value,
+                  'pre': list(self._history), 'post': []}
+        self._active[key] = record
+        self._pending.append(record)
+        self.detected += 1
+        if self.on_detect is not None:
+            self._notify.append(('detect', self.on_detect, MeterEvent(kind, phase, timestamp, value)))
+        self._complete()
+
+    def _complete(self):
+        while self._pending and len(self._pending[0]['post']) >= self.post_samples:
+            record = self._pending.pop(0)
+            event = PQEvent(record['kind'], record['phase'], record['timestamp'], record['source'],
+                            record['value'], record['pre'], record['post'])
+            self._events.put(event)
+            if self.callback is not None:
+                self._notify.append(('event', self.callback, event))
+
+    @staticmethod
+    def _dispatch(notify):
+        # Called with the lock released: a callback may use active() or update().
+        for name, callback, event in notify:
+            try:
+                callback(event)
+            except Exception as e:
+                logging.error("Power-quality %s callback failed for %s: %s", name, event.kind, e)
+
+    # Output
+
+    def active(self):
+        """Return the (kind, phase) pairs of events currently in progress."""
+        with self._lock:
+            return sorted(self._active)
+
+    def wait_event(self, timeout=None):
+        """Block until the next completed PQEvent, or return None after timeout seconds."""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
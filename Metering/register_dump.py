@@ -0,0 +1,217 @@
+"""
+Full ATM90E3x register-map dump and diff.
+
+    python3 register_dump.py dump --output meter-a.json
+    python3 register_dump.py diff meter-a.json meter-b.json
+    python3 register_dump.py diff meter-a.json --profile /var/lib/meter/profiles/meter-a.cal
+
+dump reads every register in registers.py in one batched SPI pass and
+writes a compact JSON snapshot. diff compares two snapshots, or a snapshot
+against a calibration profile (.cal) or a JSON {register: value} profile.
+By default only configuration, calibration and status registers
+(0x00-0x7F) are compared, since measurements always differ.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+
+from calibration_profiles import decode_profile, default_device_id
+from command_table import ADDRESSES, BY_ADDRESS
+from descriptors import DESCRIPTORS, READ_CLEAR
+from spi_batch import read_batch
+
+SNAPSHOT_FORMAT = 'atm90e3x-register-dump'
+SNAPSHOT_VERSION = 1
+
+# Configuration, calibration and status registers live below the energy block
+MEASUREMENT_BASE = 0x80
+
+# Every register in address order; read-to-clear energy registers are opt-in
+_ALL = tuple(sorted(ADDRESSES.values()))
+_NON_DESTRUCTIVE = tuple(a for a in _ALL if DESCRIPTORS[BY_ADDRESS[a].name].access != READ_CLEAR)
+
+
+class SpiReader:
+    """
+    Bare SPI handle with the drivers' transfer_batch() interface.
+
+    The ATM90E3x drivers reset the chip when they open it, which would
+    wipe the state being inspected, so dumps go through this instead.
+    """
+
+    def __init__(self, spi_bus=0, spi_device=0, speed_hz=200000, spi_factory=None):
+        if spi_factory is None:
+            import spidev
+            spi_factory = spidev.SpiDev
+        self.spi_bus = spi_bus
+        self.spi_device = spi_device
+        self.spi = spi_factory()
+        self.spi.open(spi_bus, spi_device)
+        self.spi.max_speed_hz = speed_hz
+        self.spi.mode = 0b00
+
+    def transfer_batch(self, batch):
+        return batch.words(self.spi)
+
+    def close(self):
+        self.spi.close()
+
+
+def dump_registers(meter, energy=False):
+    """
+    Read the register map in one batch.
+
+    Args:
+        energy (bool): Include the energy registers. They clear on read, so
+            this resets the chip's energy accumulation.
+
+    Returns:
+        dict: register name -> value, in address order.
+    """
+    addresses = _ALL if energy else _NON_DESTRUCTIVE
+    words = meter.transfer_batch(read_batch(addresses))
+    return {BY_ADDRESS[address].name: word for address, word in zip(addresses, words)}
+
+
+def snapshot(meter, energy=False, device_id=None):
+    """Dump the register map into a snapshot dict."""
+    start = time.monotonic()
+    registers = dump_registers(meter, energy)
+    elapsed = time.monotonic() - start
+    if device_id is None:
+        device_id = default_device_id(meter.spi_bus, meter.spi_device)
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'device': device_id,
+        'timestamp': time.time(),
+        'elapsed_ms': round(elapsed * 1000, 3),
+        'registers': registers,
+    }
+
+
+def save_snapshot(data, path):
+    with open(path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+
+
+def load_snapshot(path):
+    """Load a snapshot and return its {address: value} map."""
+    with open(path) as f:
+        data = json.load(f)
+    if data.get('format') != SNAPSHOT_FORMAT or data.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is not a register dump snapshot")
+    return _by_address(data['registers'], path)
+
+
+def load_profile(path):
+    """Load a calibration profile (.cal) or JSON {register name or address: value} as {address: value}."""
+    if path.endswith('.cal'):
+        with open(path, 'rb') as f:
+            return decode_profile(f.read())
+    with open(path) as f:
+        return _by_address(json.load(f), path)
+
+
+def _by_address(registers, path):
+    values = {}
+    for key, value in registers.items():
+        if key in ADDRESSES:
+            address = ADDRESSES[key]
+        else:
+            try:
+                address = int(key, 0)
+            except ValueError as e:
+                raise ValueError(f"Unknown register {key!r} in {path}") from e
+        values[address] = int(value, 0) if isinstance(value, str) else int(value)
+    return values
+
+
+def diff(expected, actual, measurements=False):
+    """
+    Compare two {address: value} maps.
+
+    Returns:
+        list: (address, expected, actual) for every difference, where a
+        missing side is None.
+    """
+    differences = []
+    for address in sorted(set(expected) | set(actual)):
+        if not measurements and address >= MEASUREMENT_BASE:
+            continue
+        a, b = expected.get(address), actual.get(address)
+        if a != b:
+            differences.append((address, a, b))
+    return differences
+
+
+def format_diff(differences, labels=('expected', 'actual')):
+    def word(value):
+        return '-' if value is None else f'0x{value:04X}'
+
+    lines = [f"{'register':16s} {'addr':>5s}  {labels[0]:>10s}  {labels[1]:>10s}"]
+    for address, a, b in differences:
+        command = BY_ADDRESS.get(address)
+        name = command.name if command is not None else '?'
+        lines.append(f"{name:16s} 0x{address:03X}  {word(a):>10s}  {word(b):>10s}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dump and diff the ATM90E3x register map.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    dump_parser = commands.add_parser('dump', help="read every register in one batch")
+    dump_parser.add_argument('--bus', type=int, default=0)
+    dump_parser.add_argument('--device', type=int, default=0)
+    dump_parser.add_argument('--speed', type=int, default=200000, help="SPI clock in Hz")
+    dump_parser.add_argument('--energy', action='store_true',
+                             help="include the read-to-clear energy registers (clears them)")
+    dump_parser.add_argument('--output', help="snapshot file (default: stdout)")
+
+    diff_parser = commands.add_parser('diff', help="compare snapshots or a snapshot and a profile")
+    diff_parser.add_argument('snapshot')
+    diff_parser.add_argument('other', nargs='?', help="second snapshot")
+    diff_parser.add_argument('--profile', help="calibration profile (.cal) or JSON register map")
+    diff_parser.add_argument('--all', action='store_true', help="also compare measurement registers")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'dump':
+        meter = SpiReader(args.bus, args.device, args.speed)
+        try:
+            data = snapshot(meter, energy=args.energy)
+        finally:
+            meter.close()
+        if args.output:
+            save_snapshot(data, args.output)
+            print(f"{len(data['registers'])} registers in {data['elapsed_ms']:.1f} ms -> {args.output}")
+        else:
+            json.dump(data, sys.stdout, separators=(',', ':'))
+            print()
+        return 0
+
+    if (args.other is None) == (args.profile is None):
+        parser.error("diff needs either a second snapshot or --profile")
+    first = load_snapshot(args.snapshot)
+    if args.profile:
+        profile = load_profile(args.profile)
+        # A profile only constrains its own registers
+        actual = {address: first.get(address) for address in profile}
+        differences = diff(profile, actual, measurements=True)
+        labels = ('profile', 'snapshot')
+    else:
+        differences = diff(first, load_snapshot(args.other), measurements=args.all)
+        labels = ('first', 'second')
+    if differences:
+        print(format_diff(differences, labels))
+        return 1
+    print("No differences")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+import math
+import threading
+import time
+
+import numpy as np
+
+# Bucket widths in seconds, finest first; each must divide the next
+DEFAULT_RESOLUTIONS = (1, 60, 900)
+
+# Closed buckets kept per resolution: an hour of 1 s, a week of 1 min, a year of 15 min
+DEFAULT_CAPACITY = {1: 3600, 60: 7 * 1440, 900: 366 * 96}
+
+PHASES = ('A', 'B', 'C')
+
+# Scalar fields taken from a Metering_1.Snapshot, see snapshot_values()
+SNAPSHOT_FIELDS = (
+    tuple(f'voltage{p}' for p in PHASES) +
+    tuple(f'current{p}' for p in PHASES) +
+    tuple(f'power{p}' for p in PHASES) +
+    ('frequency',)
+)
+
+
+def snapshot_values(snapshot):
+    """Flatten a Snapshot into SNAPSHOT_FIELDS order."""
+    return snapshot.voltage + snapshot.current + snapshot.power + (snapshot.frequency,)
+
+
+class _Level:
+    """
+    One resolution: the open bucket plus a ring of closed buckets.
+
+    The open bucket only holds closed buckets of the finer level (`child`);
+    _pending() adds the finer levels' open buckets to it. A child's open
+    bucket always lies inside this level's open bucket, since this level
+    closes as soon as the child moves past it.
+    """
+
+    def __init__(self, resolution, capacity, fields, energy_fields, parent=None):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.parent = parent
+        self.child = None
+        if parent is not None:
+            parent.child = self
+
+        self.start = np.zeros(capacity, dtype=np.float64)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.min = np.zeros((capacity, fields))
+        self.max = np.zeros((capacity, fields))
+        self.mean = np.zeros((capacity, fields))
+        self.last = np.zeros((capacity, fields))
+        self.energy = np.zeros((capacity, energy_fields))
+        self._index = 0
+        self._count = 0
+        self._provisional = False  # the slot at _index holds the flushed open bucket
+
+        self._open = None  # start of the open bucket
+        self._open_count = 0
+        self._open_min = np.empty(fields)
+        self._open_max = np.empty(fields)
+        self._open_sum = np.empty(fields)
+        self._open_last = np.empty(fields)
+        self._energy_last = np.full(energy_fields, np.nan)  # cumulative energy at the latest sample
+        self._energy_closed = np.full(energy_fields, np.nan)  # cumulative energy when the last bucket closed
+        self._energy_seen = False
+
+    def merge(self, timestamp, count, minimum, maximum, total, last, energy):
+        """Fold a sample (count=1) or a closed child bucket into this level."""
+        bucket = math.floor(timestamp / self.resolution) * self.resolution
+        if bucket != self._open:
+            if self._open is not None:
+                self.close()
+            if self.parent is not None:
+                self.parent.advance(bucket)
+            self._open = bucket
+            self._open_count = count
+            self._open_min[:] = minimum
+            self._open_max[:] = maximum
+            self._open_sum[:] = total
+        else:
+            self._open_count += count
+            np.minimum(self._open_min, minimum, out=self._open_min)
+            np.maximum(self._open_max, maximum, out=self._open_max)
+            self._open_sum += total
+        self._open_last[:] = last
+
+        if energy is not None:
+            if not self._energy_seen:
+                self._energy_closed[:] = energy
+                self._energy_seen = True
+            self._energy_last[:] = energy
+
+    def advance(self, timestamp):
+        """Close the open bucket, here and above, once a finer level has moved past it."""
+        if self._open is not None and math.floor(timestamp / self.resolution) * self.resolution != self._open:
+            self.close()
+        if self.parent is not None:
+            self.parent.advance(timestamp)
+
+    def _store(self, start, count, minimum, maximum, total, last, energy):
+        i = self._index
+        self.start[i] = start
+        self.count[i] = count
+        self.min[i] = minimum
+        self.max[i] = maximum
+        self.mean[i] = total / count
+        self.last[i] = last
+        self.energy[i] = energy
+
+    def close(self):
+        """Move the open bucket into the ring and pass it up to the coarser level."""
+        count = self._open_count
+        # Deltas run from the previous close, so no energy falls between buckets
+        self._store(self._open, count, self._open_min, self._open_max, self._open_sum, self._open_last,
+                    self._energy_last - self._energy_closed)
+        self._provisional = False
+        parent = self.parent
+        if parent is not None and self._energy_seen and not parent._energy_seen:
+            # The coarser level starts from the same baseline, not from this first close
+            parent._energy_closed[:] = self._energy_closed
+            parent._energy_seen = True
+        self._energy_closed[:] = self._energy_last
+        self._index = (self._index + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+        if parent is not None:
+            parent.merge(self._open, count, self._open_min, self._open_max, self._open_sum,
+                         self._open_last, self._energy_last if self._energy_seen else None)
+        self._open = None
+
+    def _pending(self):
+        # (start, count, min, max, sum, last, cumulative energy, energy baseline) of the open
+        # bucket including the finer levels' open buckets, or None when nothing is open
+        child = self.child._pending() if self.child is not None else None
+        if self._open is None:
+            if child is None:
+                return None
+            start, count, minimum, maximum, total, last, energy, baseline = child
+            return (math.floor(start / self.resolution) * self.resolution, count, minimum, maximum, total,
+                    last, energy, self._energy_closed if self._energy_seen else baseline)
+        count = self._open_count
+        minimum = self._open_min.copy()
+        maximum = self._open_max.copy()
+        total = self._open_sum.copy()
+        last = self._open_last
+        energy = self._energy_last
+        if child is not None:
+            count += child[1]
+            np.minimum(minimum, child[2], out=minimum)
+            np.maximum(maximum, child[3], out=maximum)
+            total += child[4]
+            last = child[5]
+            energy = child[6]
+        baseline = self._energy_closed if self._energy_seen or child is None else child[7]
+        return self._open, count, minimum, maximum, total, last.copy(), energy.copy(), baseline
+
+    def flush(self):
+        """Write the open bucket into the ring without closing it; close() later overwrites the entry."""
+        pending = self._pending()
+        if pending is None:
+            return
+        start, count, minimum, maximum, total, last, energy, baseline = pending
+        self._store(start, count, minimum, maximum, total, last, energy - baseline)
+        self._provisional = True
+
+    def _order(self):
+        # Ring slots oldest first, including a flushed open bucket
+        n = min(self._count + self._provisional, self.capacity)
+        return (self._index + self._provisional - n + np.arange(n)) % self.capacity
+
+    @property
+    def oldest(self):
+        order = self._order()
+        if not len(order):
+            pending = self._pending()
+            return pending[0] if pending is not None else None
+        return self.start[order[0]]
+
+    def closed(self, start, end):
+        """Closed (and flushed) buckets with start <= bucket start < end, oldest first."""
+        order = self._order()
+        starts = self.start[order]
+        order = order[(starts >= start) & (starts < end)]
+        return {
+            'start': self.start[order],
+            'count': self.count[order],
+            'min': self.min[order],
+            'max': self.max[order],
+            'mean': self.mean[order],
+            'last': self.last[order],
+            'energy': self.energy[order],
+        }
+
+    def open_bucket(self):
+        """The partially filled bucket, finer open buckets included, in the same layout as closed()."""
+        pending = self._pending()
+        if pending is None:
+            return None
+        start, count, minimum, maximum, total, last, energy, baseline = pending
+        return {
+            'start': np.array([start]),
+            'count': np.array([count]),
+            'min': minimum[None, :],
+            'max': maximum[None, :],
+            'mean': (total / count)[None, :],
+            'last': last[None, :],
+            'energy': (energy - baseline)[None, :],
+        }
+
+
+class RollupEngine:
+    """
+    Incremental min/max/mean/last and energy-delta rollups at several
+    resolutions.
+
+    Each sample is folded only into the open bucket of the finest
+    resolution. When that bucket closes it is merged into the next coarser
+    one, and so on, so a sample costs O(1) whatever the number of levels
+    and history is never rescanned. Closed buckets are kept in
+    fixed-capacity NumPy rings per resolution, and query() returns whole
+    bucket arrays for a time range.
+
+    Energy fields are cumulative counters (e.g. EnergyAccumulator.energy_kwh()
+    values); each bucket stores how much they advanced since the previous
+    bucket closed.
+
+    append() takes the (timestamp, values) item MeterSampler stores, so the
+    engine can be a sampler buffer with a read function returning
+    snapshot_values(); pass monotonic=True there, since the sampler stamps
+    samples with its monotonic deadlines. A sample older than the newest
+    one seen (e.g. after a wall clock step) is counted in `clamped` and
+    folded in at the newest timestamp, so closed buckets never change.
+    """
+
+    def __init__(self, fields=SNAPSHOT_FIELDS, energy_fields=(), resolutions=DEFAULT_RESOLUTIONS,
+                 capacity=None, monotonic=False):
+        resolutions = tuple(sorted(resolutions))
+        for fine, coarse in zip(resolutions, resolutions[1:]):
+            if coarse % fine:
+                raise ValueError(f"Resolution {coarse} s is not a multiple of {fine} s")
+        capacity = {**DEFAULT_CAPACITY, **(capacity or {})}
+
+        self.fields = tuple(fields)
+        self.energy_fields = tuple(energy_fields)
+        self.resolutions = resolutions
+        self._field_index = {name: i for i, name in enumerate(self.fields)}
+        self._clock_offset = time.time() - time.monotonic() if monotonic else 0.0
+        self._lock = threading.Lock()
+        self._latest = -math.inf
+        self.samples = 0
+        self.clamped = 0
+
+        self._levels = {}
+        parent = None
+        for resolution in reversed(resolutions):
+            parent = self._levels[resolution] = _Level(resolution, capacity.get(resolution, 3600),
+                                                       len(self.fields), len(self.energy_fields), parent)
+        self._finest = parent
+
+    def add(self, timestamp, values, energy=None):
+        """
+        Fold one sample into the rollups.
+
+        Args:
+            timestamp (float): Sample time in seconds.
+            values (sequence): One value per field.
+            energy (sequence): Cumulative energy per energy field, or None
+                to carry the previous reading forward.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if energy is not None:
+            energy = np.asarray(energy, dtype=np.float64)
+        timestamp += self._clock_offset
+        with self._lock:
+            if timestamp < self._latest:
+                timestamp = self._latest
+                self.clamped += 1
+            self._latest = timestamp
+            self._finest.merge(timestamp, 1, values, values, values, values, energy)
+            self.samples += 1
+
+    def append(self, item):
+        timestamp, values = item
+        self.add(timestamp, values)
+
+    def flush(self):
+        """
+        Write the open buckets at every resolution into the rings, e.g.
+        before shutdown, so query() returns them. They stay open: later
+        samples in the same buckets update those entries instead of adding
+        a second bucket with the same start.
+        """
+        with self._lock:
+            for level in self._levels.values():
+                level.flush()
+
+    def _pick(self, start):
+        # Finest resolution whose retained history reaches back to start
+        for resolution in self.resolutions:
+            oldest = self._levels[resolution].oldest
+            if oldest is not None and oldest <= start:
+                return resolution
+        return self.resolutions[-1]
+
+    def query(self, start=-math.inf, end=math.inf, resolution=None, include_open=False):
+        """
+        Return rollup buckets starting in [start, end).
+
+        Args:
+            resolution (int): Bucket width; by default the finest one that
+                still covers `start`.
+            include_open (bool): Append the current, partially filled bucket.
+
+        Returns:
+            dict: 'resolution', 'fields', 'energy_fields', bucket 'start'
+            times and 'count', (buckets, fields) 'min', 'max', 'mean' and
+            'last' arrays, and a (buckets, energy fields) 'energy' array.
+        """
+        with self._lock:
+            if resolution is None:
+                resolution = self._pick(start)
+            try:
+                level = self._levels[resolution]
+            except KeyError as e:
+                raise ValueError(f"No {resolution} s rollup (have {self.resolutions})") from e
+            result = level.closed(start, end)
+            if include_open:
+                bucket = level.open_bucket()
+                if bucket is not None and start <= bucket['start'][0] < end:
+                    result = {key: np.concatenate([result[key], bucket[key]]) for key in result}
+
+        result['resolution'] = resolution
+        result['fields'] = self.fields
+        result['energy_fields'] = self.energy_fields
+        return result
+
+    def series(self, field, stat='mean', start=-math.inf, end=math.inf, resolution=None):
+        """Return (bucket starts, values) of one statistic for one field."""
+        try:
+            column = self._field_index[field]
+        except KeyError as e:
+            raise ValueError(f"Unknown rollup field: {field}") from e
+        result = self.query(start, end, resolution)
+        return result['start'], result[stat][:, column]
+
+    def energy(self, start=-math.inf, end=math.inf, resolution=None):
+        """Return total energy advance per energy field over buckets in [start, end)."""
+        result = self.query(start, end, resolution)
+        return dict(zip(self.energy_fields, result['energy'].sum(axis=0).tolist()))
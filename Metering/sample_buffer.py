@@ -0,0 +1,143 @@
+import threading
+
+import numpy as np
+
+from descriptors import DESCRIPTORS, combine24, combine32, sign_extend16
+
+PHASES = ('A', 'B', 'C')
+
+# Descriptor of the register behind each ATM90E3x.SNAPSHOT_REGISTERS column group
+_SNAPSHOT_DESCRIPTORS = {
+    'voltage': DESCRIPTORS['UrmsA'],    # VoltageX, VoltageX_LSB
+    'current': DESCRIPTORS['IrmsA'],    # CurrentX, CurrentX_LSB
+    'power': DESCRIPTORS['SmeanA'],     # ApH_PowerX, ApL_PowerX
+    'frequency': DESCRIPTORS['Freq'],   # Frequency
+    'phase_angle': DESCRIPTORS['UangleA'],  # PhaseAngleX
+}
+
+
+class RawSampleBuffer:
+    """
+    Ring buffer of raw register words backed by contiguous NumPy arrays.
+
+    Each sample is one row of uint16 words (one column per register) plus a
+    float64 timestamp. Scaling, sign extension and high/low recombination are
+    applied to whole columns at query time, so an hour of 10 Hz snapshots is
+    about 1.4 MB rather than millions of Python floats and dicts.
+
+    append() takes the same (timestamp, words) item as sampler.RingBuffer, so
+    it can be passed to MeterSampler as its buffer.
+    """
+
+    def __init__(self, capacity, columns):
+        if capacity <= 0:
+            raise ValueError("Ring buffer capacity must be positive")
+        self.capacity = capacity
+        self.columns = tuple(columns)
+        self._column_index = {name: i for i, name in enumerate(self.columns)}
+        self._words = np.zeros((capacity, len(self.columns)), dtype=np.uint16)
+        self._timestamps = np.zeros(capacity, dtype=np.float64)
+        self._index = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def append(self, item):
+        """Store one (timestamp, words) sample, overwriting the oldest when full."""
+        timestamp, words = item
+        with self._lock:
+            self._words[self._index] = words
+            self._timestamps[self._index] = timestamp
+            self._index = (self._index + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+
+    def extend(self, timestamps, words):
+        """Store a block of samples at once."""
+        words = np.asarray(words, dtype=np.uint16)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(words) > self.capacity:
+            words = words[-self.capacity:]
+            timestamps = timestamps[-self.capacity:]
+        with self._lock:
+            positions = (self._index + np.arange(len(words))) % self.capacity
+            self._words[positions] = words
+            self._timestamps[positions] = timestamps
+            self._index = (self._index + len(words)) % self.capacity
+            self._count = min(self.capacity, self._count + len(words))
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        return self._words.nbytes + self._timestamps.nbytes
+
+    def _order(self, n=None):
+        n = self._count if n is None else min(n, self._count)
+        return (self._index - n + np.arange(n)) % self.capacity
+
+    def raw(self, n=None):
+        """Return (timestamps, words) for the latest n samples, oldest first."""
+        with self._lock:
+            order = self._order(n)
+            return self._timestamps[order], self._words[order]
+
+    def between(self, start, end):
+        """Return (timestamps, words) for samples with start <= timestamp < end."""
+        timestamps, words = self.raw()
+        mask = (timestamps >= start) & (timestamps < end)
+        return timestamps[mask], words[mask]
+
+    def column(self, words, name):
+        """Select one register column from a words block."""
+        try:
+            return words[:, self._column_index[name]]
+        except KeyError as e:
+            raise ValueError(f"Register not in buffer: {name}") from e
+
+    def scaled(self, name, scale, signed=False, n=None):
+        """Return one register column scaled to engineering units."""
+        _, words = self.raw(n)
+        column = self.column(words, name)
+        return (sign_extend16(column) if signed else column) * scale
+
+    def combined(self, high, low, scale, signed=True, n=None):
+        """Return a high/low register pair recombined to 32 bits and scaled."""
+        _, words = self.raw(n)
+        return combine32(self.column(words, high), self.column(words, low), signed) * scale
+
+    def _rms(self, words, name):
+        # Extended snapshots carry the LSB register, whose bits 15:8 add 8 fractional bits
+        msb = self.column(words, name)
+        if f'{name}_LSB' not in self._column_index:
+            return msb
+        return combine24(msb, self.column(words, f'{name}_LSB'))
+
+    def snapshot_arrays(self, n=None):
+        """
+        Decode ATM90E3x.SNAPSHOT_REGISTERS (or EXTENDED_SNAPSHOT_REGISTERS)
+        columns for the latest n samples.
+
+        Returns:
+            dict: 'timestamp' plus (samples, 3) arrays for voltage, current,
+            power and phase_angle, and a (samples,) array for frequency.
+        """
+        timestamps, words = self.raw(n)
+        col = self.column
+        scale = {name: d.scale for name, d in _SNAPSHOT_DESCRIPTORS.items()}
+        power_signed = _SNAPSHOT_DESCRIPTORS['power'].signed
+
+        voltage = np.stack([self._rms(words, f'Voltage{p}') for p in PHASES], axis=1) * scale['voltage']
+        current = np.stack([self._rms(words, f'Current{p}') for p in PHASES], axis=1) * scale['current']
+        power = np.stack([combine32(col(words, f'ApH_Power{p}'), col(words, f'ApL_Power{p}'), power_signed)
+                          for p in PHASES], axis=1) * scale['power']
+        angle = np.stack([col(words, f'PhaseAngle{p}') for p in PHASES], axis=1) * scale['phase_angle']
+
+        return {
+            'timestamp': timestamps,
+            'voltage': voltage,
+            'current': current,
+            'power': power,
+            'frequency': col(words, 'Frequency') * scale['frequency'],
+            'phase_angle': angle,
+        }
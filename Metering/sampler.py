@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+
+
+class RingBuffer:
+    """Fixed-capacity ring buffer with preallocated slots."""
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError("Ring buffer capacity must be positive")
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._index = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def append(self, item):
+        """Store an item, overwriting the oldest one when full."""
+        with self._lock:
+            self._slots[self._index] = item
+            self._index = (self._index + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+
+    def latest(self, n=1):
+        """Return up to the n most recent items, oldest first."""
+        with self._lock:
+            n = min(n, self._count)
+            start = self._index - n
+            if start >= 0:
+                return self._slots[start:self._index]
+            return self._slots[start:] + self._slots[:self._index]
+
+    def __len__(self):
+        return self._count
+
+
+class MeterSampler:
+    """
+    Poll a meter at a fixed rate on a monotonic-deadline schedule.
+
+    Deadlines are computed as start + n * period, so sleep and read jitter
+    never accumulate into drift. If a read runs past one or more whole
+    periods those deadlines are counted as missed and skipped rather than
+    fired back to back.
+    """
+
+    DEFAULT_RATE_HZ = 10
+    DEFAULT_CAPACITY = 3600
+
+    def __init__(self, meter, rate_hz=DEFAULT_RATE_HZ, capacity=DEFAULT_CAPACITY, read=None, buffer=None):
+        if rate_hz <= 0:
+            raise ValueError("Sample rate must be positive")
+        self.meter = meter
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self.read = read if read is not None else meter.read_snapshot
+        self.buffer = buffer if buffer is not None else RingBuffer(capacity)
+        self.reset_monitor = getattr(meter, 'reset_monitor', None)
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.samples = 0
+        self.errors = 0
+        self.overruns = 0
+        self.missed_deadlines = 0
+        self._jitter_sum = 0.0
+        self._jitter_max = 0.0
+        self._started = None
+
+    def start(self):
+        """Start sampling on a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            raise RuntimeError("Sampler already running")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="MeterSampler", daemon=True)
+        self._thread.start()
+        logging.info("Meter sampler started at %.1f Hz", self.rate_hz)
+
+    def stop(self, timeout=None):
+        """Stop the background thread and wait for it to exit."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        logging.info("Meter sampler stopped after %d samples", self.samples)
+
+    def run(self, count=None):
+        """Sample until stopped, or until `count` samples have been taken."""
+        self._reset_stats()
+        period = self.period
+        start = time.monotonic()
+        self._started = start
+        tick = 0
+
+        while not self._stop.is_set():
+            deadline = start + tick * period
+            now = time.monotonic()
+            if now < deadline:
+                if self._stop.wait(deadline - now):
+                    break
+                now = time.monotonic()
+
+            jitter = now - deadline
+            self._jitter_sum += jitter
+            if jitter > self._jitter_max:
+                self._jitter_max = jitter
+
+            try:
+                sample = self.read()
+            except Exception as e:
+                self.errors += 1
+                logging.error("Sample read failed: %s", e)
+            else:
+                self.buffer.append((deadline, sample))
+                self.samples += 1
+                if count is not None and self.samples >= count:
+                    break
+                self._check_reset()
+
+            # Skip deadlines that have already passed instead of bursting to catch up
+            elapsed = time.monotonic() - deadline
+            if elapsed > period:
+                self.overruns += 1
+                skipped = int(elapsed // period)
+                self.missed_deadlines += skipped
+                tick += skipped + 1
+            else:
+                tick += 1
+
+    def _check_reset(self):
+        # Runs after the sample is stored so a reset check never delays the deadline read
+        if self.reset_monitor is None:
+            return
+        try:
+            self.reset_monitor.poll()
+        except Exception as e:
+            logging.error("Meter reset check failed: %s", e)
+
+    def stats(self):
+        """Report achieved rate, jitter, overrun and missed-deadline counters."""
+        ticks = self.samples + self.errors
+        elapsed = time.monotonic() - self._started if self._started is not None else 0.0
+        return {
+            'rate_hz': self.rate_hz,
+            'achieved_hz': self.samples / elapsed if elapsed else 0.0,
+            'samples': self.samples,
+            'errors': self.errors,
+            'overruns': self.overruns,
+            'missed_deadlines': self.missed_deadlines,
+            'mean_jitter_s': self._jitter_sum / ticks if ticks else 0.0,
+            'max_jitter_s': self._jitter_max,
+        }
@@ -0,0 +1,112 @@
+import ctypes
+import fcntl
+import logging
+
+# Linux spidev ioctl layout (include/uapi/linux/spi/spidev.h)
+SPI_IOC_MAGIC = ord('k')
+SPI_IOC_TRANSFER_SIZE = 32
+SPI_IOC_MAX_TRANSFERS = (1 << 14) // SPI_IOC_TRANSFER_SIZE - 1
+
+FRAME_SIZE = 4  # ATM90E3x frame: 2 address bytes + 2 data bytes
+
+
+class _SpiIocTransfer(ctypes.Structure):
+    """struct spi_ioc_transfer"""
+    _fields_ = [
+        ('tx_buf', ctypes.c_uint64),
+        ('rx_buf', ctypes.c_uint64),
+        ('len', ctypes.c_uint32),
+        ('speed_hz', ctypes.c_uint32),
+        ('delay_usecs', ctypes.c_uint16),
+        ('bits_per_word', ctypes.c_uint8),
+        ('cs_change', ctypes.c_uint8),
+        ('tx_nbits', ctypes.c_uint8),
+        ('rx_nbits', ctypes.c_uint8),
+        ('word_delay_usecs', ctypes.c_uint8),
+        ('pad', ctypes.c_uint8),
+    ]
+
+
+def spi_ioc_message(count):
+    """Return the SPI_IOC_MESSAGE(count) ioctl request number."""
+    if not 0 < count <= SPI_IOC_MAX_TRANSFERS:
+        raise ValueError(f"SPI message must hold 1..{SPI_IOC_MAX_TRANSFERS} transfers, got {count}")
+    size = count * SPI_IOC_TRANSFER_SIZE
+    return (1 << 30) | (size << 16) | (SPI_IOC_MAGIC << 8)
+
+
+class SpiBatch:
+    """
+    A fixed sequence of 4-byte ATM90E3x frames submitted as a single
+    SPI_IOC_MESSAGE, with chip select released between frames.
+
+    The tx/rx buffers and the transfer descriptors are allocated once, so
+    every call to transfer() is one ioctl with no per-frame Python work.
+    Backends without a file descriptor (emulators, wrappers) fall back to
+    one xfer2 per frame.
+    """
+
+    def __init__(self, frames, speed_hz=0, cs_delay_usecs=0):
+        self.frames = tuple(tuple(frame) for frame in frames)
+        self.count = len(self.frames)
+        for frame in self.frames:
+            if len(frame) != FRAME_SIZE:
+                raise ValueError(f"Invalid frame length: {frame}")
+        self.addresses = tuple(((frame[0] & 0x7F) << 8) | frame[1] for frame in self.frames)
+        self.writes = tuple(not frame[0] & 0x80 for frame in self.frames)
+
+        self._request = spi_ioc_message(self.count)
+        size = self.count * FRAME_SIZE
+        self._tx = ctypes.create_string_buffer(bytes(b for frame in self.frames for b in frame), size)
+        self._rx = ctypes.create_string_buffer(size)
+        self._xfers = (_SpiIocTransfer * self.count)()
+
+        tx_base = ctypes.addressof(self._tx)
+        rx_base = ctypes.addressof(self._rx)
+        for i, xfer in enumerate(self._xfers):
+            xfer.tx_buf = tx_base + i * FRAME_SIZE
+            xfer.rx_buf = rx_base + i * FRAME_SIZE
+            xfer.len = FRAME_SIZE
+            xfer.speed_hz = speed_hz
+            xfer.delay_usecs = cs_delay_usecs
+            # Toggle CS after every frame except the last one
+            xfer.cs_change = 1 if i < self.count - 1 else 0
+
+    def set_speed(self, speed_hz):
+        """Override the clock rate for every frame (0 = device default)."""
+        for xfer in self._xfers:
+            xfer.speed_hz = speed_hz
+
+    def transfer(self, spi):
+        """Run the batch on an open SPI handle and return the raw rx bytes."""
+        fileno = getattr(spi, 'fileno', None)
+        if fileno is None:
+            return bytes(b for frame in self.frames for b in spi.xfer2(list(frame)))
+        fcntl.ioctl(fileno(), self._request, self._xfers)
+        rx = self._rx.raw
+        trace = getattr(spi, 'trace_batch', None)
+        if trace is not None:
+            # Recording wrappers (spi_trace) cannot see the ioctl itself
+            trace(self._tx.raw, rx)
+        return rx
+
+    def words(self, spi):
+        """Run the batch and return the 16-bit data word of every frame."""
+        rx = self.transfer(spi)
+        return [(rx[i + 2] << 8) | rx[i + 3] for i in range(0, len(rx), FRAME_SIZE)]
+
+
+def read_frame(address):
+    """Build the 4-byte read frame for a register address."""
+    return (0x80 | (address >> 8), address & 0xFF, 0x00, 0x00)
+
+
+def write_frame(address, value):
+    """Build the 4-byte write frame for a register address."""
+    return ((address >> 8) & 0x7F, address & 0xFF, (value >> 8) & 0xFF, value & 0xFF)
+
+
+def read_batch(addresses, speed_hz=0):
+    """Build a SpiBatch that reads the given register addresses in order."""
+    logging.debug("Preparing SPI batch for %d registers", len(addresses))
+    return SpiBatch([read_frame(address) for address in addresses], speed_hz=speed_hz)
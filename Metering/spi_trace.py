@@ -0,0 +1,202 @@
+import logging
+import os
+import struct
+import threading
+import time
+
+# Trace layout (little endian):
+#   header  : magic 'SPTR', u16 version, u16 reserved
+#   records : f64 monotonic timestamp, u32 byte count, u8 kind, tx bytes, rx bytes
+# A record is one xfer2 call or one whole SpiBatch (several 4-byte frames).
+_MAGIC = b'SPTR'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHH')
+_RECORD = struct.Struct('<dIB')
+
+XFER = 0
+BATCH = 1
+
+_BUFFER_SIZE = 1 << 16
+
+
+def read_trace(path):
+    """Return the records of a trace as a list of (timestamp, kind, tx, rx)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        raise ValueError(f"SPI trace {path} truncated")
+    magic, version, _ = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"Unsupported SPI trace {path}: {magic!r} v{version}")
+
+    records = []
+    offset = _HEADER.size
+    while offset + _RECORD.size <= len(data):
+        timestamp, length, kind = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        if offset + 2 * length > len(data):
+            break  # last record cut short, e.g. by power loss
+        records.append((timestamp, kind, data[offset:offset + length], data[offset + length:offset + 2 * length]))
+        offset += 2 * length
+    return records
+
+
+class RecordingSpiDev:
+    """
+    spidev.SpiDev wrapper that appends every transfer to a binary trace.
+
+    xfer2/xfer calls are recorded directly. SpiBatch submissions still go
+    through the wrapped handle's file descriptor as one ioctl and are
+    reported back through trace_batch(), so recording keeps batching. The
+    trace is written through a 64 KiB buffer; call flush() or close() to
+    make it durable.
+    """
+
+    def __init__(self, spi, path, clock=time.monotonic):
+        self._spi = spi
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb', buffering=_BUFFER_SIZE)
+        self._file.write(_HEADER.pack(_MAGIC, _VERSION, 0))
+        self.records = 0
+        if hasattr(spi, 'fileno'):
+            self.fileno = spi.fileno
+
+    def __getattr__(self, name):
+        return getattr(self._spi, name)
+
+    def __setattr__(self, name, value):
+        # Clock rate, mode and other device settings belong to the wrapped handle
+        if name in ('max_speed_hz', 'mode', 'bits_per_word', 'cshigh', 'lsbfirst', 'threewire', 'loop', 'no_cs'):
+            setattr(self._spi, name, value)
+        else:
+            object.__setattr__(self, name, value)
+
+    def _record(self, kind, tx, rx):
+        with self._lock:
+            self._file.write(_RECORD.pack(self.clock(), len(tx), kind))
+            self._file.write(tx)
+            self._file.write(rx)
+            self.records += 1
+
+    def xfer2(self, data):
+        response = self._spi.xfer2(data)
+        self._record(XFER, bytes(data), bytes(response))
+        return response
+
+    def xfer(self, data):
+        response = self._spi.xfer(data)
+        self._record(XFER, bytes(data), bytes(response))
+        return response
+
+    def trace_batch(self, tx, rx):
+        """Record a SpiBatch submitted through the file descriptor."""
+        self._record(BATCH, tx, rx)
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._spi.close()
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+        logging.info("SPI trace %s: %d records", self.path, self.records)
+
+
+def recording_factory(path, spi_factory=None):
+    """Return an spi_factory for the ATM90E3x drivers that records to `path`."""
+    def factory():
+        if spi_factory is None:
+            import spidev
+            return RecordingSpiDev(spidev.SpiDev(), path)
+        return RecordingSpiDev(spi_factory(), path)
+    return factory
+
+
+class ReplayMismatch(RuntimeError):
+    """The driver sent something other than the recorded command."""
+
+
+class ReplaySpiDev:
+    """
+    spidev.SpiDev stand-in that answers from a recorded trace.
+
+    The trace is consumed as a byte stream, so a batch recorded as one
+    ioctl replays correctly whether the driver submits it as one xfer2 or
+    frame by frame. With strict=True the bytes sent must match the
+    recording, which makes replays deterministic checks of driver
+    behaviour. `rate` scales the recorded timing (1.0 = original speed);
+    None replays as fast as possible, as a load generator. With loop=True
+    the trace restarts when exhausted.
+    """
+
+    def __init__(self, path, rate=None, strict=True, loop=False, clock=time.monotonic, sleep=time.sleep):
+        self.path = path
+        self.rate = rate
+        self.strict = strict
+        self.loop = loop
+        self.clock = clock
+        self.sleep = sleep
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.opened = False
+        self._records = read_trace(path)
+        if not self._records:
+            raise ValueError(f"SPI trace {path} is empty")
+        self._index = 0
+        self._offset = 0
+        self._origin = None
+        self.replayed = 0
+
+    def open(self, bus, device):
+        self.opened = True
+
+    def close(self):
+        self.opened = False
+
+    def _wait(self, timestamp):
+        if self.rate is None:
+            return
+        now = self.clock()
+        if self._origin is None:
+            self._origin = (now, timestamp)
+        start, first = self._origin
+        delay = start + (timestamp - first) / self.rate - now
+        if delay > 0:
+            self.sleep(delay)
+
+    def xfer2(self, data):
+        if not self.opened:
+            raise OSError("SPI device not open")
+        tx = bytes(data)
+        response = bytearray()
+        position = 0
+        while position < len(tx):
+            if self._index >= len(self._records):
+                if not self.loop:
+                    raise EOFError(f"SPI trace {self.path} exhausted after {self.replayed} records")
+                self._index = 0
+                self._origin = None
+            timestamp, _, recorded_tx, recorded_rx = self._records[self._index]
+            if self._offset == 0:
+                self._wait(timestamp)
+            take = min(len(tx) - position, len(recorded_tx) - self._offset)
+            if self.strict and tx[position:position + take] != recorded_tx[self._offset:self._offset + take]:
+                raise ReplayMismatch(f"Record {self._index}: sent {tx[position:position + take].hex()}, "
+                                     f"recorded {recorded_tx[self._offset:self._offset + take].hex()}")
+            response += recorded_rx[self._offset:self._offset + take]
+            position += take
+            self._offset += take
+            if self._offset == len(recorded_tx):
+                self._index += 1
+                self._offset = 0
+                self.replayed += 1
+        return list(response)
+
+    xfer = xfer2
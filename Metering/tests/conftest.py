@@ -0,0 +1,36 @@
+import logging
+import os
+import sys
+
+import pytest
+
+# The metering modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emulator  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def quiet_logging():
+    logging.disable(logging.CRITICAL)
+    yield
+    logging.disable(logging.NOTSET)
+
+
+@pytest.fixture
+def chip():
+    return emulator.EmulatedATM90E3x()
+
+
+@pytest.fixture
+def meter(chip):
+    import Metering_1
+    meter = Metering_1.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip))
+    yield meter
+    meter.close()
+
+
+@pytest.fixture
+def config_meter(chip):
+    import caalibration
+    return caalibration.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip))
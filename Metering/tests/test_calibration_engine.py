@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import registers as reg
+from calibration_engine import CalibrationEngine, FitResult, fit_linear
+
+
+def _fit(slope, intercept=0.0):
+    return FitResult(np.full(3, slope), np.full(3, intercept), np.zeros(3), np.zeros(3), 2)
+
+
+def test_fit_linear_recovers_slope_and_intercept():
+    reference = np.repeat(np.array([[100.0], [200.0], [300.0]]), 3, axis=1)
+    measured = reference * np.array([1.02, 0.98, 1.0]) + np.array([0.5, -0.25, 0.0])
+    fit = fit_linear(reference, measured)
+    np.testing.assert_allclose(fit.slope, [1.02, 0.98, 1.0])
+    np.testing.assert_allclose(fit.intercept, [0.5, -0.25, 0.0], atol=1e-9)
+    np.testing.assert_allclose(fit.residual_max, 0.0, atol=1e-9)
+    assert fit.points == 3
+
+
+def test_fit_linear_single_level_fits_slope_only():
+    reference = np.full((10, 3), 230.0)
+    fit = fit_linear(reference, reference * 1.01)
+    np.testing.assert_allclose(fit.slope, 1.01)
+    np.testing.assert_array_equal(fit.intercept, 0.0)
+
+
+def test_register_values_scale_current_gain():
+    engine = CalibrationEngine(meter=None)
+    current = {f'{q}{p}': v for p in 'ABC' for q, v in (('Ugain', 0x8000), ('Uoffset', 0))}
+    values = engine.register_values({'voltage': _fit(1.25)}, current)
+    assert values['UgainA'] == round(0x8000 / 1.25)
+    assert values['UoffsetA'] == 0
+
+
+def test_register_values_rejects_out_of_range_gain():
+    engine = CalibrationEngine(meter=None)
+    current = {f'{q}{p}': v for p in 'ABC' for q, v in (('PQGain', 0x7000), ('Poffset', 0))}
+    with pytest.raises(ValueError, match='PQGainA'):
+        engine.register_values({'power': _fit(0.5)}, current)
+
+
+def test_register_values_rejects_non_positive_slope():
+    engine = CalibrationEngine(meter=None)
+    current = {f'{q}{p}': 0 for p in 'ABC' for q in ('Igain', 'Ioffset')}
+    with pytest.raises(ValueError, match='slope'):
+        engine.register_values({'current': _fit(-1.0)}, current)
+
+
+def test_apply_writes_registers_and_updates_profile(chip, config_meter):
+    engine = CalibrationEngine(config_meter)
+    before = chip.words[reg.UgainA]
+    values = engine.apply({'voltage': _fit(2.0)})
+    assert chip.words[reg.UgainA] == values['UgainA'] == round(before / 2.0)
+    assert config_meter.calibration[reg.UgainA] == values['UgainA']
+
+
+def test_apply_writes_nothing_when_out_of_range(chip, config_meter):
+    engine = CalibrationEngine(config_meter)
+    before = list(chip.words)
+    with pytest.raises(ValueError):
+        engine.apply({'voltage': _fit(0.1)})
+    assert chip.words[reg.UgainA] == before[reg.UgainA]
+    assert reg.UgainA not in config_meter.calibration
@@ -0,0 +1,56 @@
+import caalibration
+import emulator
+import registers as reg
+from calibration_profiles import ProfileStore, decode_profile_entry, encode_profile
+
+
+def test_encode_decode_round_trip():
+    registers = {reg.UgainA: 0x9000, reg.IgainA: 0x8123}
+    assert decode_profile_entry(encode_profile(registers, 'pi:spi0.0')) == ('pi:spi0.0', registers)
+
+
+def test_store_round_trip_and_devices(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    store.save('pi:spi0.0', {reg.UgainA: 0x9000})
+    store.save('pi:spi0.1', {reg.UgainA: 0x9100})
+    assert store.load('pi:spi0.0') == {reg.UgainA: 0x9000}
+    # The stored ids are listed, not the sanitised file names
+    assert sorted(store.devices()) == ['pi:spi0.0', 'pi:spi0.1']
+
+
+def test_load_rejects_profile_of_another_device(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    store.save('pi:spi0.0', {reg.UgainA: 0x9000})
+    # 'pi_spi0.0' sanitises to the same file name
+    assert store.path('pi_spi0.0') == store.path('pi:spi0.0')
+    assert store.load('pi_spi0.0') is None
+
+
+def test_corrupt_profile_is_ignored(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    store.save('meter0', {reg.UgainA: 0x9000})
+    with open(store.path('meter0'), 'r+b') as f:
+        f.seek(-5, 2)
+        f.write(b'\xff')
+    assert store.load('meter0') is None
+    assert store.devices() == []
+
+
+def test_driver_applies_profile_and_drops_unknown_registers(tmp_path, chip):
+    store = ProfileStore(str(tmp_path))
+    store.save('meter0', {reg.UgainA: 0x9000, reg.UrmsA: 0x1234})
+    meter = caalibration.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip), profile_store=store,
+                                  device_id='meter0')
+    assert meter.calibration == {reg.UgainA: 0x9000}
+    assert chip.words[reg.UgainA] == 0x9000
+
+
+def test_other_format_versions_are_rejected(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    store.save('meter0', {reg.UgainA: 0x9000})
+    path = store.path('meter0')
+    with open(path, 'r+b') as f:
+        f.seek(4)
+        f.write(b'\x01\x00')
+    assert store.load('meter0') is None
+    assert store.devices() == []
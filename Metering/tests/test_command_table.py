@@ -0,0 +1,43 @@
+import pytest
+
+import registers as reg
+from command_table import (ADDRESS_SPACE, ADDRESSES, BY_ADDRESS, COMMANDS, READ_FRAMES, get_read_frame,
+                           get_write_frame, resolve)
+from spi_batch import read_frame, write_frame
+
+
+def test_table_covers_every_register():
+    names = {name for name, value in vars(reg).items() if not name.startswith('_') and isinstance(value, int)}
+    assert set(COMMANDS) == names
+    for name in names:
+        address = getattr(reg, name)
+        assert ADDRESSES[name] == address
+        assert address in BY_ADDRESS
+        assert READ_FRAMES[address] == read_frame(address)
+        assert get_write_frame(address, 0xA55A) == write_frame(address, 0xA55A)
+    assert len(READ_FRAMES) == ADDRESS_SPACE
+    assert READ_FRAMES[reg.PMConfig] == (0x81, 0x0B, 0x00, 0x00)
+
+
+def test_unmapped_addresses_build_frames():
+    unmapped = next(address for address in range(ADDRESS_SPACE) if address not in BY_ADDRESS)
+    assert READ_FRAMES[unmapped] is None
+    assert get_read_frame(unmapped) == read_frame(unmapped)
+    assert get_write_frame(unmapped, 0x1234) == write_frame(unmapped, 0x1234)
+
+
+def test_resolve():
+    assert resolve(['UrmsA', 'CfgRegAccEn']) == [reg.UrmsA, reg.CfgRegAccEn]
+    with pytest.raises(ValueError, match='NoSuchRegister'):
+        resolve(['UrmsA', 'NoSuchRegister'])
+
+
+def test_driver_reads_and_writes_through_table(meter, chip):
+    meter.write_register(reg.CfgRegAccEn, 0x55AA)
+    meter.write_register(reg.UgainA, 0xB123)
+    assert chip.words[reg.UgainA] == 0xB123
+    assert meter.read_register(reg.UgainA) == 0xB123
+    # Named reads use the driver's REGISTERS names, resolved through the same table
+    assert meter._read_register('VoltageA') == meter.read_register(meter.REGISTERS['VoltageA'])
+    with pytest.raises(RuntimeError):
+        meter._read_register('NoSuchRegister')
@@ -0,0 +1,61 @@
+import json
+
+import caalibration
+import emulator
+import registers as reg
+
+
+def _configure(chip, state_path, **kwargs):
+    return caalibration.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip), config_state_path=state_path,
+                                 **kwargs)
+
+
+def test_skip_path_clears_latched_interrupts(chip, tmp_path):
+    state = str(tmp_path / 'config.json')
+    _configure(chip, state, device_id='meter0')
+    chip.raise_interrupt(reg.EMMIntState0, 0x8001)
+    chip.raise_interrupt(reg.EMMIntState1, 0x4000)
+    meter = _configure(chip, state, device_id='meter0')
+    assert meter.configure() is False
+    assert chip.words[reg.EMMIntState0] == 0
+    assert chip.words[reg.EMMIntState1] == 0
+
+
+def test_rewrite_path_clears_latched_interrupts(chip):
+    meter = _configure(chip, None)
+    chip.write(reg.CfgRegAccEn, emulator.CFG_ACCESS_KEY)
+    chip.write(reg.UgainA, chip.words[reg.UgainA] ^ 0x0100)
+    chip.write(reg.CfgRegAccEn, 0x0000)
+    chip.raise_interrupt(reg.EMMIntState1, 0x0040)
+    assert meter.configure() is True
+    assert chip.words[reg.EMMIntState1] == 0
+
+
+def test_digests_are_kept_per_device(tmp_path):
+    state = str(tmp_path / 'config.json')
+    first, second = emulator.EmulatedATM90E3x(), emulator.EmulatedATM90E3x()
+    _configure(first, state, device_id='meter0')
+    _configure(second, state, device_id='meter1', ugainA=0xB000)
+    saved = json.load(open(state))
+    assert sorted(saved) == ['meter0', 'meter1']
+
+    # Each device finds its own digest again without reading the profile back
+    for chip, device_id, kwargs in ((first, 'meter0', {}), (second, 'meter1', {'ugainA': 0xB000})):
+        meter = _configure(chip, state, device_id=device_id, **kwargs)
+        assert meter.config.matches(meter._config_profile())
+        assert meter.config.device_id == device_id
+
+
+def test_digest_of_another_device_is_not_trusted(tmp_path):
+    state = str(tmp_path / 'config.json')
+    configured = emulator.EmulatedATM90E3x()
+    _configure(configured, state, device_id='meter0')
+    digest = json.load(open(state))['meter0']
+
+    # A second chip on the same profile must be checked against its own registers
+    fresh = emulator.EmulatedATM90E3x()
+    fresh.words[reg.CRCDigest] = configured.words[reg.CRCDigest]
+    meter = _configure(fresh, state, device_id='meter1')
+    assert fresh.words[reg.UgainA] == 0xC720
+    assert json.load(open(state))['meter0'] == digest
+    assert meter.configure() is False
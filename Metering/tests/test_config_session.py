@@ -0,0 +1,79 @@
+import pytest
+
+import registers as reg
+from config_session import ECHO, ConfigSession, ConfigVerifyError
+
+
+def test_readback_commit_writes_and_verifies(chip, meter):
+    session = ConfigSession(meter)
+    session.write_many([(reg.SagTh, 0x1234), (reg.FreqHiTh, 0x1388)])
+    assert len(session) == 2
+    assert session.commit() == {}
+    assert chip.words[reg.SagTh] == 0x1234
+    assert chip.words[reg.FreqHiTh] == 0x1388
+    # The session re-locks the configuration registers
+    assert chip.words[reg.CfgRegAccEn] == 0
+
+
+def test_readback_diff_reports_locked_registers(chip, meter):
+    before = chip.words[reg.SagTh]
+    session = ConfigSession(meter, unlock=False)
+    session.write(reg.SagTh, before ^ 0x00FF)
+    diff = session.commit()
+    assert diff == {reg.SagTh: (before ^ 0x00FF, before)}
+    assert session.diff == diff
+
+
+def test_context_manager_raises_verify_error(chip, meter):
+    before = chip.words[reg.SagTh]
+    with pytest.raises(ConfigVerifyError) as info:
+        with ConfigSession(meter, unlock=False) as session:
+            session.write(reg.SagTh, before + 1)
+    assert info.value.diff == {reg.SagTh: (before + 1, before)}
+    assert 'SagTh' in str(info.value)
+
+
+def test_context_manager_does_not_commit_on_exception(chip, meter):
+    before = chip.words[reg.SagTh]
+    with pytest.raises(KeyError):
+        with ConfigSession(meter) as session:
+            session.write(reg.SagTh, before + 1)
+            raise KeyError('abort')
+    assert chip.words[reg.SagTh] == before
+
+
+def test_echo_verify_checks_every_write(chip, meter):
+    session = ConfigSession(meter, verify=ECHO)
+    session.write(reg.SagTh, 0x2222)
+    assert session.commit() == {}
+    assert chip.words[reg.SagTh] == 0x2222
+
+
+def test_write_one_to_clear_registers_are_not_verified(chip, meter):
+    chip.raise_interrupt(reg.EMMIntState0, 0x8000)
+    session = ConfigSession(meter)
+    session.write(reg.EMMIntState0, 0x8000)
+    assert session.commit() == {}
+    assert chip.words[reg.EMMIntState0] & 0x8000 == 0
+
+
+def test_read_only_register_is_rejected(meter):
+    session = ConfigSession(meter)
+    with pytest.raises(ValueError, match='not writable'):
+        session.write(reg.UrmsA, 1)
+    assert len(session) == 0
+
+
+def test_unknown_verify_mode_is_rejected(meter):
+    with pytest.raises(ValueError):
+        ConfigSession(meter, verify='crc')
+
+
+def test_commit_rearms_reset_monitor(chip, meter):
+    meter.reset_monitor.rearm()
+    armed = meter.reset_monitor.expected
+    session = ConfigSession(meter)
+    session.write(reg.SagTh, chip.words[reg.SagTh] ^ 1)
+    session.commit()
+    assert meter.reset_monitor.expected != armed
+    assert meter.reset_monitor.poll() is False
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+import emulator
+import Metering_1
+import registers as reg
+from calibration_engine import MEASUREMENT_DECODER, decode_measurements
+from command_table import resolve
+from descriptors import DESCRIPTORS, READ_CLEAR, RegisterDecoder, combine24, combine32, describe
+from power_quality import _PQ_DECODER, PQ_REGISTERS, PowerQualityMonitor, decode_pq
+from sample_buffer import RawSampleBuffer
+
+WAVEFORM = dict(voltage=230.0, current=16.0, power_factor=0.98, frequency=50.0, ripple=0.0,
+                thd_voltage=1.5, thd_current=4.0, harmonic_ratio=0.02)
+
+
+@pytest.fixture
+def steady_meter():
+    chip = emulator.EmulatedATM90E3x(emulator.Waveform(**WAVEFORM))
+    meter = Metering_1.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip))
+    yield meter
+    meter.close()
+
+
+def test_descriptor_table():
+    assert describe('UrmsA') == DESCRIPTORS['UrmsA']
+    assert DESCRIPTORS['UrmsA'].address == reg.UrmsA
+    assert DESCRIPTORS['UrmsA'].lsb == 'UrmsALSB'
+    assert DESCRIPTORS['PmeanT'].width == 32 and DESCRIPTORS['PmeanT'].signed
+    assert DESCRIPTORS['APenergyT'].access == READ_CLEAR
+    with pytest.raises(ValueError):
+        describe('NoSuchRegister')
+
+
+def test_pairing_helpers():
+    np.testing.assert_array_equal(combine24([100], [0x8000]), [100.5])
+    assert combine32([0xFFFF], [0xFFFE])[0] == -2
+    assert combine32([0xFFFF], [0xFFFE], signed=False)[0] == 0xFFFFFFFE
+
+
+def test_decoder_reads_engineering_units(steady_meter):
+    decoder = RegisterDecoder(['UrmsA', 'IrmsB', 'PmeanT', 'Freq', 'PAngleA', 'THDNUC'])
+    # Paired registers ride in the same batch right after their high word
+    assert decoder.addresses[:2] == (reg.UrmsA, reg.UrmsALSB)
+    values = decoder.read(steady_meter)
+    assert values['UrmsA'] == pytest.approx(230.0, abs=0.01)
+    assert values['IrmsB'] == pytest.approx(16.0, abs=0.001)
+    assert values['PmeanT'] == pytest.approx(3 * 230.0 * 16.0 * 0.98, rel=1e-3)
+    assert values['Freq'] == pytest.approx(50.0)
+    assert values['PAngleA'] == pytest.approx(11.5, abs=0.1)
+    assert values['THDNUC'] == pytest.approx(1.5)
+
+
+def test_decoder_sign_extends_negative_power():
+    decoder = RegisterDecoder(['PmeanA', 'PAngleA'])
+    words = np.array([0xFFFF, 0xFFFF - 3124, 0xFFF6], dtype=np.uint16)  # -3125 LSB, -10 LSB
+    values = decoder.decode(words)
+    assert values[0] == pytest.approx(-1.0)
+    assert values[1] == pytest.approx(-1.0)
+
+
+def test_power_quality_decoder(steady_meter):
+    monitor = PowerQualityMonitor(steady_meter, every=1)
+    monitor.read()
+    record = monitor.latest()
+    np.testing.assert_allclose(record['thd_voltage'], 1.5)
+    np.testing.assert_allclose(record['thd_current'], 4.0)
+    np.testing.assert_allclose(record['harmonic_ratio'], 0.02 / 0.98, rtol=1e-3)
+    assert record['fundamental_power'][0] == pytest.approx(3 * 230.0 * 16.0 * 0.98 * 0.98, rel=1e-3)
+    # A block of zero words decodes without dividing by zero
+    np.testing.assert_array_equal(decode_pq(np.zeros(len(PQ_REGISTERS)))['harmonic_ratio'], [[0.0] * 4])
+
+
+def test_calibration_measurements_decoder(steady_meter):
+    words = steady_meter.transfer_batch(MEASUREMENT_DECODER.batch)
+    measured = decode_measurements(words)
+    np.testing.assert_allclose(measured['voltage'], [[230.0] * 3], atol=0.01)
+    np.testing.assert_allclose(measured['current'], [[16.0] * 3], atol=0.001)
+    np.testing.assert_allclose(measured['power'], [[230.0 * 16.0 * 0.98] * 3], rtol=1e-3)
+
+
+def test_snapshot_arrays_match_driver_decode(steady_meter):
+    buffer = RawSampleBuffer(10, steady_meter.EXTENDED_SNAPSHOT_REGISTERS)
+    words = steady_meter.transfer_batch(steady_meter._extended_snapshot_batch)
+    buffer.append((1.0, words))
+    arrays = buffer.snapshot_arrays()
+    snapshot = steady_meter.decode_snapshot(words, 1.0)
+    np.testing.assert_allclose(arrays['voltage'][0], snapshot.voltage)
+    np.testing.assert_allclose(arrays['current'][0], snapshot.current)
+    np.testing.assert_allclose(arrays['power'][0], snapshot.power)
+    np.testing.assert_allclose(arrays['phase_angle'][0], snapshot.phase_angle)
+    assert arrays['frequency'][0] == pytest.approx(snapshot.frequency)
+
+
+def test_pq_decoder_reads_the_buffered_registers():
+    assert _PQ_DECODER.addresses == tuple(resolve(PQ_REGISTERS))
@@ -0,0 +1,77 @@
+import struct
+
+import pytest
+
+import emulator
+import Metering_1
+from energy import ENERGY_LSB_KWH, ENERGY_REGISTERS, EnergyAccumulator
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def energy_meter(clock):
+    chip = emulator.EmulatedATM90E3x(emulator.Waveform(ripple=0.0), clock=clock)
+    meter = Metering_1.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip))
+    yield meter
+    meter.close()
+
+
+def test_drain_accumulates_read_to_clear_registers(clock, energy_meter):
+    accumulator = EnergyAccumulator(energy_meter)
+    clock.now += 10.0
+    first = accumulator.drain()
+    assert first[ENERGY_REGISTERS.index('APenergyT')] > 0
+    # The registers cleared on read: a drain with no time elapsed adds nothing
+    assert not any(accumulator.drain())
+    clock.now += 10.0
+    second = accumulator.drain()
+
+    counters = accumulator.counters()
+    for i, name in enumerate(ENERGY_REGISTERS):
+        assert counters[name] == first[i] + second[i]
+    assert accumulator.drains == 3
+    assert accumulator.energy_kwh()['APenergyT'] == pytest.approx(counters['APenergyT'] * ENERGY_LSB_KWH)
+
+
+def test_counters_persist_across_restart(tmp_path, clock, energy_meter):
+    path = str(tmp_path / 'energy.bin')
+    accumulator = EnergyAccumulator(energy_meter, path=path)
+    clock.now += 10.0
+    accumulator.drain()
+    saved = accumulator.counters()
+    assert saved['APenergyT'] > 0
+
+    restored = EnergyAccumulator(energy_meter, path=path)
+    assert restored.counters() == saved
+    clock.now += 10.0
+    words = restored.drain()
+    assert restored.counters()['APenergyT'] == saved['APenergyT'] + words[ENERGY_REGISTERS.index('APenergyT')]
+    assert EnergyAccumulator(energy_meter, path=path).counters() == restored.counters()
+
+
+def test_reset_persists_zero_counters(tmp_path, clock, energy_meter):
+    path = str(tmp_path / 'energy.bin')
+    accumulator = EnergyAccumulator(energy_meter, path=path)
+    clock.now += 10.0
+    accumulator.drain()
+    accumulator.reset()
+    assert not any(EnergyAccumulator(energy_meter, path=path).counters().values())
+
+
+def test_load_rejects_foreign_file(tmp_path, energy_meter):
+    path = tmp_path / 'energy.bin'
+    path.write_bytes(struct.pack('<4sHH', b'XXXX', 1, len(ENERGY_REGISTERS)))
+    with pytest.raises(RuntimeError):
+        EnergyAccumulator(energy_meter, path=str(path))
@@ -0,0 +1,127 @@
+import os
+
+import numpy as np
+import pytest
+
+from exporter import BINARY, CSV, INDEX_SUFFIX, SampleExporter, read_file
+
+START = 1_700_000_040.0
+
+
+@pytest.fixture
+def samples(meter):
+    # Real snapshot words from the emulator, half a second apart
+    words = np.array([meter.read_snapshot_raw() for _ in range(300)], dtype=np.uint16)
+    words[::7, 0] = 0xFFFF  # wrap the delta encoding now and then
+    timestamps = START + 0.5 * np.arange(len(words))
+    return meter.SNAPSHOT_REGISTERS, timestamps, words
+
+
+@pytest.mark.parametrize('format', [BINARY, CSV])
+def test_round_trip(tmp_path, samples, format):
+    columns, timestamps, words = samples
+    exporter = SampleExporter(str(tmp_path), columns, rotate_s=60, batch_size=32, format=format)
+    exporter.extend(timestamps, words)
+    exporter.close()
+
+    files = exporter.files()
+    assert len(files) == 3  # 150 s of samples across two 60 s boundaries
+    assert sum(count for _, _, _, count in files) == len(words)
+    stamps, read = exporter.read_range()
+    np.testing.assert_allclose(stamps, timestamps)
+    np.testing.assert_array_equal(read, words)
+    assert read.dtype == np.uint16
+
+
+@pytest.mark.parametrize('format', [BINARY, CSV])
+def test_read_range_filters_half_open(tmp_path, samples, format):
+    columns, timestamps, words = samples
+    exporter = SampleExporter(str(tmp_path), columns, rotate_s=60, batch_size=32, format=format)
+    exporter.extend(timestamps, words)
+    exporter.close()
+
+    start, end = timestamps[50], timestamps[170]
+    assert len(exporter.files(start, end)) == 2
+    stamps, read = exporter.read_range(start, end)
+    np.testing.assert_allclose(stamps, timestamps[50:170])
+    np.testing.assert_array_equal(read, words[50:170])
+
+
+def test_read_range_includes_staged_samples(tmp_path, samples):
+    columns, timestamps, words = samples
+    exporter = SampleExporter(str(tmp_path), columns, batch_size=1000)
+    exporter.extend(timestamps[:10], words[:10])
+    _, read = exporter.read_range()
+    np.testing.assert_array_equal(read, words[:10])
+    exporter.close()
+
+
+def test_rebuild_index_after_loss(tmp_path, samples):
+    columns, timestamps, words = samples
+    exporter = SampleExporter(str(tmp_path), columns, rotate_s=60, batch_size=32)
+    exporter.extend(timestamps, words)
+    exporter.close()
+    expected = exporter.files()
+
+    os.remove(tmp_path / f'meter{INDEX_SUFFIX}')
+    reopened = SampleExporter(str(tmp_path), columns, rotate_s=60)
+    assert reopened.files() == expected
+
+    (tmp_path / f'meter{INDEX_SUFFIX}').write_text('{not json')
+    reopened.rebuild_index()
+    assert SampleExporter(str(tmp_path), columns, rotate_s=60).files() == expected
+
+
+@pytest.mark.parametrize('format', [BINARY, CSV])
+def test_stale_index_is_rescanned_after_crash(tmp_path, samples, format):
+    columns, timestamps, words = samples
+    exporter = SampleExporter(str(tmp_path), columns, batch_size=50, fsync_interval=3600, format=format)
+    exporter.extend(timestamps[:100], words[:100])
+    exporter.flush()  # index saved with 100 samples
+    exporter.extend(timestamps[100:], words[100:])
+    exporter.flush(sync=False)  # written but not indexed, then the process dies
+
+    reopened = SampleExporter(str(tmp_path), columns, batch_size=50, format=format)
+    (_, first, last, count), = reopened.files()
+    assert (first, last, count) == (timestamps[0], timestamps[-1], len(words))
+    stamps, read = reopened.read_range(timestamps[150])
+    np.testing.assert_allclose(stamps, timestamps[150:])
+    np.testing.assert_array_equal(read, words[150:])
+    exporter.close()
+
+
+def test_prefixes_keep_separate_indexes(tmp_path, samples):
+    columns, timestamps, words = samples
+    first = SampleExporter(str(tmp_path), columns, prefix='meter', batch_size=50)
+    second = SampleExporter(str(tmp_path), columns, prefix='meter2', batch_size=50)
+    first.extend(timestamps[:100], words[:100])
+    second.extend(timestamps[100:], words[100:])
+    first.close()
+    second.close()
+
+    assert os.path.exists(tmp_path / f'meter{INDEX_SUFFIX}')
+    assert os.path.exists(tmp_path / f'meter2{INDEX_SUFFIX}')
+    for prefix, expected in (('meter', words[:100]), ('meter2', words[100:])):
+        _, read = SampleExporter(str(tmp_path), columns, prefix=prefix).read_range()
+        np.testing.assert_array_equal(read, expected)
+
+
+def test_read_file_skips_truncated_chunk(tmp_path, samples):
+    columns, timestamps, words = samples
+    exporter = SampleExporter(str(tmp_path), columns, batch_size=100)
+    exporter.extend(timestamps[:200], words[:200])
+    exporter.close()
+    (path, _, _, _), = exporter.files()
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 10)
+
+    read_columns, _, read = read_file(path)
+    assert read_columns == tuple(columns)
+    np.testing.assert_array_equal(read, words[:100])
+
+
+def test_invalid_arguments_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        SampleExporter(str(tmp_path), ('UrmsA',), format='parquet')
+    with pytest.raises(ValueError):
+        SampleExporter(str(tmp_path), ('UrmsA',), batch_size=0)
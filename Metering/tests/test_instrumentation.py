@@ -0,0 +1,56 @@
+import logging
+import threading
+
+from instrumentation import RateLimitedLogger
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _logger():
+    logging.disable(logging.NOTSET)
+    logger = logging.getLogger('test_instrumentation')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    capture = _Capture()
+    logger.handlers = [capture]
+    return logger, capture
+
+
+def test_suppressed_records_are_counted_across_threads():
+    logger, capture = _logger()
+    limited = RateLimitedLogger(logger, interval=3600.0)
+    threads, calls = 8, 2000
+
+    def worker():
+        for _ in range(calls):
+            limited.warning('key', "transfer failed", register=0x1D9)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    assert len(capture.records) == 1
+
+    limited.interval = 0.0
+    limited.warning('key', "transfer failed")
+    assert capture.records[-1].getMessage() == f"transfer failed (+{threads * calls - 1} suppressed)"
+    assert capture.records[-1].meter_fields == {'key': 'key'}
+
+
+def test_keys_are_limited_independently_and_disabled_levels_skip():
+    logger, capture = _logger()
+    limited = RateLimitedLogger(logger, interval=3600.0)
+    limited.error('a', "first %d", 1)
+    limited.error('b', "second")
+    limited.error('a', "again")
+    limited.debug('c', "hidden")
+    assert [record.getMessage() for record in capture.records] == ["first 1", "second"]
+    assert not limited.enabled(logging.DEBUG)
@@ -0,0 +1,68 @@
+import json
+
+import caalibration
+import emulator
+import Metering_1
+from calibration_profiles import default_device_id
+from command_table import resolve
+from link_tuning import REFERENCE_PATTERNS, REFERENCE_REGISTERS, LinkTuner, load_tuned_speed
+
+DEVICE_ID = default_device_id(0, 0)
+RATES = (50000, 100000, 200000, 500000, 1000000)
+
+
+def _meter(chip, **kwargs):
+    return Metering_1.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip, max_reliable_hz=250000, seed=1),
+                               **kwargs)
+
+
+def test_tune_picks_fastest_reliable_rate_and_persists_it(chip, tmp_path):
+    state = str(tmp_path / 'spi_speed.json')
+    meter = _meter(chip)
+    try:
+        chosen = LinkTuner(meter, rates=RATES, batches=20, margin=0.25, state_path=state).tune()
+    finally:
+        meter.close()
+    assert chosen == 150000
+    assert meter.speed_hz == chosen
+    saved = json.load(open(state))[DEVICE_ID]
+    assert saved['speed_hz'] == chosen
+    assert saved['max_ok_hz'] == 200000
+    assert load_tuned_speed(state, DEVICE_ID) == chosen
+
+
+def test_reference_uses_loaded_patterns_and_restores_registers(meter, chip):
+    addresses = resolve(REFERENCE_REGISTERS)
+    for address, value in zip(addresses, range(0x1000, 0x1000 + len(addresses))):
+        chip.words[address] = value
+    before = [chip.words[address] for address in addresses]
+    tuner = LinkTuner(meter, rates=RATES[:2], batches=2)
+    with tuner._patterns():
+        assert tuner.reference() == list(REFERENCE_PATTERNS)
+    assert [chip.words[address] for address in addresses] == before
+    tuner.sweep()
+    assert [chip.words[address] for address in addresses] == before
+    assert meter.reset_monitor.poll() is False
+
+
+def test_drivers_start_at_tuned_speed(chip, tmp_path):
+    state = tmp_path / 'spi_speed.json'
+    state.write_text(json.dumps({DEVICE_ID: {'speed_hz': 123000}, 'meter7': {'speed_hz': 456000}}))
+    meter = Metering_1.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip), speed_state_path=str(state))
+    try:
+        assert meter.speed_hz == 123000
+        assert meter.spi.max_speed_hz == 123000
+    finally:
+        meter.close()
+    configured = caalibration.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip), device_id='meter7',
+                                       speed_state_path=str(state))
+    assert configured.spi.max_speed_hz == 456000
+
+
+def test_untuned_device_keeps_requested_speed(chip, tmp_path):
+    meter = Metering_1.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip), speed_hz=300000,
+                                speed_state_path=str(tmp_path / 'missing.json'))
+    try:
+        assert meter.speed_hz == 300000
+    finally:
+        meter.close()
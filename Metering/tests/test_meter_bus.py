@@ -0,0 +1,102 @@
+import pytest
+
+import emulator
+import meter_bus
+import Metering_1
+import registers as reg
+from meter_bus import MeterBus
+
+
+class FakeGPIO:
+    BCM = 'bcm'
+    OUT = 'out'
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self):
+        self.pulses = 0
+        self.cleanups = 0
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction):
+        pass
+
+    def output(self, pin, level):
+        if level == self.LOW:
+            self.pulses += 1
+
+    def cleanup(self):
+        self.cleanups += 1
+
+
+class ChipSelectSpiDev(emulator.SpiDev):
+    """Emulated bus: open() selects one of several chips by chip select."""
+
+    def __init__(self, chips):
+        super().__init__()
+        self.chips = chips
+
+    def open(self, bus, device):
+        super().open(bus, device)
+        self.device = self.chips[device]
+
+
+@pytest.fixture
+def chips():
+    return [emulator.EmulatedATM90E3x(), emulator.EmulatedATM90E3x()]
+
+
+@pytest.fixture
+def gpio(monkeypatch):
+    fake = FakeGPIO()
+    monkeypatch.setattr(meter_bus, 'GPIO', fake)
+    monkeypatch.setattr(Metering_1, 'GPIO', fake)
+    monkeypatch.setattr(Metering_1.time, 'sleep', lambda s: None)
+    return fake
+
+
+def test_adding_a_device_does_not_reset_the_others(chips, gpio):
+    bus = MeterBus(spi_factory=lambda: ChipSelectSpiDev(chips))
+    bus.add_device('a', 0, rate_hz=10)
+    assert gpio.pulses == 1  # the shared line, once, before the first chip
+    chips[0].write(reg.CfgRegAccEn, emulator.CFG_ACCESS_KEY)
+    chips[0].write(reg.SagTh, 0x1234)
+
+    bus.add_device('b', 1, rate_hz=10)
+    assert gpio.pulses == 1
+    assert chips[0].words[reg.SagTh] == 0x1234
+
+    bus.close()
+    assert gpio.cleanups == 1
+
+
+def test_device_with_own_reset_line_is_hard_reset(chips, gpio):
+    bus = MeterBus(spi_factory=lambda: ChipSelectSpiDev(chips))
+    bus.add_device('a', 0, rate_hz=10)
+    bus.add_device('b', 1, rate_hz=10, reset_pin=24)
+    assert gpio.pulses == 2
+    assert bus.channels['b'].meter.reset_pin == 24
+    bus.close()
+    assert gpio.cleanups == 1
+
+
+def test_add_meter_requires_the_bus_lock(chip):
+    bus = MeterBus()
+    meter = Metering_1.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip))
+    with pytest.raises(ValueError, match='bus lock'):
+        bus.add_meter('a', meter, rate_hz=10)
+    shared = Metering_1.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip), bus_lock=bus.lock)
+    assert bus.add_meter('a', shared, rate_hz=10).meter is shared
+
+
+def test_scheduler_serves_every_channel(chips):
+    bus = MeterBus(spi_factory=lambda: ChipSelectSpiDev(chips))
+    bus.add_device('a', 0, rate_hz=200)
+    bus.add_device('b', 1, rate_hz=100, priority=1)
+    bus.run(duration=0.2)
+    stats = bus.stats()
+    assert stats['a']['samples'] > stats['b']['samples'] > 0
+    assert stats['a']['errors'] == stats['b']['errors'] == 0
+    bus.close()
@@ -0,0 +1,45 @@
+import threading
+
+from events import SAG, MeterEvent
+from Metering_1 import Snapshot
+from pq_events import PQEventDetector, PQThresholds
+
+
+def _snapshot(timestamp, voltage):
+    return Snapshot(timestamp, [voltage] * 3, [1.0] * 3, [0.0] * 3, 50.0, [0.0] * 3)
+
+
+def _run(detector, voltages):
+    worker = threading.Thread(target=lambda: [detector.update(_snapshot(i, v)) for i, v in enumerate(voltages)],
+                              daemon=True)
+    worker.start()
+    worker.join(timeout=5.0)
+    return not worker.is_alive()
+
+
+def test_callbacks_may_call_back_into_detector():
+    seen = []
+    detector = PQEventDetector(PQThresholds(), pre_samples=2, post_samples=2, confirm=1,
+                               on_detect=lambda event: seen.append(('detect', detector.active())),
+                               callback=lambda event: seen.append(('event', detector.active())))
+    assert _run(detector, [230.0, 150.0, 150.0, 150.0, 230.0, 230.0])
+    assert seen[0] == ('detect', [(SAG, phase) for phase in ('A', 'B', 'C')])
+    assert [name for name, _ in seen].count('event') == 3
+    assert detector.wait_event(timeout=0).kind == SAG
+
+
+def test_interrupt_detect_callback_runs_outside_lock():
+    seen = []
+    detector = PQEventDetector(PQThresholds(), on_detect=lambda event: seen.append(detector.active()))
+    detector.handle_interrupt(MeterEvent(SAG, 'A', 1.0, None))
+    assert seen == [[(SAG, 'A')]]
+
+
+def test_failing_callback_does_not_stop_detection():
+    def fail(event):
+        raise RuntimeError("boom")
+
+    detector = PQEventDetector(PQThresholds(), post_samples=1, confirm=1, on_detect=fail, callback=fail)
+    assert _run(detector, [150.0, 150.0])
+    assert detector.detected == 3
+    assert detector.wait_event(timeout=0) is not None
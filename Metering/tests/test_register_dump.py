@@ -0,0 +1,75 @@
+import json
+import sys
+
+import pytest
+
+import emulator
+import register_dump
+import registers as reg
+from calibration_profiles import encode_profile
+from register_dump import (MEASUREMENT_BASE, SpiReader, diff, dump_registers, format_diff, load_profile,
+                           load_snapshot, save_snapshot, snapshot)
+
+
+def _reader(chip):
+    return SpiReader(spi_factory=lambda: emulator.SpiDev(device=chip))
+
+
+def test_dump_reads_every_register_in_one_pass(config_meter, chip):
+    reader = _reader(chip)
+    frames = chip.frames
+    registers = dump_registers(reader)
+    assert chip.frames - frames == len(registers)
+    assert 'APenergyT' not in registers
+    assert registers['UgainA'] == chip.words[reg.UgainA] == 0xC720
+    for name, value in registers.items():
+        if getattr(reg, name) < MEASUREMENT_BASE and name != 'LastSPIData':
+            assert value == chip.words[getattr(reg, name)], name
+    assert 'APenergyT' in dump_registers(reader, energy=True)
+
+
+def test_snapshot_round_trip_and_diff(tmp_path, chip):
+    first = snapshot(_reader(chip), device_id='meter0')
+    chip.write(reg.CfgRegAccEn, emulator.CFG_ACCESS_KEY)
+    chip.write(reg.UgainA, 0xB000)
+    second = snapshot(_reader(chip), device_id='meter0')
+    save_snapshot(first, str(tmp_path / 'first.json'))
+    save_snapshot(second, str(tmp_path / 'second.json'))
+
+    a, b = load_snapshot(str(tmp_path / 'first.json')), load_snapshot(str(tmp_path / 'second.json'))
+    differences = diff(a, b)
+    assert (reg.UgainA, a[reg.UgainA], 0xB000) in differences
+    assert all(address < MEASUREMENT_BASE for address, _, _ in differences)
+    assert 'UgainA' in format_diff(differences)
+    assert diff(a, a) == []
+
+
+def test_load_snapshot_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.json'
+    path.write_text(json.dumps({'format': 'something-else', 'registers': {}}))
+    with pytest.raises(ValueError):
+        load_snapshot(str(path))
+
+
+def test_load_profile_formats(tmp_path):
+    cal = tmp_path / 'meter0.cal'
+    cal.write_bytes(encode_profile({reg.UgainA: 0xB000}, 'meter0'))
+    assert load_profile(str(cal)) == {reg.UgainA: 0xB000}
+    mapping = tmp_path / 'profile.json'
+    mapping.write_text(json.dumps({'UgainA': '0xB000', '0x62': 5}))
+    assert load_profile(str(mapping)) == {reg.UgainA: 0xB000, reg.IgainA: 5}
+    mapping.write_text(json.dumps({'NoSuchRegister': 1}))
+    with pytest.raises(ValueError, match='NoSuchRegister'):
+        load_profile(str(mapping))
+
+
+def test_diff_against_profile_cli(tmp_path, chip, monkeypatch, capsys):
+    path = str(tmp_path / 'dump.json')
+    save_snapshot(snapshot(_reader(chip), device_id='meter0'), path)
+    profile = tmp_path / 'profile.json'
+    profile.write_text(json.dumps({'UgainA': chip.words[reg.UgainA]}))
+    monkeypatch.setattr(sys, 'argv', ['register_dump.py', 'diff', path, '--profile', str(profile)])
+    assert register_dump.main() == 0
+    profile.write_text(json.dumps({'UgainA': chip.words[reg.UgainA] ^ 1}))
+    assert register_dump.main() == 1
+    assert 'UgainA' in capsys.readouterr().out
@@ -0,0 +1,99 @@
+import numpy as np
+
+from rollup import RollupEngine
+
+
+def _engine(**kwargs):
+    return RollupEngine(fields=('value',), energy_fields=('kwh',), resolutions=(1, 60), **kwargs)
+
+
+def _feed(engine, times, energy=True):
+    for t in times:
+        engine.add(t, [t], [t / 10] if energy else None)
+
+
+def test_coarse_buckets_fold_fine_buckets():
+    engine = _engine()
+    _feed(engine, np.arange(0, 120.5, 0.5))
+    fine = engine.query(resolution=1)
+    assert len(fine['start']) == 120
+    assert (fine['count'] == 2).all()
+    # The 60 s bucket closes as soon as the first sample past it arrives
+    coarse = engine.query(resolution=60)
+    assert coarse['start'].tolist() == [0.0, 60.0]
+    assert coarse['count'].tolist() == [120, 120]
+    assert coarse['min'][:, 0].tolist() == [0.0, 60.0]
+    assert coarse['max'][:, 0].tolist() == [59.5, 119.5]
+    assert coarse['mean'][:, 0].tolist() == [29.75, 89.75]
+    assert np.allclose(coarse['energy'][:, 0], [5.95, 6.0])
+
+
+def test_open_bucket_includes_finer_open_buckets():
+    engine = _engine()
+    _feed(engine, np.arange(0, 90.5, 0.5))
+    result = engine.query(resolution=60, include_open=True)
+    assert result['start'].tolist() == [0.0, 60.0]
+    assert result['count'].sum() == 181
+    assert result['last'][-1, 0] == 90.0
+    assert np.isclose(result['energy'].sum(), 9.0)
+
+
+def test_flush_keeps_buckets_open():
+    engine = _engine()
+    _feed(engine, np.arange(0, 30.5, 0.5))
+    engine.flush()
+    assert engine.query(resolution=60)['count'].tolist() == [61]
+    assert engine.query(resolution=1)['start'][-1] == 30.0
+    assert np.isclose(engine.energy(resolution=60)['kwh'], 3.0)
+
+    _feed(engine, [30.5, 45.0, 59.5])
+    engine.flush()
+    coarse = engine.query(resolution=60)
+    assert coarse['start'].tolist() == [0.0]
+    assert coarse['count'].tolist() == [64]
+    assert np.isclose(coarse['energy'].sum(), 5.95)
+    fine = engine.query(resolution=1)
+    assert len(set(fine['start'].tolist())) == len(fine['start'])
+    assert fine['count'][fine['start'] == 30.0].tolist() == [2]
+
+    _feed(engine, [60.0])
+    coarse = engine.query(resolution=60)
+    assert coarse['start'].tolist() == [0.0]
+    assert coarse['count'].tolist() == [64]
+    assert np.isclose(engine.energy(resolution=60, end=60)['kwh'], 5.95)
+
+
+def test_flush_with_full_ring_drops_only_the_oldest():
+    engine = _engine(capacity={1: 4})
+    _feed(engine, [0, 1, 2, 3, 4, 4.5])
+    engine.flush()
+    assert engine.query(resolution=1)['start'].tolist() == [1.0, 2.0, 3.0, 4.0]
+    _feed(engine, [5])
+    assert engine.query(resolution=1)['start'].tolist() == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_backwards_timestamps_are_clamped():
+    engine = _engine()
+    _feed(engine, [10, 11, 12.2])
+    before = engine.query(resolution=1)
+    engine.add(5, [5], [0.5])
+    engine.add(11.5, [11.5], [1.15])
+    assert engine.clamped == 2
+    after = engine.query(resolution=1)
+    assert after['start'].tolist() == before['start'].tolist() == [10.0, 11.0]
+    assert after['count'].tolist() == before['count'].tolist()
+    engine.flush()
+    assert engine.query(resolution=1)['count'][-1] == 3
+
+
+def test_carried_energy_and_series():
+    engine = _engine()
+    engine.add(0, [1], [1.0])
+    engine.add(0.5, [3], None)
+    engine.add(1.0, [5], [1.5])
+    starts, means = engine.series('value', resolution=1)
+    assert starts.tolist() == [0.0]
+    assert means.tolist() == [2.0]
+    assert np.isclose(engine.energy(resolution=1)['kwh'], 0.0)
+    engine.flush()
+    assert np.isclose(engine.energy(resolution=60)['kwh'], 0.5)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import Metering_1
+from sample_buffer import RawSampleBuffer
+
+
+def test_ring_keeps_latest_samples_in_order():
+    buffer = RawSampleBuffer(3, ['a', 'b'])
+    for i in range(5):
+        buffer.append((float(i), [i, 100 + i]))
+    timestamps, words = buffer.raw()
+    assert len(buffer) == 3
+    assert timestamps.tolist() == [2.0, 3.0, 4.0]
+    assert words[:, 1].tolist() == [102, 103, 104]
+    assert buffer.raw(2)[0].tolist() == [3.0, 4.0]
+    assert buffer.between(3.0, 10.0)[0].tolist() == [3.0, 4.0]
+
+    buffer.extend(np.arange(10.0, 14.0), [[i, i] for i in range(4)])
+    assert buffer.raw()[0].tolist() == [11.0, 12.0, 13.0]
+    assert buffer.nbytes == 3 * 2 * 2 + 3 * 8
+
+
+def test_column_scaling_and_recombination():
+    buffer = RawSampleBuffer(4, ['word', 'high', 'low'])
+    buffer.append((0.0, [0xFFFE, 0xFFFF, 0xFFF6]))
+    buffer.append((1.0, [0x0002, 0x0001, 0x0000]))
+    assert buffer.scaled('word', 0.5).tolist() == [32767.0, 1.0]
+    assert buffer.scaled('word', 0.5, signed=True).tolist() == [-1.0, 1.0]
+    assert buffer.combined('high', 'low', 1.0).tolist() == [-10.0, 65536.0]
+    assert buffer.combined('high', 'low', 1.0, signed=False).tolist() == [0xFFFFFFF6, 65536.0]
+    with pytest.raises(ValueError, match='missing'):
+        buffer.scaled('missing', 1.0)
+
+
+def test_invalid_capacity():
+    with pytest.raises(ValueError):
+        RawSampleBuffer(0, ['a'])
+
+
+@pytest.mark.parametrize('extended', [False, True])
+def test_snapshot_arrays_match_driver_decoding(meter, extended):
+    registers = meter.EXTENDED_SNAPSHOT_REGISTERS if extended else meter.SNAPSHOT_REGISTERS
+    batch = meter._extended_snapshot_batch if extended else meter._snapshot_batch
+    buffer = RawSampleBuffer(8, registers)
+    snapshots = []
+    for i in range(5):
+        words = meter.transfer_batch(batch)
+        buffer.append((float(i), words))
+        snapshots.append(Metering_1.ATM90E3x.decode_snapshot(words, float(i)))
+
+    arrays = buffer.snapshot_arrays()
+    assert arrays['timestamp'].tolist() == [s.timestamp for s in snapshots]
+    for field in ('voltage', 'current', 'power', 'phase_angle'):
+        np.testing.assert_allclose(arrays[field], [getattr(s, field) for s in snapshots])
+    np.testing.assert_allclose(arrays['frequency'], [s.frequency for s in snapshots])
+    assert buffer.snapshot_arrays(2)['voltage'].shape == (2, 3)
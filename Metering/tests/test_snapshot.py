@@ -0,0 +1,96 @@
+import ctypes
+
+import pytest
+
+import emulator
+import Metering_1
+import spi_batch
+from spi_batch import SpiBatch, read_batch, read_frame, spi_ioc_message, write_frame
+
+
+@pytest.fixture
+def steady_meter():
+    chip = emulator.EmulatedATM90E3x(emulator.Waveform(ripple=0.0))
+    meter = Metering_1.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip))
+    yield meter, chip
+    meter.close()
+
+
+def test_snapshot_is_one_batch(steady_meter):
+    meter, chip = steady_meter
+    frames = chip.frames
+    snapshot = meter.read_snapshot()
+    assert chip.frames - frames == len(meter.SNAPSHOT_REGISTERS) == 16
+    assert snapshot.voltage == pytest.approx((230.0,) * 3, abs=0.01)
+    assert snapshot.current == pytest.approx((16.0,) * 3, abs=0.001)
+    # Snapshot power is the apparent power (SmeanA-C)
+    assert snapshot.power == pytest.approx((230.0 * 16.0,) * 3, rel=1e-3)
+    assert snapshot.frequency == pytest.approx(50.0)
+
+
+def test_snapshot_matches_single_register_reads(steady_meter):
+    meter, _ = steady_meter
+    snapshot = meter.read_snapshot()
+    assert snapshot.voltage == tuple(meter.read_voltage(p) for p in 'ABC')
+    assert snapshot.current == tuple(meter.read_current(p) for p in 'ABC')
+    assert snapshot.frequency == meter.read_frequency()
+    assert snapshot.phase_angle == tuple(meter.read_phase_angle(p) for p in 'ABC')
+
+
+def test_extended_snapshot_adds_lsb_registers(steady_meter):
+    meter, chip = steady_meter
+    chip.waveform.voltage = 230.123
+    frames = chip.frames
+    coarse = meter.read_snapshot()
+    extended = meter.read_snapshot(extended=True)
+    assert chip.frames - frames == 16 + 22
+    assert abs(extended.voltage[0] - 230.123) < abs(coarse.voltage[0] - 230.123)
+    stats = meter.snapshot_stats()
+    assert stats['snapshots'] == 2
+    assert stats['registers'] == 38
+
+
+def test_batch_layout():
+    batch = SpiBatch([read_frame(0x1D9), write_frame(0x7F, 0x55AA)])
+    assert batch.count == 2
+    assert batch.addresses == (0x1D9, 0x7F)
+    assert batch.writes == (False, True)
+    assert batch.frames == ((0x81, 0xD9, 0, 0), (0x00, 0x7F, 0x55, 0xAA))
+    with pytest.raises(ValueError):
+        SpiBatch([(0x80, 0x01, 0x00)])
+    with pytest.raises(ValueError):
+        spi_ioc_message(0)
+
+
+class IoctlSpiDev:
+    """Exposes fileno() so SpiBatch takes the single-ioctl path."""
+
+    def __init__(self, chip):
+        self.device = emulator.SpiDev(device=chip)
+        self.device.open(0, 0)
+        self.requests = []
+        self.cs_change = None
+
+    def fileno(self):
+        return -1
+
+
+def test_batch_is_one_ioctl(monkeypatch):
+    chip = emulator.EmulatedATM90E3x()
+    spi = IoctlSpiDev(chip)
+
+    def ioctl(fd, request, xfers):
+        spi.requests.append(request)
+        for xfer in xfers:
+            tx = ctypes.string_at(xfer.tx_buf, xfer.len)
+            rx = bytes(spi.device.xfer2(list(tx)))
+            ctypes.memmove(xfer.rx_buf, rx, len(rx))
+        spi.cs_change = [xfer.cs_change for xfer in xfers]
+
+    monkeypatch.setattr(spi_batch.fcntl, 'ioctl', ioctl)
+    addresses = [0x1D9, 0x1E9, 0x1F9]
+    batch = read_batch(addresses)
+    expected = [chip.read(address) for address in addresses]
+    assert batch.words(spi) == expected
+    assert spi.requests == [spi_ioc_message(3)]
+    assert spi.cs_change == [1, 1, 0]
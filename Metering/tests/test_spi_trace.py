@@ -0,0 +1,92 @@
+import pytest
+
+import emulator
+import Metering_1
+from spi_trace import BATCH, XFER, RecordingSpiDev, ReplayMismatch, ReplaySpiDev, read_trace, recording_factory
+
+
+def _session(meter):
+    return meter.read_snapshot()[1:], meter.read_voltage(), meter.read_frequency()
+
+
+def test_recorded_session_replays_identically(chip, tmp_path):
+    path = str(tmp_path / 'session.sptr')
+    meter = Metering_1.ATM90E3x(spi_factory=recording_factory(path, lambda: emulator.SpiDev(device=chip)))
+    try:
+        recorded = _session(meter)
+        records = meter.spi._spi.records
+    finally:
+        meter.close()
+    assert len(read_trace(path)) == records > 0
+
+    replay = ReplaySpiDev(path)
+    meter = Metering_1.ATM90E3x(spi_factory=lambda: replay)
+    try:
+        assert _session(meter) == recorded
+    finally:
+        meter.close()
+    assert replay.replayed == records
+
+
+def _trace(tmp_path, records):
+    path = str(tmp_path / 'trace.sptr')
+    clock = iter(float(t) for t, _, _ in records)
+    recorder = RecordingSpiDev(emulator.SpiDev(), path, clock=lambda: next(clock))
+    for _, tx, rx in records:
+        recorder.trace_batch(tx, rx)
+    recorder.close()
+    return path
+
+
+def test_batch_replays_frame_by_frame(tmp_path):
+    path = _trace(tmp_path, [(0.0, b'\x80\x01\x00\x00\x80\x02\x00\x00', b'\x80\x01\x12\x34\x80\x02\x56\x78')])
+    assert read_trace(path)[0][1] == BATCH
+    replay = ReplaySpiDev(path)
+    replay.open(0, 0)
+    assert replay.xfer2([0x80, 0x01, 0, 0]) == [0x80, 0x01, 0x12, 0x34]
+    assert replay.xfer2([0x80, 0x02, 0, 0]) == [0x80, 0x02, 0x56, 0x78]
+    with pytest.raises(EOFError):
+        replay.xfer2([0x80, 0x01, 0, 0])
+
+
+def test_strict_replay_rejects_other_commands(tmp_path):
+    path = _trace(tmp_path, [(0.0, b'\x80\x01\x00\x00', b'\x00\x00\x12\x34')])
+    replay = ReplaySpiDev(path)
+    replay.open(0, 0)
+    with pytest.raises(ReplayMismatch):
+        replay.xfer2([0x80, 0x02, 0, 0])
+    loose = ReplaySpiDev(path, strict=False, loop=True)
+    loose.open(0, 0)
+    assert loose.xfer2([0x80, 0x02, 0, 0]) == loose.xfer2([0x80, 0x03, 0, 0]) == [0, 0, 0x12, 0x34]
+
+
+def test_replay_keeps_recorded_timing(tmp_path):
+    path = _trace(tmp_path, [(10.0, b'\x80\x01\x00\x00', bytes(4)), (10.5, b'\x80\x01\x00\x00', bytes(4))])
+    delays = []
+    replay = ReplaySpiDev(path, rate=2.0, clock=lambda: 0.0, sleep=delays.append)
+    replay.open(0, 0)
+    replay.xfer2([0x80, 0x01, 0, 0])
+    replay.xfer2([0x80, 0x01, 0, 0])
+    assert delays == [0.25]
+
+
+def test_truncated_record_is_dropped(tmp_path):
+    path = _trace(tmp_path, [(0.0, b'\x80\x01\x00\x00', bytes(4)), (1.0, b'\x80\x02\x00\x00', bytes(4))])
+    with open(path, 'r+b') as f:
+        f.truncate(f.seek(0, 2) - 3)
+    assert [record[2] for record in read_trace(path)] == [b'\x80\x01\x00\x00']
+    with open(path, 'wb') as f:
+        f.write(b'JUNK')
+    with pytest.raises(ValueError):
+        read_trace(path)
+
+
+def test_recorder_passes_settings_through(tmp_path):
+    spi = emulator.SpiDev()
+    recorder = RecordingSpiDev(spi, str(tmp_path / 'trace.sptr'))
+    recorder.open(0, 0)
+    recorder.max_speed_hz = 500000
+    assert spi.max_speed_hz == 500000
+    recorder.xfer2([0x80, 0x01, 0, 0])
+    recorder.close()
+    assert [record[1] for record in read_trace(recorder.path)] == [XFER]
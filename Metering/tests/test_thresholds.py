@@ -0,0 +1,63 @@
+import pytest
+
+import caalibration
+import emulator
+import registers as reg
+from calibration_profiles import ProfileStore
+from pq_events import PQThresholds
+
+
+def _configure(chip, **kwargs):
+    return caalibration.ATM90E3x(spi_factory=lambda: emulator.SpiDev(device=chip), **kwargs)
+
+
+@pytest.mark.parametrize('linefreq, high, low', [
+    (0x0087, 5100, 4900),  # 50 Hz
+    (0x1185, 6100, 5900),  # 60 Hz
+    (0x146F, 6100, 5900),  # 60 Hz, split phase
+])
+def test_frequency_limits_follow_line_frequency(chip, linefreq, high, low):
+    _configure(chip, linefreq=linefreq, thresholds=PQThresholds())
+    assert chip.words[reg.MMode0] == linefreq
+    assert chip.words[reg.FreqHiTh] == high
+    assert chip.words[reg.FreqLoTh] == low
+
+
+def test_threshold_registers_written_with_configured_gains(chip):
+    thresholds = PQThresholds(nominal_voltage=120.0)
+    _configure(chip, linefreq=0x1185, ugainA=0xB000, igainA=0x8000, thresholds=thresholds)
+    for register, value in thresholds.registers(0xB000, 0x8000):
+        assert chip.words[register] == value
+    assert chip.words[reg.SagTh] != 0
+
+
+def test_sag_threshold_tracks_calibrated_voltage_gain(tmp_path):
+    thresholds = PQThresholds()
+    store = ProfileStore(str(tmp_path))
+    store.save('meter0', {reg.UgainA: 0x9000})
+
+    default_chip = emulator.EmulatedATM90E3x()
+    _configure(default_chip, device_id='meter0', thresholds=thresholds)
+    calibrated_chip = emulator.EmulatedATM90E3x()
+    _configure(calibrated_chip, device_id='meter0', thresholds=thresholds, profile_store=store)
+
+    assert calibrated_chip.words[reg.UgainA] == 0x9000
+    expected = dict(thresholds.registers(0x9000, 0x9F34))
+    assert calibrated_chip.words[reg.SagTh] == expected[reg.SagTh]
+    assert calibrated_chip.words[reg.SagTh] != default_chip.words[reg.SagTh]
+
+
+def test_thresholds_not_written_without_limits(chip):
+    _configure(chip)
+    assert chip.words[reg.FreqHiTh] == emulator.RESET_DEFAULTS.get(reg.FreqHiTh, 0)
+    assert chip.words[reg.SagTh] == emulator.RESET_DEFAULTS.get(reg.SagTh, 0)
+
+
+def test_thresholds_restored_after_chip_reset(chip):
+    meter = _configure(chip, linefreq=0x1185, thresholds=PQThresholds())
+    chip.write(reg.SoftReset, emulator.SOFT_RESET_KEY)
+    assert chip.words[reg.FreqHiTh] != 6100
+    assert meter.reset_monitor.poll() is True
+    assert meter.reset_monitor.wait(timeout=5.0)
+    assert chip.words[reg.FreqHiTh] == 6100
+    assert chip.words[reg.FreqLoTh] == 5900
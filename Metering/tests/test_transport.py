@@ -0,0 +1,177 @@
+import errno
+import threading
+
+import pytest
+
+import emulator
+import registers as reg
+import transport
+from spi_batch import read_batch, read_frame
+from transport import ResilientSpiDev, TransportDown
+
+
+class Faults:
+    """Number of upcoming transfers to fail, shared by every reopened handle."""
+
+    def __init__(self, count):
+        self.count = count
+
+
+class FlakySpiDev(emulator.SpiDev):
+    def __init__(self, device, faults):
+        super().__init__(device=device)
+        self.faults = faults
+
+    def xfer2(self, data):
+        if self.faults.count:
+            self.faults.count -= 1
+            raise OSError(errno.EIO, "Injected SPI fault")
+        return super().xfer2(data)
+
+
+def _link(chip, faults, **kwargs):
+    link = ResilientSpiDev(lambda: FlakySpiDev(chip, faults), sleep=lambda s: None, **kwargs)
+    link.open(0, 0)
+    return link
+
+
+def test_transient_fault_is_retried(chip):
+    link = _link(chip, Faults(1))
+    response = link.xfer2(list(read_frame(reg.MMode0)))
+    assert (response[2] << 8) | response[3] == chip.words[reg.MMode0]
+    counters = link.counters()
+    assert counters[transport.IO_ERROR] == 1
+    assert counters[transport.RETRIES] == 1
+    assert counters[transport.RECOVERED] == 1
+    assert not link.down
+
+
+def test_read_to_clear_batch_is_not_retried(chip):
+    link = _link(chip, Faults(1))
+    batch = read_batch([reg.APenergyT, reg.APenergyA])
+    with pytest.raises(OSError):
+        link.words(batch)
+    counters = link.counters()
+    assert counters[transport.NOT_RETRIED] == 1
+    assert counters[transport.RETRIES] == 0
+    # The next drain goes through normally
+    assert len(link.words(batch)) == 2
+
+
+def test_link_marked_down_after_retries(chip):
+    now = [0.0]
+    faults = Faults(100)
+    link = _link(chip, faults, retries=2, clock=lambda: now[0])
+    with pytest.raises(OSError):
+        link.xfer2(list(read_frame(reg.MMode0)))
+    assert link.down
+    with pytest.raises(TransportDown):
+        link.xfer2(list(read_frame(reg.MMode0)))
+    assert link.counters()[transport.REJECTED] == 1
+
+    # After the recovery delay the handle is reopened and the link comes back
+    now[0] += 1.0
+    faults.count = 0
+    link.xfer2(list(read_frame(reg.MMode0)))
+    assert not link.down
+    assert link.counters()[transport.REOPENS] >= 1
+
+
+def test_rearm_reads_digest_immediately(chip, config_meter):
+    monitor = config_meter.reset_monitor
+    monitor.expected = None
+    monitor.rearm()
+    assert monitor.expected == chip.read(reg.CRCDigest)
+
+
+def test_reset_detected_and_configuration_restored(chip, config_meter):
+    configured = list(chip.words[reg.SagTh:reg.IoffsetC + 1])
+    chip.write(reg.SoftReset, emulator.SOFT_RESET_KEY)
+    assert config_meter.reset_monitor.poll() is True
+    assert config_meter.reset_monitor.wait(timeout=5.0)
+    assert config_meter.link_stats()[transport.CHIP_RESET] == 1
+    assert list(chip.words[reg.SagTh:reg.IoffsetC + 1]) == configured
+    assert config_meter.reset_monitor.poll() is False
+
+
+def test_recovery_runs_off_the_polling_thread(chip, config_meter):
+    monitor = config_meter.reset_monitor
+    started = threading.Event()
+    release = threading.Event()
+    restore = monitor.configure
+
+    def slow_restore():
+        started.set()
+        release.wait(5.0)
+        restore()
+
+    monitor.configure = slow_restore
+    chip.write(reg.SoftReset, emulator.SOFT_RESET_KEY)
+    assert monitor.poll() is True  # returns while the restore is still running
+    assert started.wait(5.0)
+    assert monitor.recovering
+    assert monitor.poll() is False
+    release.set()
+    assert monitor.wait(timeout=5.0)
+    assert monitor.poll() is False
+    assert monitor.resets == 1
+
+
+def test_failed_recovery_is_retried(chip, config_meter):
+    monitor = config_meter.reset_monitor
+    monitor.interval_s = 0.0
+    restore = monitor.configure
+    attempts = []
+
+    def flaky_restore():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("bus busy")
+        restore()
+
+    monitor.configure = flaky_restore
+    chip.write(reg.SoftReset, emulator.SOFT_RESET_KEY)
+    assert monitor.poll() is True
+    monitor.wait(timeout=5.0)
+    assert monitor.poll() is True
+    monitor.wait(timeout=5.0)
+    assert len(attempts) == 2
+    assert monitor.poll() is False
+
+
+def test_direct_calibration_writes_are_not_reverted(chip, config_meter):
+    config_meter.calibrate_power_offsets('A', 5)
+    assert chip.words[reg.POffsetAF] == config_meter.calibration[reg.POffsetAF] == 0xFFFB
+    assert config_meter.reset_monitor.poll() is False
+    assert chip.words[reg.POffsetAF] == 0xFFFB
+
+    # A direct write to a configuration register re-arms the monitor as well
+    config_meter.write_register(reg.CfgRegAccEn, emulator.CFG_ACCESS_KEY)
+    config_meter.write_register(reg.PStartTh, 0x0123)
+    config_meter.write_register(reg.CfgRegAccEn, 0)
+    assert chip.words[reg.PStartTh] == 0x0123
+    assert config_meter.reset_monitor.poll() is False
+    assert chip.words[reg.PStartTh] == 0x0123
+
+
+def test_backoff_releases_the_bus_lock(chip):
+    lock = threading.RLock()
+    free_while_sleeping = []
+
+    def other_meter():
+        acquired = lock.acquire(timeout=1.0)
+        free_while_sleeping.append(acquired)
+        if acquired:
+            lock.release()
+
+    def sleep(delay):
+        # Another meter on the bus must be able to take the lock during the backoff
+        other = threading.Thread(target=other_meter)
+        other.start()
+        other.join()
+
+    faults = Faults(2)
+    link = ResilientSpiDev(lambda: FlakySpiDev(chip, faults), sleep=sleep, lock=lock)
+    link.open(0, 0)
+    link.xfer2(list(read_frame(reg.MMode0)))
+    assert free_while_sleeping == [True, True]
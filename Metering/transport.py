@@ -0,0 +1,398 @@
+import errno
+import logging
+import random
+import threading
+import time
+import weakref
+
+from descriptors import DESCRIPTORS, READ_CLEAR, READ_WRITE
+from instrumentation import RateLimitedLogger
+from registers import CfgRegAccEn, CRCDigest, EMMIntState0, EMMIntState1, EMMState0, EMMState1
+from spi_batch import read_batch
+
+# Error classes counted by ResilientSpiDev
+IO_ERROR = 'io'
+TIMEOUT = 'timeout'
+DEVICE_LOST = 'device_lost'
+OTHER = 'other'
+
+# Recovery events counted alongside the error classes
+RETRIES = 'retries'
+RECOVERED = 'recovered'
+REOPENS = 'reopens'
+REOPEN_FAILURES = 'reopen_failures'
+REJECTED = 'rejected'
+NOT_RETRIED = 'not_retried'
+CHIP_RESET = 'chip_reset'
+CHIP_NOT_READY = 'chip_not_ready'
+
+COUNTERS = (IO_ERROR, TIMEOUT, DEVICE_LOST, OTHER, RETRIES, RECOVERED, REOPENS, REOPEN_FAILURES, REJECTED,
+            NOT_RETRIED, CHIP_RESET, CHIP_NOT_READY)
+
+# errnos meaning the spidev handle itself is gone (unplugged, driver rebound, fd closed)
+_DEVICE_LOST_ERRNOS = frozenset([errno.ENODEV, errno.ENXIO, errno.EBADF, errno.ENOENT, errno.ESHUTDOWN])
+
+# Energy registers clear when read: a transfer that failed part way may already have cleared some
+_READ_CLEAR = frozenset(d.address for d in DESCRIPTORS.values() if d.access == READ_CLEAR)
+
+# Configuration registers, whose values CRCDigest reflects; status and lock registers excluded
+_CONFIG = frozenset(d.address for d in DESCRIPTORS.values()
+                    if d.access == READ_WRITE and d.address < 0x80) - {EMMIntState0, EMMIntState1, CfgRegAccEn}
+
+_log = RateLimitedLogger()
+
+
+def classify(exc):
+    """Return the error class of an exception raised by an SPI handle."""
+    if isinstance(exc, TimeoutError):
+        return TIMEOUT
+    if isinstance(exc, OSError):
+        return DEVICE_LOST if exc.errno in _DEVICE_LOST_ERRNOS else IO_ERROR
+    return OTHER
+
+
+def _retryable(data):
+    """A transfer may be repeated unless it reads a read-to-clear register."""
+    for i in range(0, len(data) - 1, 4):
+        if data[i] & 0x80 and (((data[i] & 0x7F) << 8) | data[i + 1]) in _READ_CLEAR:
+            return False
+    return True
+
+
+class TransportDown(OSError):
+    """The link failed its retries and is waiting out its recovery backoff."""
+
+
+class ResilientSpiDev:
+    """
+    spidev.SpiDev wrapper with bounded retries and handle recovery.
+
+    A failed transfer is retried up to `retries` times after a jittered
+    exponential backoff (backoff_s doubling up to max_backoff_s), so a
+    transient fault costs a few milliseconds at most and the sample is
+    still taken. After `reopen_after` consecutive failures, or at once
+    when the handle is gone, the spidev handle is closed and rebuilt with
+    the same bus, chip select, clock and mode.
+
+    When every retry fails the link is marked down: further calls raise
+    TransportDown immediately instead of blocking the bus, until a jittered
+    recovery delay (down_backoff_s doubling up to max_down_backoff_s) has
+    passed and the next call tries a reopen. Schedulers sharing the bus
+    therefore keep serving the other meters.
+
+    Each transfer and each reopen holds `lock` (the bus lock shared by the
+    meters on one SPI bus), but the backoff between attempts does not, so
+    a failing chip never stalls the other chip selects while it waits.
+
+    Transfers that read read-to-clear energy registers are never retried:
+    if one failed part way, the registers it already read are cleared and
+    a retry would silently drop that energy. The error is raised at once
+    and counted as not_retried, so the caller can account for the loss.
+
+    counters() reports failures per error class and the recovery events.
+    """
+
+    def __init__(self, spi_factory, retries=3, backoff_s=0.0002, max_backoff_s=0.002, reopen_after=2,
+                 down_backoff_s=0.005, max_down_backoff_s=2.0, clock=time.monotonic, sleep=time.sleep, seed=None,
+                 lock=None):
+        self.spi_factory = spi_factory
+        self.lock = lock if lock is not None else threading.RLock()
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.reopen_after = reopen_after
+        self.down_backoff_s = down_backoff_s
+        self.max_down_backoff_s = max_down_backoff_s
+        self.clock = clock
+        self.sleep = sleep
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._spi = None
+        self._bus = None
+        self._device = None
+        self._max_speed_hz = None
+        self._mode = None
+        self._failures = 0
+        self._down_until = None
+        self._down_delay = down_backoff_s
+        self.reopens = 0
+        self._batch_retryable = weakref.WeakKeyDictionary()
+
+    # spidev interface
+
+    def open(self, bus, device):
+        self._bus = bus
+        self._device = device
+        self._spi = self.spi_factory()
+        self._spi.open(bus, device)
+
+    def close(self):
+        if self._spi is not None:
+            self._spi.close()
+
+    @property
+    def max_speed_hz(self):
+        return self._spi.max_speed_hz
+
+    @max_speed_hz.setter
+    def max_speed_hz(self, value):
+        self._max_speed_hz = value
+        self._spi.max_speed_hz = value
+
+    @property
+    def mode(self):
+        return self._spi.mode
+
+    @mode.setter
+    def mode(self, value):
+        self._mode = value
+        self._spi.mode = value
+
+    @property
+    def handle(self):
+        """The spidev handle currently in use."""
+        return self._spi
+
+    def xfer2(self, data):
+        return self._call(lambda spi: spi.xfer2(data), _retryable(data))
+
+    def xfer(self, data):
+        return self._call(lambda spi: spi.xfer(data), _retryable(data))
+
+    def words(self, batch):
+        """Run a spi_batch.SpiBatch with the same retry policy and return its data words."""
+        retry = self._batch_retryable.get(batch)
+        if retry is None:
+            retry = self._batch_retryable[batch] = _retryable([b for frame in batch.frames for b in frame])
+        return self._call(batch.words, retry)
+
+    # Recovery
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def count(self, name):
+        """Count a link event detected outside the transport, e.g. a chip reset."""
+        self._count(name)
+
+    def counters(self):
+        """Return {error class or recovery event: count}."""
+        with self._lock:
+            return dict(self._counters)
+
+    @property
+    def down(self):
+        return self._down_until is not None
+
+    def reopen(self):
+        """Close and rebuild the spidev handle with the current settings."""
+        with self.lock:
+            try:
+                self._spi.close()
+            except Exception as e:
+                logging.debug("Closing failed SPI handle: %s", e)
+            spi = self.spi_factory()
+            spi.open(self._bus, self._device)
+            if self._max_speed_hz is not None:
+                spi.max_speed_hz = self._max_speed_hz
+            if self._mode is not None:
+                spi.mode = self._mode
+            self._spi = spi
+        self.reopens += 1
+        self._count(REOPENS)
+        logging.warning("Reopened SPI bus %s device %s", self._bus, self._device)
+
+    def _try_reopen(self):
+        try:
+            self.reopen()
+        except Exception as e:
+            self._count(REOPEN_FAILURES)
+            _log.error(('reopen', self._bus, self._device), "Reopening SPI bus %s device %s failed: %s",
+                       self._bus, self._device, e)
+            return False
+        return True
+
+    def _jitter(self, delay):
+        # Half fixed, half random, so meters on a shared bus do not retry in lockstep
+        return delay * (0.5 + 0.5 * self._random.random())
+
+    def _call(self, func, retry=True):
+        if self._down_until is not None:
+            if self.clock() < self._down_until:
+                self._count(REJECTED)
+                raise TransportDown(errno.EAGAIN, "SPI link down, waiting to recover")
+            if not self._try_reopen():
+                self._mark_down()
+                raise TransportDown(errno.EAGAIN, "SPI link down, reopen failed")
+
+        attempt = 0
+        while True:
+            try:
+                with self.lock:
+                    result = func(self._spi)
+            except Exception as e:
+                error_class = classify(e)
+                self._count(error_class)
+                self._failures += 1
+                if not retry:
+                    self._count(NOT_RETRIED)
+                    _log.error(('not_retried', error_class), "SPI %s error on a read-to-clear transfer, not "
+                               "retried: %s", error_class, e, error_class=error_class)
+                    if error_class == DEVICE_LOST:
+                        self._try_reopen()
+                    raise
+                if attempt >= self.retries:
+                    self._mark_down()
+                    raise
+                attempt += 1
+                self._count(RETRIES)
+                _log.warning(('retry', error_class), "SPI %s error, retry %d/%d: %s", error_class, attempt,
+                             self.retries, e, error_class=error_class)
+                if error_class == DEVICE_LOST or self._failures >= self.reopen_after:
+                    self._try_reopen()
+                self.sleep(self._jitter(min(self.backoff_s * (1 << (attempt - 1)), self.max_backoff_s)))
+                continue
+
+            if self._failures:
+                if self._down_until is not None:
+                    logging.warning("SPI link recovered after %d failed transfers", self._failures)
+                self._count(RECOVERED)
+                self._failures = 0
+                self._down_until = None
+                self._down_delay = self.down_backoff_s
+            return result
+
+    def _mark_down(self):
+        delay = self._jitter(self._down_delay)
+        self._down_until = self.clock() + delay
+        self._down_delay = min(self._down_delay * 2, self.max_down_backoff_s)
+        _log.error(('down', self._bus, self._device), "SPI bus %s device %s down after %d failed transfers, "
+                   "next attempt in %.0f ms", self._bus, self._device, self._failures, delay * 1000)
+
+
+class ResetMonitor:
+    """
+    Detect unexpected ATM90E3x resets and re-apply the configuration.
+
+    poll() is cheap unless a check is due: every `interval_s`, and at once
+    after the transport reopened its handle, one batch reads EMMState0/1
+    and CRCDigest. The chip has no reset flag, but a reset returns every
+    configuration register to its default and so changes CRCDigest; the
+    digest is compared with the one armed after the last configuration
+    write. EMMState words of 0xFFFF mean the bus is floating (chip still in
+    reset), so the check is repeated on the next poll.
+
+    On a reset, `configure()` (if set) rewrites the configuration on a
+    background thread, so the sampling thread that polled is not held up
+    by a full configuration session; checks pause until it has finished
+    and re-armed the digest. wait() blocks until then.
+
+    Intentional configuration changes must re-arm the monitor, or they
+    are taken for a reset and reverted: config_session.ConfigSession does
+    so itself, and the drivers call written() for single-register writes.
+    """
+
+    def __init__(self, meter, configure=None, interval_s=1.0, clock=time.monotonic):
+        self.meter = meter
+        self.configure = configure
+        self.interval_s = interval_s
+        self.clock = clock
+        self.expected = None
+        self.resets = 0
+        self.last_reset = None
+        self._next_check = 0.0
+        self._reopens = 0
+        self._batch = read_batch([EMMState0, EMMState1, CRCDigest])
+        self._recovery = None
+
+    def rearm(self):
+        """
+        Take the current digest as the baseline, right after an intentional
+        configuration change, so a reset that follows it is still caught.
+        """
+        self._next_check = 0.0
+        try:
+            state0, state1, digest = self.meter.transfer_batch(self._batch)
+        except RuntimeError as e:
+            logging.warning("Could not read CRCDigest to re-arm the reset monitor: %s", e)
+            self.expected = None
+            return
+        if state0 == 0xFFFF or state1 == 0xFFFF:
+            # Chip already back in reset: keep the old digest so the next poll flags it
+            return
+        self.expected = digest
+
+    def written(self, address):
+        """Re-arm after a direct register write if it changed the configuration digest."""
+        if address in _CONFIG:
+            self.rearm()
+
+    @property
+    def recovering(self):
+        return self._recovery is not None and self._recovery.is_alive()
+
+    def wait(self, timeout=None):
+        """Wait for a running recovery to finish; returns False on timeout."""
+        recovery = self._recovery
+        if recovery is not None:
+            recovery.join(timeout)
+        return not self.recovering
+
+    def _recover(self, expected):
+        try:
+            self.configure()
+        except Exception as e:
+            logging.error("Restoring the configuration after a reset failed: %s", e)
+            # Keep the pre-reset digest armed, so the next poll detects the reset again and retries
+            self.expected = expected
+        else:
+            self.rearm()
+
+    def _transport(self):
+        spi = self.meter.spi
+        return spi if isinstance(spi, ResilientSpiDev) else None
+
+    def poll(self):
+        """
+        Check for a reset if one is due.
+
+        Returns:
+            bool: True if a reset was detected.
+        """
+        if self.recovering:
+            return False
+        transport = self._transport()
+        now = self.clock()
+        if transport is not None and transport.reopens != self._reopens:
+            self._reopens = transport.reopens
+        elif now < self._next_check:
+            return False
+        self._next_check = now + self.interval_s
+
+        state0, state1, digest = self.meter.transfer_batch(self._batch)
+        if state0 == 0xFFFF or state1 == 0xFFFF:
+            if transport is not None:
+                transport.count(CHIP_NOT_READY)
+            self._next_check = now
+            return False
+        if self.expected is None:
+            self.expected = digest
+            return False
+        if digest == self.expected:
+            return False
+
+        self.resets += 1
+        self.last_reset = time.time()
+        if transport is not None:
+            transport.count(CHIP_RESET)
+        logging.warning("ATM90E3x reset detected (CRCDigest 0x%04X, expected 0x%04X, EMMState 0x%04X 0x%04X)",
+                        digest, self.expected, state0, state1)
+        if self.configure is None:
+            self.expected = digest
+        else:
+            self._recovery = threading.Thread(target=self._recover, args=(self.expected,), name="ResetRecovery",
+                                              daemon=True)
+            self._recovery.start()
+        return True